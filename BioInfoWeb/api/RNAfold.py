@@ -1,67 +1,199 @@
-import ViennaRNA as RNA
 from Bio import SeqIO
 import os
-import zipfile
+import re
 import json
+import shutil
+from api.fold_engine import fold_sequences, FOLD_MODES
+from api.fold_cache import get_fold_cache
+from api.result_bundle import ResultBundle
+
+# 局部折叠（滑动窗口）参数的默认值和范围
+DEFAULT_WINDOW = 200
+DEFAULT_SPAN = 150
+MIN_WINDOW = 20
+MAX_WINDOW = 10000
+
+
+# ========== RNAfold参数解析 ==========
+def _int_param(form, name, default):
+    value = form.get(name, '')
+    if value in ('', None):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} 必须是整数')
+    if not MIN_WINDOW <= value <= MAX_WINDOW:
+        raise ValueError(f'{name} 必须在 {MIN_WINDOW}-{MAX_WINDOW} 之间')
+    return value
+
+
+def parse_rnafold_params(form):
+    """解析上传表单中的折叠参数，参数不合法时抛出ValueError
+
+    fold_mode: mfe（全局MFE）| local（滑动窗口局部折叠）| auto（长序列自动使用局部折叠）
+    window:    窗口大小（nt），span: 最大碱基配对跨度（nt），仅局部折叠使用
+    ensemble:  1/true 时全局折叠的序列额外计算配分函数和配对概率矩阵
+    """
+    mode = form.get('fold_mode') or 'mfe'
+    if mode not in FOLD_MODES:
+        raise ValueError(f'fold_mode 必须是 {" / ".join(FOLD_MODES)} 之一')
+    window = _int_param(form, 'window', DEFAULT_WINDOW)
+    span = _int_param(form, 'span', min(DEFAULT_SPAN, window))
+    if span > window:
+        raise ValueError('span 不能大于 window')
+    ensemble = str(form.get('ensemble', '')).lower() in ('1', 'true', 'on', 'yes')
+    return {'fold_mode': mode, 'window': window, 'span': span, 'ensemble': ensemble}
+
+
+def _append_part(part_path, local_f):
+    """把工作进程写出的窗口结构追加到局部折叠结果文件，然后删除分段文件"""
+    with open(part_path, 'r') as part:
+        shutil.copyfileobj(part, local_f)
+    os.remove(part_path)
+
+
+def _bpp_filename(number, seq_id):
+    """配对概率文件名：序号 + 清理后的序列ID"""
+    safe_id = re.sub(r'[^A-Za-z0-9._-]', '_', seq_id)[:80]
+    return f'{number:06d}_{safe_id}.npz'
+
 
 # ========== RNAfold页面处理函数 ==========
 def process_rnafold_files(task_id, files, output_dir, tasks, zip_path):
     """RNAfold页面的文件处理逻辑"""
+    bundle = None
     try:
         task_info = tasks[task_id]
         task_info['status'] = 'processing'
         task_info['progress'] = 10
         task_info['message'] = '开始RNAfold分析...'
         
+        # 折叠结果缓存，命中/未命中数写入任务信息
+        cache = get_fold_cache()
+        cache_stats = {'cache_hits': 0, 'cache_misses': 0}
+        
         # 1. 创建RNAfold结果目录
         rnafold_results_dir = os.path.join(output_dir, 'rnafold_analysis')
         os.makedirs(rnafold_results_dir, exist_ok=True)
         
-        # 2. 处理FASTA文件
+        # 每个输入文件分析完成后，其结果文件立即加入压缩包
+        bundle = ResultBundle(zip_path, output_dir)
+        
+        # 折叠方式：全局MFE，或对长序列使用滑动窗口局部折叠（内存 O(N*W) 而不是 O(N^2)）
+        params = task_info.get('params') or {}
+        work_dir = os.path.join(output_dir, '.parts')
+        os.makedirs(work_dir, exist_ok=True)
+        fold_options = {
+            'mode': params.get('fold_mode', 'mfe'),
+            'window': params.get('window', DEFAULT_WINDOW),
+            'span': params.get('span', DEFAULT_SPAN),
+            'ensemble': params.get('ensemble', False),
+            'work_dir': work_dir
+        }
+        local_windows = 0
+        
+        # 2. 流式处理FASTA文件：边解析、边折叠、边写出，内存占用与文件大小无关
+        total_bytes = sum(os.path.getsize(f) for f in files) or 1
+        done_bytes = 0
+        sequences_done = 0
         for i, filepath in enumerate(files):
             filename = os.path.basename(filepath)
-            sequences = []
+            result_file = os.path.join(rnafold_results_dir, f'{filename}_analysis.ndjson')
+            viz_file = os.path.join(rnafold_results_dir, f'{filename}_viz.txt')
             
-            # 读取FASTA文件
-            for record in SeqIO.parse(filepath, "fasta"):
-                sequences.append((str(record.id),str(record.seq)))
+            local_file = os.path.join(rnafold_results_dir, f'{filename}_local.ndjson')
+            local_f = None
+            # 集合模式：每条序列的配对概率保存为一个 .npz
+            bpp_dir = os.path.join(rnafold_results_dir, f'{filename}_bpp')
+            file_sequences = 0
             
-            # 对每个序列运行RNAfold
-            analysis_results = []
-            for seq_id, sequence in sequences:
-                structure, energy = RNA.fold(sequence)
+            with open(filepath, 'r') as handle, \
+                 open(result_file, 'w') as result_f, \
+                 open(viz_file, 'w') as viz_f:
+                viz_f.write(f"RNAfold Analysis for {filename}\n")
+                viz_f.write("=" * 50 + "\n")
+                
+                # 读取FASTA文件（生成器，不保存全部序列）
+                records = ((str(record.id), str(record.seq)) for record in SeqIO.parse(handle, "fasta"))
                 
-                result = {
-                    'id': seq_id,
-                    'sequence': sequence,
-                    'structure': structure,
-                    'energy': energy,
-                    'length': len(sequence)
-                }
-                analysis_results.append(result)
+                # 在进程池中并行运行RNAfold，结果按输入顺序返回
+                for result in fold_sequences(records, cache=cache, stats=cache_stats, options=fold_options):
+                    file_sequences += 1
+                    if result['mode'] == 'ensemble':
+                        os.makedirs(bpp_dir, exist_ok=True)
+                        bpp_name = _bpp_filename(file_sequences, result['id'])
+                        os.replace(result.pop('bpp_path'), os.path.join(bpp_dir, bpp_name))
+                        result['bpp_file'] = f'{filename}_bpp/{bpp_name}'
+                        
+                        result_f.write(json.dumps(result) + "\n")
+                        
+                        viz_f.write(f"\nSequence: {result['id']}\n")
+                        viz_f.write(f"Length: {result['length']}\n")
+                        viz_f.write(f"Energy: {result['energy']} kcal/mol\n")
+                        viz_f.write(f"Structure: {result['structure']}\n")
+                        viz_f.write(f"Ensemble energy: {result['ensemble_energy']} kcal/mol\n")
+                        viz_f.write(f"MFE frequency: {result['mfe_frequency']}\n")
+                        viz_f.write(f"Ensemble diversity: {result['ensemble_diversity']}\n")
+                        viz_f.write(f"Centroid: {result['centroid_structure']} (d={result['centroid_distance']})\n")
+                        viz_f.write(f"MEA: {result['mea_structure']} (MEA={result['mea']})\n")
+                        viz_f.write(f"Base pair probabilities: {result['bpp_file']} ({result['bpp_pairs']} pairs)\n")
+                        viz_f.write(f"Sequence: {result['sequence']}\n")
+                        viz_f.write("-" * 30 + "\n")
+                    elif result['mode'] == 'local':
+                        # 局部折叠：每个窗口结构一行，写入 {filename}_local.ndjson
+                        if local_f is None:
+                            local_f = open(local_file, 'w')
+                        _append_part(result.pop('part_path'), local_f)
+                        local_windows += result['windows']
+                        
+                        # 每条结果一行JSON（NDJSON），局部折叠只记录汇总
+                        result_f.write(json.dumps(result) + "\n")
+                        
+                        viz_f.write(f"\nSequence: {result['id']}\n")
+                        viz_f.write(f"Length: {result['length']}\n")
+                        viz_f.write(f"Mode: local (window={result['window']}, span={result['span']})\n")
+                        viz_f.write(f"Energy: {result['energy']} kcal/mol\n")
+                        viz_f.write(f"Local structures: {result['windows']} (see {filename}_local.ndjson)\n")
+                        viz_f.write("-" * 30 + "\n")
+                    else:
+                        # 每条结果一行JSON（NDJSON）
+                        result_f.write(json.dumps(result) + "\n")
+                        
+                        viz_f.write(f"\nSequence: {result['id']}\n")
+                        viz_f.write(f"Length: {result['length']}\n")
+                        viz_f.write(f"Energy: {result['energy']} kcal/mol\n")
+                        viz_f.write(f"Structure: {result['structure']}\n")
+                        viz_f.write(f"Sequence: {result['sequence']}\n")
+                        viz_f.write("-" * 30 + "\n")
+                    
+                    # 按已读取的字节数更新进度
+                    sequences_done += 1
+                    read_bytes = done_bytes + handle.buffer.tell()
+                    task_info['progress'] = 10 + int(min(read_bytes / total_bytes, 1) * 80)
+                    task_info['sequences_done'] = sequences_done
+                    task_info['message'] = f'正在分析第 {i+1}/{len(files)} 个文件，已完成 {sequences_done} 条序列'
             
-            # 保存分析结果
-            result_file = os.path.join(rnafold_results_dir, f'{filename}_analysis.json')
-            with open(result_file, 'w') as f:
-                json.dump(analysis_results, f, indent=2)
+            if local_f is not None:
+                local_f.close()
             
-            # 生成可视化文件（示例）
-            viz_file = os.path.join(rnafold_results_dir, f'{filename}_viz.txt')
-            with open(viz_file, 'w') as f:
-                f.write(f"RNAfold Analysis for {filename}\n")
-                f.write("=" * 50 + "\n")
-                for result in analysis_results:
-                    f.write(f"\nSequence: {result['id']}\n")
-                    f.write(f"Length: {result['length']}\n")
-                    f.write(f"Energy: {result['energy']} kcal/mol\n")
-                    f.write(f"Structure: {result['structure']}\n")
-                    f.write(f"Sequence: {result['sequence']}\n")
-                    f.write("-" * 30 + "\n")
+            bundle.add(result_file)
+            bundle.add(viz_file)
+            if local_f is not None:
+                bundle.add(local_file)
+            if os.path.isdir(bpp_dir):
+                bundle.add_tree(bpp_dir)
+            done_bytes += os.path.getsize(filepath)
             
             # 更新进度
-            progress = 10 + int((i + 1) / len(files) * 80)
+            progress = 10 + int(done_bytes / total_bytes * 80)
             task_info['progress'] = progress
             task_info['message'] = f'已分析 {i+1}/{len(files)} 个文件'
+            task_info['cache_hits'] = cache_stats['cache_hits']
+            task_info['cache_misses'] = cache_stats['cache_misses']
+            task_info['local_windows'] = local_windows
+        
+        shutil.rmtree(work_dir, ignore_errors=True)
         
         # 3. 生成汇总报告
         summary_file = os.path.join(output_dir, 'rnafold_summary.txt')
@@ -70,21 +202,18 @@ def process_rnafold_files(task_id, files, output_dir, tasks, zip_path):
         task_info['progress'] = 95
         task_info['message'] = '正在生成最终报告...'
         
-        # 4. 创建压缩包
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(output_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, output_dir)
-                    zipf.write(file_path, arcname)
+        # 4. 完成压缩包（结果文件已在生成时加入）
+        output_path = bundle.close()
         
         task_info['progress'] = 100
         task_info['status'] = 'completed'
         task_info['download_url'] = f'/download/{task_id}?page_type=rnafold'
-        task_info['output_path'] = zip_path
+        task_info['output_path'] = output_path
         task_info['message'] = 'RNAfold分析完成！'
         
     except Exception as e:
+        if bundle is not None:
+            bundle.abort()
         task_info['status'] = 'error'
         task_info['message'] = f'RNAfold分析失败: {str(e)}'
         import traceback
@@ -1,15 +1,116 @@
 import os
-import zipfile
-import subprocess
+import json
+import shlex
+import shutil
 import threading
-import time
 from datetime import datetime
+from api.result_bundle import ResultBundle, SKIP_EXTENSIONS, SKIP_DIRS
+from api.alphafold_progress import AlphaFoldProgress, watch_output_dir, JOB_DONE_MARKER
+from api.msa_cache import get_msa_cache
+from api.alphafold_batch import get_batcher
+from api.process_supervisor import get_supervisor, ProcessTimeout
+
+# 结果压缩包中排除的中间文件（docker日志单独提供，不打包）
+ALPHAFOLD_SKIP_EXTENSIONS = SKIP_EXTENSIONS + ('.log',)
+
+# 输入文件复制到 <ALPHAFOLD_INPUT_ROOT>/Remote/<task_id>/，该目录挂载到容器中
+ALPHAFOLD_INPUT_ROOT = os.getenv('ALPHAFOLD_INPUT_ROOT', '$HOME/AF/input')
+
+# AlphaFold运行命令模板，占位符：{task_id}（批量运行时为批次ID） {input_root} {input_dir} {output_dir} {extra_args}
+# 模板按shell规则拆分成参数后直接执行（不经过shell，不分配TTY），$HOME 等环境变量在拆分后展开；
+# {extra_args} 须单独作为一个参数，替换为零个或多个参数。
+# 设置 ALPHAFOLD_COMMAND 可以换成其他运行方式，例如用 test/alphafold_stub.py 代替容器：
+#   ALPHAFOLD_COMMAND='python test/alphafold_stub.py --input_dir={input_dir} --output_dir={output_dir} {extra_args}'
+DEFAULT_ALPHAFOLD_COMMAND = """docker run \
+            --volume {input_root}:/root/af_input \
+            --volume {output_dir}:/root/af_output \
+            --volume $HOME/AF/models:/root/models \
+            --volume $HOME/AF/db:/root/public_databases \
+            -e CUDA_VISIBLE_DEVICES=1 \
+            --gpus all \
+            alphafold3 \
+            python run_alphafold.py \
+            --input_dir="/root/af_input/Remote/{task_id}" \
+            --model_dir=/root/models \
+            --output_dir="/root/af_output" \
+            --gpu_device=0 \
+            {extra_args}"""
+ALPHAFOLD_COMMAND = os.getenv('ALPHAFOLD_COMMAND', DEFAULT_ALPHAFOLD_COMMAND)
+# 单次运行的时限（秒），超过后终止容器，任务标记为失败；0 表示不限制
+ALPHAFOLD_TIMEOUT = float(os.getenv('ALPHAFOLD_TIMEOUT', 0)) or None
+
+
+def load_alphafold_input(filepath, msa_cache):
+    """读取输入JSON，需要搜索的链填入缓存的MSA/模板
+
+    返回 (输入内容, 命中的链数, 仍需搜索的链数)；无法解析的文件返回None，按需要搜索处理。
+    """
+    try:
+        with open(filepath) as f:
+            fold_input = json.load(f)
+    except (ValueError, UnicodeDecodeError):
+        return None, 0, 1
+    if not isinstance(fold_input, dict):
+        # AlphaFold Server 格式（作业列表）不注入
+        return fold_input, 0, 1
+    if msa_cache is None:
+        return fold_input, 0, 1
+    hits, misses = msa_cache.inject(fold_input)
+    return fold_input, hits, misses
+
+
+def write_alphafold_input(filepath, fold_input, injected, input_dir):
+    """把输入写入运行目录，没有注入缓存内容的文件直接复制"""
+    dest = os.path.join(input_dir, os.path.basename(filepath))
+    if injected:
+        with open(dest, 'w') as f:
+            json.dump(fold_input, f)
+    else:
+        shutil.copyfile(filepath, dest)
+
+
+def build_alphafold_argv(run_id, input_dir, output_dir, extra_args):
+    """按 ALPHAFOLD_COMMAND 模板生成参数列表"""
+    fields = {
+        'task_id': run_id,
+        'input_root': os.path.expandvars(ALPHAFOLD_INPUT_ROOT),
+        'input_dir': input_dir,
+        'output_dir': output_dir
+    }
+    argv = []
+    for token in shlex.split(ALPHAFOLD_COMMAND):
+        if token == '{extra_args}':
+            argv.extend(extra_args)
+        else:
+            # 先展开环境变量再填入路径，路径中的 $ 不会被展开
+            argv.append(os.path.expandvars(token).format(**fields))
+    return argv
+
+
+def run_alphafold_command(run_id, input_dir, output_dir, extra_args, on_line):
+    """运行一次AlphaFold，逐行把输出交给 on_line，返回 (返回码, 运行命令)
+
+    进程由进程管理器启动和读取输出，当前线程只等待结束；超过 ALPHAFOLD_TIMEOUT 时抛出 ProcessTimeout。
+    """
+    argv = build_alphafold_argv(run_id, input_dir, output_dir, extra_args)
+    command = shlex.join(argv)
+    on_line(f"Docker Command:\n{command}\n" + "-" * 80 + "\n\n")
+    handle = get_supervisor().start(argv, [on_line], name=f'alphafold-{run_id}', timeout=ALPHAFOLD_TIMEOUT)
+    return handle.wait(), command
+
+
+def get_alphafold_batcher(family_folder, output_dir):
+    """批处理器：批次的输出目录放在各任务结果目录旁的 .batches 中"""
+    batch_root = os.path.join(family_folder, os.path.dirname(os.path.normpath(output_dir)), '.batches')
+    return get_batcher(os.path.expandvars(ALPHAFOLD_INPUT_ROOT), batch_root, run_alphafold_command)
 
 # ========== alphafold页面处理函数 ==========
 def process_alphafold_files(task_id, files, output_dir, tasks, zip_path):
     """alphafold页面的文件处理逻辑"""
     current_file_path = __file__ # Complete path for docker
     family_folder = current_file_path.split(sep='/api/')[0]
+    bundle = None
+    stop_watching = threading.Event()
     try:
         task_info = tasks[task_id]
         task_info['status'] = 'processing'
@@ -24,22 +125,44 @@ def process_alphafold_files(task_id, files, output_dir, tasks, zip_path):
         alphafold_results_dir = os.path.join(family_folder, output_dir, 'alphafold_analysis') # full path
         os.makedirs(alphafold_results_dir, exist_ok=True)
         
-        # 2. 创建输入目录并复制所有JSON文件
-        remote_input_dir = f"$HOME/AF/input/Remote/{task_id}/"
-        subprocess.run(f'mkdir -p {remote_input_dir}', shell=True, check=True)
-        
-        task_info['message'] = f'正在复制 {len(files)} 个输入文件...'
+        # 2. 读取输入JSON（已搜索过的链带上缓存的MSA/模板）
+        task_info['message'] = f'正在准备 {len(files)} 个输入文件...'
         
+        msa_cache = get_msa_cache()
+        msa_hits, msa_misses = 0, 0
+        inputs = []
         for filepath in files:
-            subprocess.run(f'cp "{filepath}" "{remote_input_dir}"', shell=True, check=True)
+            fold_input, hits, misses = load_alphafold_input(filepath, msa_cache)
+            inputs.append((filepath, fold_input, hits > 0))
+            msa_hits += hits
+            msa_misses += misses
+        task_info['msa_cache_hits'] = msa_hits
+        task_info['msa_cache_misses'] = msa_misses
+        needs_search = not (msa_hits and not msa_misses)
         
-        # 3. 启动进度监控线程
-        monitor_thread = threading.Thread(
-            target=monitor_alphafold_progress,
-            args=(task_id, remote_input_dir, alphafold_results_dir, tasks, len(files))
+        # AlphaFold3格式且有作业名的输入才能和其他任务合并运行（按作业名拆分输出）
+        batcher = get_alphafold_batcher(family_folder, output_dir)
+        batched = batcher is not None and all(
+            isinstance(fold_input, dict) and fold_input.get('name') for _, fold_input, _ in inputs
         )
-        monitor_thread.daemon = True
-        monitor_thread.start()
+        
+        # 3. 启动进度跟踪：日志阶段 + 结果目录中完成的作业
+        progress = AlphaFoldProgress(task_info, len(files), os.path.join(output_dir, 'progress.log'))
+        # 每个作业完成后立即把它的结果加入压缩包
+        bundle = ResultBundle(zip_path, output_dir)
+        
+        def on_job_done(job_dir):
+            if progress.job_finished(job_dir):
+                try:
+                    bundle.add_tree(job_dir, skip_extensions=ALPHAFOLD_SKIP_EXTENSIONS, skip_dirs=SKIP_DIRS)
+                except Exception as e:
+                    # 打包失败不影响主流程，最后创建压缩包时会补上
+                    print(f"添加结果到压缩包失败: {e}")
+                if msa_cache is not None:
+                    try:
+                        msa_cache.store_job(job_dir)
+                    except Exception as e:
+                        print(f"写入MSA缓存失败: {e}")
         
         # 4. 创建日志文件路径
         summary_file = os.path.join(output_dir, 'alphafold_summary.txt')
@@ -48,25 +171,9 @@ def process_alphafold_files(task_id, files, output_dir, tasks, zip_path):
         # 5. 运行alphafold3
         task_info['message'] = '正在启动AlphaFold3 Docker容器...'
         
-        # 构建docker命令
-        docker_cmd = f"""docker run -it \
-            --volume $HOME/AF/input:/root/af_input \
-            --volume {alphafold_results_dir}:/root/af_output \
-            --volume $HOME/AF/models:/root/models \
-            --volume $HOME/AF/db:/root/public_databases \
-            -e CUDA_VISIBLE_DEVICES=1 \
-            --gpus all \
-            alphafold3 \
-            python run_alphafold.py \
-            --input_dir="/root/af_input/Remote/{task_id}" \
-            --model_dir=/root/models \
-            --output_dir="/root/af_output" \
-            --gpu_device=0"""
-        
         # 执行命令，捕获输出
         try:
             task_info['message'] = 'AlphaFold3正在运行中...'
-            task_info['docker_command'] = docker_cmd
             task_info['start_time'] = datetime.now().isoformat()
             
             with open(log_file, 'w') as log_f:
@@ -74,26 +181,50 @@ def process_alphafold_files(task_id, files, output_dir, tasks, zip_path):
                 log_f.write(f"Task ID: {task_id}\n")
                 log_f.write(f"Start Time: {datetime.now()}\n")
                 log_f.write(f"Input Files: {len(files)}\n")
-                log_f.write(f"Docker Command:\n{docker_cmd}\n")
-                log_f.write("-" * 80 + "\n\n")
-                
-                # 执行docker命令
-                process = subprocess.Popen(
-                    docker_cmd,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True
-                )
                 
-                # 实时写入日志
-                for line in process.stdout:
+                # 实时写入日志，同时解析阶段标记更新进度
+                def on_line(line):
                     log_f.write(line)
                     log_f.flush()
-                    # 可以在这里添加实时进度解析逻辑
+                    progress.feed_line(line)
                 
-                process.wait()
-                return_code = process.returncode
+                if batched:
+                    # 等待与其他任务合并运行，作业输出移入结果目录后调用 on_job_done
+                    task_info['message'] = 'AlphaFold3排队合并运行中...'
+                    return_code, docker_cmd = batcher.run(
+                        task_id,
+                        [fold_input for _, fold_input, _ in inputs],
+                        alphafold_results_dir,
+                        needs_search,
+                        on_line,
+                        on_job_done
+                    )
+                else:
+                    input_dir = os.path.join(os.path.expandvars(ALPHAFOLD_INPUT_ROOT), 'Remote', task_id)
+                    os.makedirs(input_dir, exist_ok=True)
+                    try:
+                        for filepath, fold_input, injected in inputs:
+                            write_alphafold_input(filepath, fold_input, injected, input_dir)
+                        
+                        watch_output_dir(alphafold_results_dir, on_job_done, stop_watching)
+                        return_code, docker_cmd = run_alphafold_command(
+                            task_id,
+                            input_dir,
+                            alphafold_results_dir,
+                            # 所有链都有MSA/模板时跳过数据管道
+                            [] if needs_search else ['--norun_data_pipeline'],
+                            on_line
+                        )
+                    finally:
+                        # 运行目录中的输入（含注入的MSA）只供这次运行使用，原始输入仍在上传目录中
+                        shutil.rmtree(input_dir, ignore_errors=True)
+                    # 容器已退出，停止监视结果目录，并补上监视线程还没来得及处理的作业
+                    stop_watching.set()
+                    with os.scandir(alphafold_results_dir) as entries:
+                        for entry in entries:
+                            if entry.is_dir() and os.path.exists(os.path.join(entry.path, JOB_DONE_MARKER)):
+                                on_job_done(entry.path)
+            task_info['docker_command'] = docker_cmd
             
             # 写入结束信息
             with open(log_file, 'a') as log_f:
@@ -102,10 +233,12 @@ def process_alphafold_files(task_id, files, output_dir, tasks, zip_path):
                 log_f.write(f"Return Code: {return_code}\n")
                 log_f.write(f"Execution Complete\n")
         
-        except subprocess.CalledProcessError as e:
+        except ProcessTimeout as e:
             task_info['status'] = 'error'
-            task_info['message'] = f'AlphaFold3执行失败: {e.stderr}'
+            task_info['message'] = f'AlphaFold3执行超时: {str(e)}'
             task_info['error_details'] = str(e)
+            if bundle is not None:
+                bundle.abort()
             return
         
         # 6. 检查输出文件
@@ -125,61 +258,25 @@ def process_alphafold_files(task_id, files, output_dir, tasks, zip_path):
         task_info['progress'] = 95
         task_info['message'] = '正在创建结果压缩包...'
         
-        # 8. 创建压缩包
-        create_result_zip(output_dir, zip_path)
+        # 8. 创建压缩包（已完成作业的结果已经在运行过程中加入）
+        output_path = create_result_zip(output_dir, zip_path, bundle=bundle)
         
         task_info['progress'] = 100
         task_info['status'] = 'completed'
         task_info['download_url'] = f'/download/{task_id}?page_type=alphafold'
-        task_info['output_path'] = zip_path
+        task_info['output_path'] = output_path
         task_info['message'] = f'AlphaFold3分析完成！生成 {len(output_files)} 个结果文件'
         task_info['end_time'] = datetime.now().isoformat()
         
     except Exception as e:
+        if bundle is not None:
+            bundle.abort()
         task_info['status'] = 'error'
         task_info['message'] = f'AlphaFold3分析失败: {str(e)}'
         import traceback
         task_info['error_details'] = traceback.format_exc()
-
-
-def monitor_alphafold_progress(task_id, input_dir, output_dir, tasks, total_input_files):
-    """监控AlphaFold处理进度（每10分钟检查一次）"""
-    while True:
-        time.sleep(600)  # 每10分钟检查一次
-        
-        task_info = tasks.get(task_id)
-        if not task_info or task_info['status'] in ['completed', 'error']:
-            break
-        
-        try:
-            # 检查输出目录
-            output_count = 0
-            if os.path.exists(output_dir):
-                # 统计PDB和其他结果文件
-                for root, dirs, files in os.walk(output_dir):
-                    for file in files:
-                        if file.endswith(('.pdb', '.json', '.cif', '.pkl', '.pdb.gz')):
-                            output_count += 1
-            
-            # 计算进度（输出文件数 / 输入文件数 * 80% + 10%基础进度）
-            if total_input_files > 0:
-                progress = min(90, 10 + int((output_count / total_input_files) * 80))
-            else:
-                progress = task_info.get('progress', 10)
-            
-            # 更新任务信息
-            task_info['progress'] = progress
-            task_info['message'] = f'AlphaFold3处理中... 已生成 {output_count}/{total_input_files} 个结果文件'
-            task_info['current_output_count'] = output_count
-            
-            # 写入进度日志
-            progress_log = os.path.join(os.path.dirname(output_dir), 'progress.log')
-            with open(progress_log, 'a') as f:
-                f.write(f"{datetime.now().isoformat()} - 进度: {progress}%, 输出文件: {output_count}\n")
-                
-        except Exception as e:
-            # 监控错误不影响主流程
-            pass
+    finally:
+        stop_watching.set()
 
 
 def generate_summary_report(task_id, output_dir, input_count, output_count, log_file):
@@ -224,50 +321,23 @@ def generate_summary_report(task_id, output_dir, input_count, output_count, log_
         f.write(log_tail)
 
 
-def create_result_zip(output_dir, zip_path):
-    """创建结果压缩包，排除中间文件"""
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        # 添加所有文件到压缩包，但跳过临时文件
-        skip_extensions = {'.tmp', '.log', '.lock', '.swp'}
-        skip_dirs = {'tmp', 'temp', '__pycache__'}
-        
-        for root, dirs, files in os.walk(output_dir):
-            # 跳过特定目录
-            dirs[:] = [d for d in dirs if d not in skip_dirs]
-            
-            for file in files:
-                # 跳过特定扩展名
-                if any(file.endswith(ext) for ext in skip_extensions):
-                    continue
-                
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, output_dir)
-                zipf.write(file_path, arcname)
+def create_result_zip(output_dir, zip_path, bundle=None):
+    """创建结果压缩包，排除中间文件
+
+    .pkl/.gz 等已压缩的大文件直接存储，不再重新压缩；已经加入 bundle 的文件不会重复写入。
+    """
+    bundle = bundle or ResultBundle(zip_path, output_dir)
+    try:
+        bundle.add_tree(output_dir, skip_extensions=ALPHAFOLD_SKIP_EXTENSIONS, skip_dirs=SKIP_DIRS)
+    except Exception:
+        bundle.abort()
+        raise
+    return bundle.close()
 
 
 def get_alphafold_status(task_id, tasks):
-    """获取AlphaFold任务状态（供状态查询API调用）"""
-    task_info = tasks.get(task_id)
-    if not task_info:
-        return None
-    
-    # 如果任务正在处理，检查最新输出文件数
-    if task_info['status'] == 'processing':
-        output_dir = task_info.get('output_path', '').replace('.zip', '')
-        if output_dir and os.path.exists(output_dir):
-            alphafold_dir = os.path.join(output_dir, 'alphafold_analysis')
-            if os.path.exists(alphafold_dir):
-                output_count = 0
-                for root, dirs, files in os.walk(alphafold_dir):
-                    for file in files:
-                        if file.endswith(('.pdb', '.json', '.cif', '.pkl')):
-                            output_count += 1
-                
-                input_count = task_info.get('file_count', 1)
-                if input_count > 0:
-                    progress = min(90, 10 + int((output_count / input_count) * 80))
-                    task_info['progress'] = progress
-                    task_info['current_output_count'] = output_count
-                    task_info['message'] = f'AlphaFold3处理中... 已生成 {output_count}/{input_count} 个结果文件'
-    
-    return task_info
\ No newline at end of file
+    """获取AlphaFold任务状态（供状态查询API调用）
+
+    进度由日志阶段和结果目录事件实时更新，这里不再遍历结果目录。
+    """
+    return tasks.get(task_id)
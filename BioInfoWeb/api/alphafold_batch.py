@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import string
+import threading
+
+from api.alphafold_progress import JOB_START_PATTERN, JOB_DONE_PATTERN
+
+# ========== AlphaFold批量运行 ==========
+# 每次启动容器都要加载模型、编译JAX，小作业的大部分时间花在这里。
+# 批量模式下各任务的工作线程把输入交给批处理器后等待；没有容器在运行时，
+# 其中一个等待的线程收集一批任务（等待 ALPHAFOLD_BATCH_WINDOW 秒让更多任务加入），
+# 把它们的输入写入同一个 --input_dir 运行一次，结束后把各作业的输出移回所属任务。
+# 作业名加上任务前缀避免重名，移回时再去掉；日志按 "Processing fold input" 分给各任务。
+# 默认关闭（ALPHAFOLD_BATCH=1 开启）：开启后任务最多多等 ALPHAFOLD_BATCH_WINDOW 秒，
+# 各任务的结果在整批运行结束后才移回，alphafold 页面的默认并发数也随之提高到 ALPHAFOLD_BATCH_MAX_TASKS。
+ALPHAFOLD_BATCH_ENABLED = os.getenv('ALPHAFOLD_BATCH', '0') == '1'
+ALPHAFOLD_BATCH_WINDOW = float(os.getenv('ALPHAFOLD_BATCH_WINDOW', 10))
+ALPHAFOLD_BATCH_MAX_JOBS = int(os.getenv('ALPHAFOLD_BATCH_MAX_JOBS', 32))
+ALPHAFOLD_BATCH_MAX_TASKS = int(os.getenv('ALPHAFOLD_BATCH_MAX_TASKS', 8))
+
+# 与 run_alphafold.py 默认的 --buckets 一致：输入按token数补齐到这些长度，同一长度只编译一次
+TOKEN_BUCKETS = tuple(int(b) for b in os.getenv(
+    'ALPHAFOLD_BUCKETS', '256,512,768,1024,1280,1536,2048,2560,3072,3584,4096,4608,5120'
+).split(','))
+
+# 配体按CCD代码估计token数（每个重原子一个token，常见配体约30个）
+LIGAND_TOKENS = 30
+
+
+def sanitised_name(name):
+    """与AlphaFold3相同的作业名处理，输出目录和文件以此命名"""
+    allowed = set(string.ascii_lowercase + string.digits + '_-.')
+    return ''.join(c for c in name.lower().replace(' ', '_') if c in allowed)
+
+
+def estimate_tokens(fold_input):
+    """估计作业的token数：聚合物每个残基一个token，配体按原子数估计"""
+    tokens = 0
+    for entry in fold_input.get('sequences', []):
+        for kind, chain in entry.items():
+            if not isinstance(chain, dict):
+                continue
+            ids = chain.get('id')
+            copies = len(ids) if isinstance(ids, list) else chain.get('count', 1)
+            if chain.get('sequence'):
+                tokens += len(chain['sequence']) * copies
+            elif chain.get('smiles'):
+                # SMILES长度大致等于原子数
+                tokens += len(chain['smiles']) * copies
+            else:
+                codes = chain.get('ccdCodes') or [chain.get('ligand') or chain.get('ion')]
+                tokens += LIGAND_TOKENS * len(codes) * copies
+    return tokens
+
+
+def token_bucket(tokens):
+    """作业补齐后的长度，超过最大桶时按实际长度"""
+    for bucket in TOKEN_BUCKETS:
+        if tokens <= bucket:
+            return bucket
+    return tokens
+
+
+class BatchJob:
+    """批量运行中的一个作业（一个输入JSON）"""
+
+    def __init__(self, fold_input, prefix):
+        self.fold_input = fold_input
+        self.name = fold_input['name']
+        self.output_name = sanitised_name(self.name)
+        self.batch_name = prefix + self.name
+        self.batch_output_name = prefix + self.output_name
+        self.bucket = token_bucket(estimate_tokens(fold_input))
+
+
+class _BatchTask:
+    """一个任务提交的全部作业，这些作业总是在同一次运行中"""
+
+    def __init__(self, task_id, fold_inputs, results_dir, needs_search, on_line, on_job_done):
+        self.task_id = task_id
+        # 前缀只含小写字母和数字，处理作业名时不会被改变
+        task_key = task_id.replace('-', '').lower()[:12]
+        self.jobs = [BatchJob(fold_input, f'{task_key}{index:03d}_') for index, fold_input in enumerate(fold_inputs)]
+        self.results_dir = results_dir
+        self.needs_search = needs_search
+        self.on_line = on_line
+        self.on_job_done = on_job_done
+        self.bucket = max(job.bucket for job in self.jobs)
+        self.submitted = time.time()
+        self.done = False
+        self.return_code = None
+        self.command = None
+        self.error = None
+
+
+class AlphaFoldBatcher:
+    """把多个任务的AlphaFold输入合并到一次容器运行中
+
+    runner(run_id, input_dir, output_dir, extra_args（参数列表）, on_line) 运行一次AlphaFold，
+    返回 (返回码, 运行命令)；同一时间只有一次运行。
+    """
+
+    def __init__(self, input_root, batch_root, runner, window=ALPHAFOLD_BATCH_WINDOW,
+                 max_jobs=ALPHAFOLD_BATCH_MAX_JOBS, max_tasks=ALPHAFOLD_BATCH_MAX_TASKS):
+        self.input_root = input_root
+        self.batch_root = batch_root
+        self.runner = runner
+        self.window = window
+        self.max_jobs = max(1, max_jobs)
+        self.max_tasks = max(1, max_tasks)
+        self.pending = []
+        self.running = False
+        self.cond = threading.Condition()
+
+    def run(self, task_id, fold_inputs, results_dir, needs_search, on_line, on_job_done):
+        """提交一个任务的作业并等待所在批次运行结束，返回 (返回码, 运行命令)
+
+        on_line(行) 接收属于该任务的日志（作业名已还原），
+        on_job_done(作业目录) 在作业输出移入 results_dir 后调用。
+        """
+        entry = _BatchTask(task_id, fold_inputs, results_dir, needs_search, on_line, on_job_done)
+        with self.cond:
+            self.pending.append(entry)
+            self.cond.notify_all()
+
+        while True:
+            with self.cond:
+                while not entry.done and (self.running or not self.pending):
+                    self.cond.wait()
+                if entry.done:
+                    break
+                # 没有正在进行的运行：由当前线程收集一批
+                self.running = True
+                deadline = self.pending[0].submitted + self.window
+                while not self._full():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = self._take_batch()
+
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                for item in batch:
+                    item.error = str(e)
+            finally:
+                with self.cond:
+                    self.running = False
+                    for item in batch:
+                        item.done = True
+                    self.cond.notify_all()
+
+        if entry.error is not None:
+            raise RuntimeError(f'批量运行失败: {entry.error}')
+        return entry.return_code, entry.command
+
+    def _full(self):
+        return (len(self.pending) >= self.max_tasks
+                or sum(len(item.jobs) for item in self.pending) >= self.max_jobs)
+
+    def _take_batch(self):
+        """从等待队列取出一批：最早的任务和与它同一长度桶的任务优先，其余按提交顺序"""
+        first_bucket = self.pending[0].bucket
+        ordered = sorted(self.pending, key=lambda item: (item.bucket != first_bucket, item.submitted))
+        batch, job_count = [], 0
+        for item in ordered:
+            if batch and (len(batch) >= self.max_tasks or job_count + len(item.jobs) > self.max_jobs):
+                continue
+            batch.append(item)
+            job_count += len(item.jobs)
+        for item in batch:
+            self.pending.remove(item)
+        return batch
+
+    def _run_batch(self, batch):
+        run_id = f'batch-{uuid.uuid4().hex[:12]}'
+        input_dir = os.path.join(self.input_root, 'Remote', run_id)
+        output_dir = os.path.join(self.batch_root, run_id)
+        os.makedirs(input_dir, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+
+        jobs = [(item, job) for item in batch for job in item.jobs]
+        # 文件名以长度桶开头，相同形状的作业连续运行
+        for item, job in sorted(jobs, key=lambda pair: pair[1].bucket):
+            fold_input = dict(job.fold_input, name=job.batch_name)
+            with open(os.path.join(input_dir, f'{job.bucket:05d}_{job.batch_output_name}.json'), 'w') as f:
+                json.dump(fold_input, f)
+
+        # 所有链都已有MSA/模板时跳过数据管道
+        extra_args = [] if any(item.needs_search for item in batch) else ['--norun_data_pipeline']
+        header = f'Batch {run_id}: {len(jobs)} jobs from {len(batch)} tasks\n'
+        for item in batch:
+            item.on_line(header)
+
+        try:
+            return_code, command = self.runner(run_id, input_dir, output_dir, extra_args, self._router(jobs, batch))
+            for item in batch:
+                item.return_code = return_code
+                item.command = command
+            self._split_outputs(jobs, output_dir)
+        finally:
+            shutil.rmtree(input_dir, ignore_errors=True)
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def _router(self, jobs, batch):
+        """按当前作业把日志分给所属任务，作业之外的日志发给整批任务"""
+        owners = {}
+        for item, job in jobs:
+            owners[job.batch_name] = (item, job)
+            owners[job.batch_output_name] = (item, job)
+        current = [None]
+
+        def on_line(line):
+            match = JOB_START_PATTERN.search(line.rstrip())
+            if match:
+                current[0] = owners.get(match.group('name'))
+            owner = current[0]
+            if owner is None:
+                for item in batch:
+                    item.on_line(line)
+                return
+            item, job = owner
+            item.on_line(line.replace(job.batch_name, job.name).replace(job.batch_output_name, job.output_name))
+            if JOB_DONE_PATTERN.search(line):
+                current[0] = None
+
+        return on_line
+
+    def _split_outputs(self, jobs, output_dir):
+        """把各作业的输出目录去掉前缀后移入所属任务的结果目录"""
+        for item, job in jobs:
+            source = os.path.join(output_dir, job.batch_output_name)
+            if not os.path.isdir(source):
+                continue
+            _strip_prefix(source, job.batch_output_name, job.output_name)
+            os.makedirs(item.results_dir, exist_ok=True)
+            dest = os.path.join(item.results_dir, job.output_name)
+            suffix = 1
+            while os.path.exists(dest):
+                suffix += 1
+                dest = os.path.join(item.results_dir, f'{job.output_name}_{suffix}')
+            shutil.move(source, dest)
+            try:
+                item.on_job_done(dest)
+            except Exception as e:
+                print(f"处理作业结果失败: {e}")
+
+
+def _strip_prefix(directory, batch_name, name):
+    """作业目录中以批量作业名开头的文件和子目录改回原作业名"""
+    for root, dirs, files in os.walk(directory, topdown=False):
+        for entry in dirs + files:
+            if entry.startswith(batch_name):
+                os.rename(os.path.join(root, entry), os.path.join(root, name + entry[len(batch_name):]))
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher(input_root, batch_root, runner):
+    """返回全局批处理器，未开启 ALPHAFOLD_BATCH 时返回None"""
+    global _batcher
+    if not ALPHAFOLD_BATCH_ENABLED:
+        return None
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = AlphaFoldBatcher(input_root, batch_root, runner)
+        return _batcher
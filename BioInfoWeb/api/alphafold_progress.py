@@ -0,0 +1,199 @@
+import os
+import re
+import threading
+from datetime import datetime
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # 可选依赖，没有时使用轮询
+    INotify = None
+
+# ========== AlphaFold进度跟踪 ==========
+# 进度由两部分事件驱动：
+#   1. docker日志的阶段标记（在读取日志的循环中逐行解析，不需要额外读文件）；
+#   2. 结果目录中作业完成的标志文件（inotify，不可用时按间隔只扫描第一层目录）。
+ALPHAFOLD_POLL_INTERVAL = float(os.getenv('ALPHAFOLD_POLL_INTERVAL', 5))
+
+# AlphaFold3 在每个作业目录中最后写出 ranking_scores.csv
+JOB_DONE_MARKER = 'ranking_scores.csv'
+
+# 作业开始的日志，name 为作业名（批量运行时据此把日志分给各任务）
+JOB_START_PATTERN = re.compile(r'Processing fold input (?P<name>.+?)\.?$')
+JOB_DONE_PATTERN = re.compile(r'Done processing fold input')
+
+# (正则, 标记类型, 阶段名, 当前作业的完成比例)；推理阶段的比例按已完成的seed计算
+STAGE_MARKERS = [
+    (JOB_START_PATTERN, 'job_start', '开始处理', 0.0),
+    (re.compile(r'Running data pipeline.*took'), 'stage', 'MSA搜索完成', 0.40),
+    (re.compile(r'Running data pipeline'), 'stage', 'MSA搜索', 0.02),
+    (re.compile(r'Jackhmmer|Nhmmer|Getting (protein|RNA) MSAs'), 'stage', 'MSA搜索', 0.05),
+    (re.compile(r'[Tt]emplate|Hmmsearch'), 'stage', '模板搜索', 0.30),
+    (re.compile(r'Featurising data with (?P<seeds>\d+) seed'), 'seeds', '特征化', 0.42),
+    (re.compile(r'Running model inference with seed (?P<seed>\S+?) took'), 'seed_done', None, None),
+    (re.compile(r'Running model inference with seed (?P<seed>\S+?)\.*$'), 'seed_start', None, None),
+    (re.compile(r'Writing outputs'), 'stage', '写出结果', 0.92),
+    (JOB_DONE_PATTERN, 'job_done', '作业完成', 0.0),
+]
+
+# 推理阶段在作业进度中的区间
+INFERENCE_START = 0.45
+INFERENCE_END = 0.90
+
+
+class AlphaFoldProgress:
+    """根据日志阶段和完成的作业目录更新任务进度
+
+    进度 = 10% + 80% * (已完成作业 + 当前作业完成比例) / 作业总数，
+    只有阶段或数值变化时才写入任务记录。
+    """
+
+    def __init__(self, task_info, total_jobs, progress_log=None):
+        self.task_info = task_info
+        self.total_jobs = max(1, total_jobs)
+        self.progress_log = progress_log
+        self.jobs_logged = 0
+        self.finished_dirs = set()
+        self.current_job = None
+        self.stage = '等待启动'
+        self.fraction = 0.0
+        self.seeds_total = 1
+        self.seeds_done = 0
+        self._lock = threading.Lock()
+
+    def feed_line(self, line):
+        """解析一行docker日志"""
+        line = line.rstrip()
+        for pattern, kind, stage, fraction in STAGE_MARKERS:
+            match = pattern.search(line)
+            if match:
+                with self._lock:
+                    self._apply(kind, match, stage, fraction)
+                    self._publish()
+                return
+
+    def _apply(self, kind, match, stage, fraction):
+        if kind == 'job_start':
+            self.current_job = match.group('name')
+            self.seeds_done = 0
+            self.seeds_total = 1
+        elif kind == 'seeds':
+            self.seeds_total = max(1, int(match.group('seeds')))
+        elif kind in ('seed_start', 'seed_done'):
+            if kind == 'seed_done':
+                self.seeds_done = min(self.seeds_done + 1, self.seeds_total)
+                stage = f'模型推理 ({self.seeds_done}/{self.seeds_total} 个seed完成)'
+            else:
+                stage = f'模型推理 (seed {match.group("seed")})'
+            fraction = INFERENCE_START + (INFERENCE_END - INFERENCE_START) * self.seeds_done / self.seeds_total
+        elif kind == 'job_done':
+            self.jobs_logged += 1
+            self.current_job = None
+
+        self.stage = stage
+        # 同一作业内进度只增不减（MSA和模板搜索的日志可能交替出现），新作业从0开始
+        if kind in ('job_start', 'job_done'):
+            self.fraction = fraction
+        else:
+            self.fraction = max(self.fraction, fraction)
+
+    def job_finished(self, job_dir):
+        """结果目录中出现完成标志的作业"""
+        with self._lock:
+            if job_dir in self.finished_dirs:
+                return False
+            self.finished_dirs.add(job_dir)
+            self._publish()
+            return True
+
+    def _publish(self):
+        jobs_done = min(max(self.jobs_logged, len(self.finished_dirs)), self.total_jobs)
+        current = self.fraction if jobs_done < self.total_jobs else 0.0
+        progress = min(90, 10 + int(80 * (jobs_done + current) / self.total_jobs))
+        job_label = f'：{self.current_job}' if self.current_job else ''
+        message = f'AlphaFold3处理中... {self.stage}{job_label}（已完成 {jobs_done}/{self.total_jobs} 个作业）'
+
+        task_info = self.task_info
+        if task_info.get('progress') != progress:
+            task_info['progress'] = progress
+        if task_info.get('message') != message:
+            task_info['message'] = message
+            task_info['stage'] = self.stage
+            task_info['current_output_count'] = jobs_done
+            if self.progress_log:
+                with open(self.progress_log, 'a') as f:
+                    f.write(f"{datetime.now().isoformat()} - 进度: {progress}%, {self.stage}, 完成作业: {jobs_done}\n")
+
+
+def _job_done(job_dir):
+    return os.path.exists(os.path.join(job_dir, JOB_DONE_MARKER))
+
+
+def _poll_output_dir(output_dir, on_job_done, stop_event, interval):
+    """轮询：只扫描结果目录的第一层，检查各作业目录的完成标志"""
+    done = set()
+    while True:
+        try:
+            with os.scandir(output_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir() and entry.path not in done and _job_done(entry.path):
+                        done.add(entry.path)
+                        on_job_done(entry.path)
+        except FileNotFoundError:
+            pass
+        if stop_event.wait(interval):
+            return
+
+
+def _inotify_output_dir(output_dir, on_job_done, stop_event, interval):
+    """inotify：监听结果目录中新建的作业目录，以及作业目录中完成标志的写入"""
+    inotify = INotify()
+    try:
+        root_wd = inotify.add_watch(output_dir, flags.CREATE | flags.MOVED_TO | flags.ONLYDIR)
+        job_dirs = {}
+        done = set()
+
+        def watch_job(job_dir):
+            wd = inotify.add_watch(job_dir, flags.CLOSE_WRITE | flags.MOVED_TO)
+            job_dirs[wd] = job_dir
+            # 目录创建和添加监听之间已经写完的情况
+            if job_dir not in done and _job_done(job_dir):
+                done.add(job_dir)
+                on_job_done(job_dir)
+
+        with os.scandir(output_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    watch_job(entry.path)
+
+        while not stop_event.is_set():
+            for event in inotify.read(timeout=int(interval * 1000)):
+                if event.wd == root_wd:
+                    path = os.path.join(output_dir, event.name)
+                    if event.mask & flags.ISDIR and os.path.isdir(path):
+                        watch_job(path)
+                elif event.name == JOB_DONE_MARKER:
+                    job_dir = job_dirs.get(event.wd)
+                    if job_dir and job_dir not in done:
+                        done.add(job_dir)
+                        on_job_done(job_dir)
+    finally:
+        inotify.close()
+
+
+def watch_output_dir(output_dir, on_job_done, stop_event, interval=ALPHAFOLD_POLL_INTERVAL):
+    """在后台线程中监视结果目录，每个作业完成时调用 on_job_done(作业目录)"""
+    os.makedirs(output_dir, exist_ok=True)
+
+    def run():
+        if INotify is not None:
+            try:
+                _inotify_output_dir(output_dir, on_job_done, stop_event, interval)
+                return
+            except OSError as e:
+                # inotify 监听数用尽或文件系统不支持（例如部分网络文件系统）
+                print(f"inotify不可用，改为轮询: {e}")
+        _poll_output_dir(output_dir, on_job_done, stop_event, interval)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+
+# ========== 分块断点续传上传 ==========
+# 协议（参考tus）：
+#   POST  /upload/<page_type>/sessions                      创建上传，声明文件名和大小
+#   HEAD  /upload/<page_type>/<task_id>/sessions/<id>       查询已接收的字节数（Upload-Offset）
+#   PATCH /upload/<page_type>/<task_id>/sessions/<id>       从 Upload-Offset 处追加数据
+#   POST  /upload/<page_type>/<task_id>/complete            所有文件传完后创建任务
+# 数据直接写入任务的上传目录，传输中的文件带 .part 后缀，收到最后一个字节后改名。
+
+UPLOAD_META_DIR = '.uploads'
+PART_SUFFIX = '.part'
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """上传请求错误，status 为返回的HTTP状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _meta_path(task_dir, upload_id):
+    return os.path.join(task_dir, UPLOAD_META_DIR, f'{upload_id}.json')
+
+
+def _received(meta, task_dir):
+    """根据磁盘上的文件大小得到已接收的字节数"""
+    final_path = os.path.join(task_dir, meta['filename'])
+    if os.path.exists(final_path):
+        return meta['length']
+    part_path = final_path + PART_SUFFIX
+    return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+
+def create_upload(task_dir, filename, length):
+    """在任务目录中登记一个上传，返回上传信息（含 upload_id）"""
+    os.makedirs(os.path.join(task_dir, UPLOAD_META_DIR), exist_ok=True)
+    for meta in list_uploads(task_dir):
+        if meta['filename'] == filename:
+            raise UploadError(f'文件已存在: {filename}', 409)
+
+    meta = {
+        'upload_id': uuid.uuid4().hex,
+        'filename': filename,
+        'length': length,
+        'created': time.time()
+    }
+    part_path = os.path.join(task_dir, filename + PART_SUFFIX)
+    open(part_path, 'wb').close()
+    if length == 0:
+        os.replace(part_path, os.path.join(task_dir, filename))
+    with open(_meta_path(task_dir, meta['upload_id']), 'w') as f:
+        json.dump(meta, f)
+    meta['offset'] = 0
+    return meta
+
+
+def load_upload(task_dir, upload_id):
+    """读取上传信息，不存在时抛出 UploadError(404)"""
+    if not upload_id.isalnum():
+        raise UploadError('上传不存在', 404)
+    try:
+        with open(_meta_path(task_dir, upload_id)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise UploadError('上传不存在', 404)
+    meta['offset'] = _received(meta, task_dir)
+    return meta
+
+
+def list_uploads(task_dir):
+    """任务目录中登记的全部上传"""
+    meta_dir = os.path.join(task_dir, UPLOAD_META_DIR)
+    if not os.path.isdir(meta_dir):
+        return []
+    uploads = []
+    for name in sorted(os.listdir(meta_dir)):
+        if name.endswith('.json'):
+            uploads.append(load_upload(task_dir, name[:-len('.json')]))
+    return sorted(uploads, key=lambda meta: meta['created'])
+
+
+def append_chunk(task_dir, upload_id, offset, stream):
+    """把请求体从 offset 处追加到文件，边读边检查大小，返回新的偏移
+
+    - offset 必须等于已接收的字节数，否则返回409，客户端应先用HEAD查询；
+    - 超过创建时声明的大小立即停止读取，丢弃本次请求写入的数据并返回413；
+    - 连接中断时已写入的数据保留，客户端可以从新的偏移继续。
+    """
+    meta = load_upload(task_dir, upload_id)
+    final_path = os.path.join(task_dir, meta['filename'])
+    part_path = final_path + PART_SUFFIX
+    if not os.path.exists(part_path):
+        raise UploadError('文件已上传完成', 409)
+
+    with open(part_path, 'r+b') as f:
+        try:
+            # 同一个上传同时只允许一个写入请求
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('该文件正在上传中', 423)
+
+        current = os.fstat(f.fileno()).st_size
+        if offset != current:
+            raise UploadError(f'Upload-Offset 不匹配，服务器已接收 {current} 字节', 409)
+
+        f.seek(current)
+        remaining = meta['length'] - current
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(chunk) > remaining:
+                    f.truncate(current)
+                    raise UploadError('数据超过声明的文件大小', 413)
+                f.write(chunk)
+                remaining -= len(chunk)
+        finally:
+            f.flush()
+        new_offset = f.tell()
+
+    if new_offset == meta['length']:
+        os.replace(part_path, final_path)
+    return new_offset
+
+
+def completed_files(task_dir):
+    """返回 (已完成的文件路径列表, 未完成的文件名列表)"""
+    files, pending = [], []
+    for meta in list_uploads(task_dir):
+        if meta['offset'] == meta['length'] and os.path.exists(os.path.join(task_dir, meta['filename'])):
+            files.append(os.path.join(task_dir, meta['filename']))
+        else:
+            pending.append(meta['filename'])
+    return files, pending
@@ -0,0 +1,152 @@
+import os
+import json
+import shutil
+import time
+import hashlib
+import tempfile
+
+# ========== 内容寻址的输入存储 ==========
+# 上传的文件按内容的SHA-256保存在 <root>/<前两位>/<哈希> 中，任务目录里的文件是它的硬链接，
+# 相同内容只占一份磁盘空间。输入的哈希和分析参数组成任务的输入摘要，
+# 摘要相同的已完成任务的结果可以直接复用（<root>/.refs/<摘要> 中记录任务ID）。
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ContentStore:
+    """按内容哈希保存上传文件，并记录输入摘要到已完成任务的映射"""
+
+    def __init__(self, root):
+        self.root = root
+        self.blob_dir = root
+        self.ref_dir = os.path.join(root, '.refs')
+        self.tmp_dir = os.path.join(root, '.tmp')
+        for directory in (self.blob_dir, self.ref_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _link(self, digest, dest_path):
+        """把 dest_path 替换为指向blob的硬链接（不支持硬链接的文件系统上复制）"""
+        blob = self.blob_path(digest)
+        tmp_path = dest_path + '.link'
+        try:
+            os.link(blob, tmp_path)
+        except OSError:
+            shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, dest_path)
+
+    def _commit_blob(self, digest, tmp_path):
+        """把临时文件登记为blob，内容已存在时丢弃临时文件"""
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if os.path.exists(blob):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, blob)
+
+    def save_stream(self, stream, dest_path):
+        """边读边计算哈希并写入，返回内容哈希；dest_path 成为blob的硬链接"""
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(HASH_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha.update(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            self._commit_blob(digest, tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._link(digest, dest_path)
+        return digest
+
+    def ingest(self, path):
+        """登记一个已经写到磁盘的文件（分块上传），重复内容替换为硬链接，返回内容哈希"""
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(path, blob)
+                return digest
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copyfile(path, blob)
+                return digest
+        if not os.path.samefile(path, blob):
+            self._link(digest, path)
+        return digest
+
+    # ---------- 结果复用 ----------
+    @staticmethod
+    def input_digest(page_type, inputs, params):
+        """任务输入摘要：页面类型 + [(文件名, 内容哈希)] + 分析参数"""
+        content = json.dumps({
+            'page_type': page_type,
+            'inputs': sorted(inputs),
+            'params': params
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _ref_path(self, digest):
+        return os.path.join(self.ref_dir, digest)
+
+    def find_result(self, digest):
+        """返回输入摘要对应的已完成任务ID，没有时返回None"""
+        try:
+            with open(self._ref_path(digest)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def record_result(self, digest, task_id):
+        """记录输入摘要对应的已完成任务"""
+        tmp_path = self._ref_path(digest) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(task_id)
+        os.replace(tmp_path, self._ref_path(digest))
+
+    def forget_result(self, digest):
+        try:
+            os.remove(self._ref_path(digest))
+        except FileNotFoundError:
+            pass
+
+    # ---------- 清理 ----------
+    def prune_orphans(self, grace=3600):
+        """删除没有任务引用的blob（硬链接数为1），返回删除的个数
+
+        链接数变化会更新ctime，grace 秒内有变化的blob（可能正在被新上传链接）不删除。
+        """
+        removed = 0
+        cutoff = time.time() - grace
+        with os.scandir(self.blob_dir) as prefixes:
+            for prefix in prefixes:
+                if not prefix.is_dir() or len(prefix.name) != 2:
+                    continue
+                with os.scandir(prefix.path) as blobs:
+                    for blob in blobs:
+                        try:
+                            stat = blob.stat()
+                            if stat.st_nlink == 1 and stat.st_ctime < cutoff:
+                                os.remove(blob.path)
+                                removed += 1
+                        except FileNotFoundError:
+                            continue
+        return removed
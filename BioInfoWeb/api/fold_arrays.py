@@ -0,0 +1,78 @@
+import zipfile
+
+import numpy as np
+
+# ========== 碱基配对概率矩阵存储 ==========
+# 配对概率矩阵以稀疏上三角形式保存：只保存 i < j 且概率不低于 BPP_CUTOFF 的配对，
+# 坐标从0开始。npz 不压缩（ZIP_STORED），数组可以直接从文件内存映射。
+BPP_CUTOFF = 1e-5
+
+# zip本地文件头的固定长度，以及文件名长度/扩展字段长度所在的偏移
+_LOCAL_HEADER_SIZE = 30
+_NAME_LENGTH_OFFSET = 26
+
+
+def save_bpp(path, length, i, j, p):
+    """保存稀疏配对概率：i, j 为配对位置（0起始，i < j），p 为概率"""
+    with open(path, 'wb') as f:
+        np.savez(
+            f,
+            length=np.array(length, dtype=np.int32),
+            i=np.asarray(i, dtype=np.int32),
+            j=np.asarray(j, dtype=np.int32),
+            p=np.asarray(p, dtype=np.float32)
+        )
+
+
+def _member_offset(f, info):
+    """返回zip成员数据在文件中的起始位置"""
+    f.seek(info.header_offset)
+    header = f.read(_LOCAL_HEADER_SIZE)
+    name_length = int.from_bytes(header[_NAME_LENGTH_OFFSET:_NAME_LENGTH_OFFSET + 2], 'little')
+    extra_length = int.from_bytes(header[_NAME_LENGTH_OFFSET + 2:_NAME_LENGTH_OFFSET + 4], 'little')
+    return info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def load_bpp(path, mmap=True):
+    """读取 save_bpp 保存的文件，返回 {'length', 'i', 'j', 'p'}
+
+    mmap=True 时数组为只读内存映射（np.load 不支持对npz做内存映射），
+    大序列的配对概率不需要全部读入内存。
+    """
+    if not mmap:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'{path} 中的 {info.filename} 是压缩存储的，无法内存映射')
+            f.seek(_member_offset(f, info))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if shape == ():
+                arrays[name] = np.fromfile(f, dtype=dtype, count=1)[0]
+                continue
+            if 0 in shape:
+                # 空数组无法映射
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode='r', shape=shape,
+                order='F' if fortran_order else 'C', offset=f.tell()
+            )
+    return arrays
+
+
+def bpp_dense(bpp):
+    """把稀疏配对概率展开为对称的 N x N float32 矩阵（仅用于小序列）"""
+    length = int(bpp['length'])
+    matrix = np.zeros((length, length), dtype=np.float32)
+    matrix[bpp['i'], bpp['j']] = bpp['p']
+    matrix[bpp['j'], bpp['i']] = bpp['p']
+    return matrix
@@ -0,0 +1,170 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import importlib.metadata
+
+import ViennaRNA as RNA
+
+# ========== RNAfold结果缓存 ==========
+# 以（规范化序列 + ViennaRNA版本 + 模型参数）的哈希为键，保存MFE结构和能量
+RNAFOLD_CACHE_ENABLED = os.getenv('RNAFOLD_CACHE', '1') == '1'
+RNAFOLD_CACHE_PATH = os.getenv(
+    'RNAFOLD_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'fold_cache.db')
+)
+RNAFOLD_CACHE_MAX_MB = int(os.getenv('RNAFOLD_CACHE_MAX_MB', 512))
+
+# 一次 IN 查询的键数量上限（SQLite变量个数限制）
+LOOKUP_BATCH = 500
+
+
+def normalize_sequence(sequence):
+    """规范化序列：去掉空白、转大写、T转U（ViennaRNA内部同样如此处理）"""
+    return ''.join(sequence.split()).upper().replace('T', 'U')
+
+
+def vienna_version():
+    """ViennaRNA版本号（ViennaRNA 模块本身没有 __version__）"""
+    version = getattr(RNA, '__version__', None)
+    if version:
+        return version
+    try:
+        return importlib.metadata.version('ViennaRNA')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def model_signature(md=None):
+    """影响折叠结果的版本和模型参数"""
+    md = md or RNA.md()
+    return (f'ViennaRNA={vienna_version()};T={md.temperature};dangles={md.dangles};'
+            f'noLP={md.noLP};noGU={md.noGU};special_hp={md.special_hp}')
+
+
+class FoldCache:
+    """磁盘上的RNAfold结果缓存（SQLite），按总大小做LRU淘汰
+
+    多个进程可以共享同一个缓存文件；访问时间批量更新，
+    超过 max_bytes 时删除最久未使用的条目直到降到上限的90%。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS fold_cache (
+        key TEXT PRIMARY KEY,
+        structure TEXT NOT NULL,
+        energy REAL NOT NULL,
+        size INTEGER NOT NULL,
+        last_access REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_fold_cache_access ON fold_cache (last_access);
+    CREATE TABLE IF NOT EXISTS fold_cache_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_size INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO fold_cache_meta (id, total_size) VALUES (1, 0);
+    """
+
+    def __init__(self, db_path, max_bytes, signature=None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.signature = signature or model_signature()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def key(self, sequence, kind='mfe'):
+        content = f'{kind}|{self.signature}|{normalize_sequence(sequence)}'
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """批量查询，返回 {key: (structure, energy)}，并更新命中条目的访问时间"""
+        conn = self._connect()
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[i:i + LOOKUP_BATCH]
+            placeholders = ', '.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT key, structure, energy FROM fold_cache WHERE key IN ({placeholders})', batch
+            ).fetchall()
+            for key, structure, energy in rows:
+                found[key] = (structure, energy)
+
+        if found:
+            now = time.time()
+            conn.executemany('UPDATE fold_cache SET last_access = ? WHERE key = ?',
+                             [(now, key) for key in found])
+        return found
+
+    def put_many(self, items):
+        """批量写入 {key: (structure, energy)}，必要时淘汰旧条目"""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, structure, energy, len(key) + len(structure) + 16, now)
+                for key, (structure, energy) in items.items()]
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            added = 0
+            for row in rows:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO fold_cache (key, structure, energy, size, last_access) '
+                    'VALUES (?, ?, ?, ?, ?)', row
+                )
+                if cursor.rowcount:
+                    added += row[3]
+            conn.execute('UPDATE fold_cache_meta SET total_size = total_size + ? WHERE id = 1', (added,))
+            total = conn.execute('SELECT total_size FROM fold_cache_meta WHERE id = 1').fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _evict(self, conn, total):
+        """按访问时间从旧到新删除，直到总大小降到上限的90%"""
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            rows = conn.execute(
+                'SELECT key, size FROM fold_cache ORDER BY last_access LIMIT 1000'
+            ).fetchall()
+            if not rows:
+                total = 0
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                total -= size
+                if total <= target:
+                    break
+            conn.executemany('DELETE FROM fold_cache WHERE key = ?', evicted)
+        conn.execute('UPDATE fold_cache_meta SET total_size = ? WHERE id = 1', (max(total, 0),))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_fold_cache():
+    """返回全局缓存实例，RNAFOLD_CACHE=0 时返回None"""
+    global _cache
+    if not RNAFOLD_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = FoldCache(RNAFOLD_CACHE_PATH, RNAFOLD_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
@@ -0,0 +1,301 @@
+import os
+import json
+import uuid
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import ViennaRNA as RNA
+
+from api.fold_arrays import save_bpp, BPP_CUTOFF
+
+# ========== RNAfold并行折叠引擎 ==========
+# 工作进程数，默认使用全部CPU核心
+RNAFOLD_WORKERS = int(os.getenv('RNAFOLD_WORKERS', os.cpu_count() or 1))
+# 每个提交给工作进程的任务包含的核苷酸总数（短序列合并提交，减少进程间通信）
+CHUNK_NT = int(os.getenv('RNAFOLD_CHUNK_NT', 20000))
+# 同时在途的序列数 = 工作进程数 * BATCH_PER_WORKER，决定内存上限
+BATCH_PER_WORKER = 32
+# 单条序列折叠的内存预算（MB）：auto 模式下超过预算的长序列改用滑动窗口局部折叠
+MEMORY_BUDGET_MB = int(os.getenv('RNAFOLD_MEMORY_BUDGET_MB', 1024))
+# 动态规划矩阵每个(i, j)格子的大致字节数（ViennaRNA同时维护多张能量矩阵）
+BYTES_PER_CELL = 24
+
+FOLD_MODES = ('mfe', 'local', 'auto')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _mp_context():
+    """Linux上使用fork：子进程直接继承已导入的ViennaRNA，不需要重新导入app"""
+    method = os.getenv('RNAFOLD_MP_START', 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    return multiprocessing.get_context(method)
+
+
+def get_pool():
+    """返回共享的进程池，所有RNAfold任务共用同一组常驻工作进程"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RNAFOLD_WORKERS, mp_context=_mp_context())
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def estimate_memory(length, span=None):
+    """估算折叠所需内存（字节）：全局折叠 O(N^2)，窗口折叠 O(W*L)"""
+    span = min(span or length, length)
+    return BYTES_PER_CELL * length * span
+
+
+def choose_mode(length, options):
+    """根据选项和序列长度决定单条序列的折叠方式"""
+    mode = options.get('mode', 'mfe')
+    if mode == 'auto':
+        return 'local' if estimate_memory(length) > MEMORY_BUDGET_MB * 1024 * 1024 else 'mfe'
+    return mode
+
+
+def fit_window(window, span):
+    """在内存预算内收缩窗口大小和最大配对跨度"""
+    budget = MEMORY_BUDGET_MB * 1024 * 1024
+    while window > 20 and estimate_memory(window, span) > budget:
+        window = window * 3 // 4
+        span = min(span, window)
+    return window, min(span, window)
+
+
+def _fold_chunk(chunk):
+    """工作进程中执行：全局MFE折叠一组序列，返回 [(序号, 结果)]"""
+    results = []
+    for index, sequence in chunk:
+        structure, energy = RNA.fold(sequence)
+        results.append((index, {'mode': 'mfe', 'structure': structure, 'energy': energy}))
+    return results
+
+
+def _fold_local(index, seq_id, sequence, window, span, part_path):
+    """工作进程中执行：滑动窗口局部折叠（RNALfold方式）
+
+    每找到一个局部最优结构就写一行到 part_path，不在内存中保存全部窗口。
+    """
+    md = RNA.md()
+    md.window_size = window
+    md.max_bp_span = span
+    fc = RNA.fold_compound(sequence, md, RNA.OPTION_WINDOW)
+
+    counter = {'windows': 0}
+    with open(part_path, 'w') as part:
+        def on_window(start, end, structure, energy, data=None):
+            part.write(json.dumps({
+                'id': seq_id,
+                'start': start,
+                'end': end,
+                'structure': structure,
+                'energy': energy
+            }) + "\n")
+            counter['windows'] += 1
+
+        energy = fc.mfe_window_cb(on_window, None)
+
+    return index, {
+        'mode': 'local',
+        'energy': energy,
+        'window': window,
+        'span': span,
+        'windows': counter['windows'],
+        'part_path': part_path
+    }
+
+
+def _fold_ensemble_chunk(chunk, work_dir):
+    """工作进程中执行：对一组序列计算配分函数及由它得到的集合性质
+
+    每条序列只建立一个 fold_compound，MFE、配分函数、质心结构、MEA结构和
+    配对概率都来自同一次计算。配对概率以稀疏上三角形式写入 work_dir 中的 .npz。
+    """
+    results = []
+    for index, sequence in chunk:
+        md = RNA.md()
+        md.uniq_ML = 1  # MEA 需要
+        fc = RNA.fold_compound(sequence, md)
+        structure, energy = fc.mfe()
+        # 用MFE缩放玻尔兹曼因子，避免长序列数值溢出
+        fc.exp_params_rescale(energy)
+        _, ensemble_energy = fc.pf()
+        centroid, centroid_distance = fc.centroid()
+        mea_structure, mea = fc.MEA()
+
+        pairs = [pair for pair in fc.plist_from_probs(BPP_CUTOFF)
+                 if pair.type == RNA.PLIST_TYPE_BASEPAIR]
+        bpp_path = os.path.join(work_dir, f'{uuid.uuid4().hex}.npz')
+        save_bpp(
+            bpp_path,
+            len(sequence),
+            np.fromiter((pair.i - 1 for pair in pairs), dtype=np.int32, count=len(pairs)),
+            np.fromiter((pair.j - 1 for pair in pairs), dtype=np.int32, count=len(pairs)),
+            np.fromiter((pair.p for pair in pairs), dtype=np.float32, count=len(pairs))
+        )
+
+        results.append((index, {
+            'mode': 'ensemble',
+            'structure': structure,
+            'energy': energy,
+            'ensemble_energy': ensemble_energy,
+            'mfe_frequency': fc.pr_structure(structure),
+            'ensemble_diversity': fc.mean_bp_distance(),
+            'centroid_structure': centroid,
+            'centroid_distance': centroid_distance,
+            'mea_structure': mea_structure,
+            'mea': mea,
+            'bpp_pairs': len(pairs),
+            'bpp_path': bpp_path
+        }))
+    return results
+
+
+def _make_chunks(pending):
+    """按长度从长到短排序后分组，长序列最先开始，避免最后只剩一个长任务在跑"""
+    ordered = sorted(pending, key=lambda item: len(item[1]), reverse=True)
+    chunks = []
+    current, current_nt = [], 0
+    for index, sequence in ordered:
+        if current and current_nt + len(sequence) > CHUNK_NT:
+            chunks.append(current)
+            current, current_nt = [], 0
+        current.append((index, sequence))
+        current_nt += len(sequence)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _submit_batch(pool, batch, cache, stats, options):
+    """先查缓存，只把未命中的序列提交到进程池（同一批中的重复序列只算一次）
+
+    需要局部折叠的长序列单独提交，结果直接写到工作目录中的分段文件。
+    """
+    results = [None] * len(batch)
+    keys = [None] * len(batch)
+    pending = []
+    futures = []
+
+    mfe_indexes = []
+    for index, (seq_id, sequence) in enumerate(batch):
+        if choose_mode(len(sequence), options) == 'local':
+            window, span = fit_window(options.get('window', 200), options.get('span', 150))
+            part_path = os.path.join(options['work_dir'], f'{uuid.uuid4().hex}.part')
+            futures.append(pool.submit(_fold_local, index, seq_id, sequence, window, span, part_path))
+        else:
+            mfe_indexes.append(index)
+
+    if options.get('ensemble'):
+        # 集合模式下全局折叠的序列都计算配分函数（不使用MFE缓存）
+        pending = [(index, batch[index][1]) for index in mfe_indexes]
+        futures.extend(pool.submit(_fold_ensemble_chunk, chunk, options['work_dir'])
+                       for chunk in _make_chunks(pending))
+        return batch, results, keys, futures
+
+    if cache is not None:
+        for index in mfe_indexes:
+            keys[index] = cache.key(batch[index][1])
+        found = cache.get_many([keys[index] for index in mfe_indexes])
+        first_index = {}
+        for index in mfe_indexes:
+            key = keys[index]
+            if key in found:
+                structure, energy = found[key]
+                results[index] = {'mode': 'mfe', 'structure': structure, 'energy': energy}
+                stats['cache_hits'] += 1
+            else:
+                stats['cache_misses'] += 1
+                if key not in first_index:
+                    first_index[key] = index
+                    pending.append((index, batch[index][1]))
+    else:
+        pending = [(index, batch[index][1]) for index in mfe_indexes]
+
+    futures.extend(pool.submit(_fold_chunk, chunk) for chunk in _make_chunks(pending))
+    return batch, results, keys, futures
+
+
+def _collect_batch(batch, results, keys, futures, cache):
+    computed = {}
+    for future in futures:
+        outcome = future.result()
+        for index, result in (outcome if isinstance(outcome, list) else [outcome]):
+            results[index] = result
+            if result['mode'] == 'mfe' and keys[index] is not None:
+                computed[keys[index]] = (result['structure'], result['energy'])
+
+    if computed:
+        cache.put_many(computed)
+        # 同一批中重复的序列直接使用刚算出的结果
+        for index, key in enumerate(keys):
+            if results[index] is None:
+                structure, energy = computed[key]
+                results[index] = {'mode': 'mfe', 'structure': structure, 'energy': energy}
+
+    for (seq_id, sequence), result in zip(batch, results):
+        yield {'id': seq_id, 'sequence': sequence, 'length': len(sequence), **result}
+
+
+def fold_sequences(records, batch_size=None, cache=None, stats=None, options=None):
+    """并行折叠序列，按输入顺序逐条返回结果字典
+
+    records 为 (seq_id, sequence) 的可迭代对象。输入按批读取，每批先查结果缓存，
+    未命中的在进程池中按长度降序调度；当前批的结果返回时下一批已经在计算，
+    保证所有核心都在工作。stats 中累计 cache_hits / cache_misses。
+
+    options:
+      mode     'mfe'（默认，全局MFE）| 'local'（滑动窗口）| 'auto'（超出内存预算时用窗口）
+      window   窗口大小，span 最大配对跨度（局部折叠）
+      ensemble 为True时全局折叠的序列同时计算配分函数、质心/MEA结构和配对概率
+      work_dir 局部折叠分段文件和配对概率文件的目录
+    全局折叠结果含 structure/energy；局部折叠结果含 windows/part_path，
+    调用方读取 part_path（每行一个窗口结构的JSON）后负责删除；
+    集合模式结果另含 ensemble_energy 等字段和 bpp_path（.npz），由调用方移动到结果目录。
+    """
+    options = options or {'mode': 'mfe'}
+    pool = get_pool()
+    batch_size = batch_size or RNAFOLD_WORKERS * BATCH_PER_WORKER
+    if stats is None:
+        stats = {}
+    stats.setdefault('cache_hits', 0)
+    stats.setdefault('cache_misses', 0)
+
+    in_flight = deque()
+    batch = []
+    try:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                in_flight.append(_submit_batch(pool, batch, cache, stats, options))
+                batch = []
+                # 最多保持两批在途：一批正在返回结果，一批正在计算
+                if len(in_flight) > 1:
+                    yield from _collect_batch(*in_flight.popleft(), cache)
+        if batch:
+            in_flight.append(_submit_batch(pool, batch, cache, stats, options))
+        while in_flight:
+            yield from _collect_batch(*in_flight.popleft(), cache)
+
+    except BrokenProcessPool:
+        # 工作进程异常退出（例如内存不足被杀），下次使用时重建进程池
+        _reset_pool()
+        raise
+    finally:
+        for _, _, _, futures in in_flight:
+            for future in futures:
+                future.cancel()
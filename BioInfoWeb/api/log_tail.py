@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+
+# ========== 日志跟踪（终端页面） ==========
+# 客户端给出字节偏移，服务器从该位置读取日志，按大小分帧发送（每帧在换行处截断），
+# 文件增长时按间隔检查大小继续读取（不启动子进程）。
+# 每帧需要客户端确认，未确认的帧达到 LOG_TAIL_MAX_INFLIGHT 时暂停读取（偏移在文件中，暂停不丢数据）；
+# LOG_TAIL_POLICY=skip 时，暂停期间落后超过 LOG_TAIL_MAX_LAG 字节则跳到文件末尾附近。
+LOG_TAIL_FRAME_BYTES = int(os.getenv('LOG_TAIL_FRAME_BYTES', 64 * 1024))
+LOG_TAIL_POLL_INTERVAL = float(os.getenv('LOG_TAIL_POLL_INTERVAL', 0.5))
+LOG_TAIL_MAX_INFLIGHT = int(os.getenv('LOG_TAIL_MAX_INFLIGHT', 4))
+LOG_TAIL_POLICY = os.getenv('LOG_TAIL_POLICY', 'block')
+LOG_TAIL_MAX_LAG = int(os.getenv('LOG_TAIL_MAX_LAG', 8 * 1024 * 1024))
+# 跳过时保留的末尾字节数；负的起始偏移（只看最后一部分）默认也使用这个大小
+LOG_TAIL_KEEP_BYTES = int(os.getenv('LOG_TAIL_KEEP_BYTES', 64 * 1024))
+
+
+def _align_to_line(f, offset):
+    """从 offset 开始找到下一行的开头（offset 为0时不变）"""
+    if offset <= 0:
+        return 0
+    f.seek(offset - 1)
+    while True:
+        chunk = f.read(4096)
+        if not chunk:
+            return f.tell()
+        newline = chunk.find(b'\n')
+        if newline >= 0:
+            return f.tell() - len(chunk) + newline + 1
+
+
+def read_frame(f, offset, max_bytes, final=False):
+    """从 offset 读取最多 max_bytes 字节，截断到最后一个换行
+
+    返回 (数据, 新偏移)。没有完整的行时返回空数据，等待该行写完；
+    单行超过 max_bytes 或 final=True（文件不会再增长）时不截断。
+    """
+    f.seek(offset)
+    data = f.read(max_bytes)
+    if not data:
+        return b'', offset
+    newline = data.rfind(b'\n')
+    if newline >= 0 and not final:
+        data = data[:newline + 1]
+    elif newline < 0 and not final and len(data) < max_bytes:
+        return b'', offset
+    return data, offset + len(data)
+
+
+class LogTail:
+    """把一个日志文件从指定偏移发送给一个客户端
+
+    send(frame, on_ack) 发送一帧，客户端确认后调用 on_ack()；
+    frame = {'offset': 起始偏移, 'next_offset': 下一帧的偏移, 'data': 文本,
+             'reset': 文件被截断后从头开始, 'skipped': 跳过的字节数, 'eof': 不再有后续内容}
+    is_finished() 返回True表示日志不会再增长（任务已结束）。
+    """
+
+    def __init__(self, path, offset, send, is_finished, follow=True, sleep=time.sleep):
+        self.path = path
+        self.offset = offset
+        self.send = send
+        self.is_finished = is_finished
+        self.follow = follow
+        self.sleep = sleep
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _ack(self):
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+
+    def _emit(self, frame):
+        with self._lock:
+            self.inflight += 1
+        self.send(frame, self._ack)
+
+    def _wait_for_acks(self, f, size):
+        """未确认的帧太多时等待；skip 策略下落后太多则跳到末尾附近，返回跳过的字节数"""
+        skipped = 0
+        while self.inflight >= LOG_TAIL_MAX_INFLIGHT and not self._stopped.is_set():
+            if LOG_TAIL_POLICY == 'skip' and size - self.offset > LOG_TAIL_MAX_LAG:
+                target = _align_to_line(f, size - LOG_TAIL_KEEP_BYTES)
+                skipped += target - self.offset
+                self.offset = target
+            self.sleep(0.05)
+        return skipped
+
+    def _start_offset(self, f, size):
+        """负偏移表示从末尾往前的字节数；超过文件大小说明文件被截断，从头开始"""
+        if self.offset < 0:
+            return _align_to_line(f, max(0, size + self.offset)), False
+        if self.offset > size:
+            return 0, True
+        return self.offset, False
+
+    def run(self):
+        f = None
+        try:
+            # 任务还没开始时日志文件可能不存在
+            while f is None:
+                try:
+                    f = open(self.path, 'rb')
+                except FileNotFoundError:
+                    if not self.follow or self.is_finished() or self._stopped.is_set():
+                        self._emit({'offset': 0, 'next_offset': 0, 'data': '', 'eof': True, 'missing': True})
+                        return
+                    self.sleep(LOG_TAIL_POLL_INTERVAL)
+
+            size = os.fstat(f.fileno()).st_size
+            self.offset, reset = self._start_offset(f, size)
+            while not self._stopped.is_set():
+                size = os.fstat(f.fileno()).st_size
+                if size < self.offset:
+                    # 文件被截断或重新生成
+                    self.offset, reset = 0, True
+                # 先判断是否结束再读取，结束后读到的就是全部内容
+                finished = not self.follow or self.is_finished()
+                skipped = self._wait_for_acks(f, size)
+                if self._stopped.is_set():
+                    break
+
+                data, next_offset = read_frame(f, self.offset, LOG_TAIL_FRAME_BYTES, final=finished)
+                at_end = next_offset >= size
+                if data or reset or skipped:
+                    frame = {
+                        'offset': self.offset,
+                        'next_offset': next_offset,
+                        'data': data.decode('utf-8', errors='replace'),
+                        'eof': finished and at_end
+                    }
+                    if reset:
+                        frame['reset'] = True
+                    if skipped:
+                        frame['skipped'] = skipped
+                    self.offset = next_offset
+                    reset = False
+                    self._emit(frame)
+                    if frame['eof']:
+                        return
+                elif finished and at_end:
+                    self._emit({'offset': self.offset, 'next_offset': self.offset, 'data': '', 'eof': True})
+                    return
+
+                if at_end or not data:
+                    # 已读到末尾（或最后一行还没写完），等待文件增长
+                    self.sleep(LOG_TAIL_POLL_INTERVAL)
+        finally:
+            if f is not None:
+                f.close()
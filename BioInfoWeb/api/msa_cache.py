@@ -0,0 +1,174 @@
+import os
+import glob
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+# ========== AlphaFold MSA/模板缓存 ==========
+# 以（链类型 + 序列 + 数据库版本）的哈希为键，保存数据管道搜索得到的MSA和模板。
+# 作业完成后从 <作业>/<作业>_data.json 读取结果写入缓存；之后的输入JSON中相同的链
+# 直接带上这些字段，AlphaFold3 对已有MSA/模板的链不再搜索数据库。
+ALPHAFOLD_MSA_CACHE_ENABLED = os.getenv('ALPHAFOLD_MSA_CACHE', '1') == '1'
+ALPHAFOLD_MSA_CACHE_PATH = os.getenv(
+    'ALPHAFOLD_MSA_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'msa_cache.db')
+)
+ALPHAFOLD_MSA_CACHE_MAX_MB = int(os.getenv('ALPHAFOLD_MSA_CACHE_MAX_MB', 20480))
+# 数据库更新后修改此值，旧的搜索结果不再使用
+ALPHAFOLD_DB_VERSION = os.getenv('ALPHAFOLD_DB_VERSION', 'default')
+
+# 各类型的链由数据管道填充的字段
+CHAIN_FIELDS = {
+    'protein': ('unpairedMsa', 'pairedMsa', 'templates'),
+    'rna': ('unpairedMsa',),
+}
+
+
+def chain_needs_search(kind, chain):
+    """链是否还需要数据管道搜索（用户已提供任一字段时视为自行处理）"""
+    fields = CHAIN_FIELDS.get(kind)
+    return bool(fields) and all(chain.get(field) is None for field in fields)
+
+
+class MSACache:
+    """磁盘上的MSA缓存（SQLite，内容zlib压缩），按总大小做LRU淘汰"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS msa_cache (
+        key TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        last_access REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_msa_cache_access ON msa_cache (last_access);
+    CREATE TABLE IF NOT EXISTS msa_cache_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_size INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO msa_cache_meta (id, total_size) VALUES (1, 0);
+    """
+
+    def __init__(self, db_path, max_bytes, db_version=ALPHAFOLD_DB_VERSION):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.db_version = db_version
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def key(self, kind, sequence):
+        content = f'{kind}|{self.db_version}|{"".join(sequence.split()).upper()}'
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, kind, sequence):
+        """返回缓存的字段字典，没有时返回None"""
+        key = self.key(kind, sequence)
+        conn = self._connect()
+        row = conn.execute('SELECT data FROM msa_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE msa_cache SET last_access = ? WHERE key = ?', (time.time(), key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, kind, sequence, fields):
+        """写入一条链的搜索结果，必要时淘汰旧条目"""
+        key = self.key(kind, sequence)
+        data = zlib.compress(json.dumps(fields).encode('utf-8'))
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO msa_cache (key, kind, data, size, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, kind, data, len(data), time.time())
+            )
+            if cursor.rowcount:
+                conn.execute('UPDATE msa_cache_meta SET total_size = total_size + ? WHERE id = 1', (len(data),))
+            total = conn.execute('SELECT total_size FROM msa_cache_meta WHERE id = 1').fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _evict(self, conn, total):
+        """按访问时间从旧到新删除，直到总大小降到上限的90%"""
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            rows = conn.execute('SELECT key, size FROM msa_cache ORDER BY last_access LIMIT 100').fetchall()
+            if not rows:
+                total = 0
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                total -= size
+                if total <= target:
+                    break
+            conn.executemany('DELETE FROM msa_cache WHERE key = ?', evicted)
+        conn.execute('UPDATE msa_cache_meta SET total_size = ? WHERE id = 1', (max(total, 0),))
+
+    # ---------- 与AlphaFold输入/输出的交互 ----------
+    def inject(self, fold_input):
+        """为输入JSON中需要搜索的链填入缓存的MSA/模板
+
+        返回 (命中的链数, 仍需搜索的链数)。
+        """
+        hits, misses = 0, 0
+        for entry in fold_input.get('sequences', []):
+            for kind, chain in entry.items():
+                if not isinstance(chain, dict) or not chain_needs_search(kind, chain):
+                    continue
+                cached = self.get(kind, chain.get('sequence', ''))
+                if cached is None:
+                    misses += 1
+                    continue
+                chain.update(cached)
+                hits += 1
+        return hits, misses
+
+    def store_job(self, job_dir):
+        """从作业目录的 *_data.json（数据管道的输出）读取各链的MSA/模板写入缓存，返回写入的链数"""
+        stored = 0
+        for data_file in glob.glob(os.path.join(job_dir, '*_data.json')):
+            with open(data_file) as f:
+                fold_input = json.load(f)
+            for entry in fold_input.get('sequences', []):
+                for kind, chain in entry.items():
+                    fields = CHAIN_FIELDS.get(kind)
+                    if not fields or not isinstance(chain, dict):
+                        continue
+                    values = {field: chain.get(field) for field in fields}
+                    if any(value is None for value in values.values()):
+                        continue
+                    self.put(kind, chain.get('sequence', ''), values)
+                    stored += 1
+        return stored
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_msa_cache():
+    """返回全局缓存实例，ALPHAFOLD_MSA_CACHE=0 时返回None"""
+    global _cache
+    if not ALPHAFOLD_MSA_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = MSACache(ALPHAFOLD_MSA_CACHE_PATH, ALPHAFOLD_MSA_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
@@ -0,0 +1,248 @@
+import os
+import shlex
+import codecs
+import signal
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# ========== 子进程管理 ==========
+# 外部命令（AlphaFold容器、终端命令）都由一个事件循环线程启动和监视，不再每个进程占用一个读输出的线程：
+#   - 直接执行参数列表，不经过shell，不分配TTY，stdin 为 /dev/null；
+#   - 输出按块读取、按行交给接收者（日志文件、进度解析、Socket.IO推送）。接收者在一个小线程池中
+#     按顺序调用，某个进程的接收者慢时只暂停读取该进程的管道，不影响其他进程；
+#   - 超时或取消时先向整个进程组发送SIGTERM，PROCESS_KILL_GRACE 秒后仍未退出则SIGKILL；
+#   - 同时运行的子进程不超过 PROCESS_MAX_CHILDREN 个，其余排队等待。
+PROCESS_MAX_CHILDREN = int(os.getenv('PROCESS_MAX_CHILDREN', 16))
+PROCESS_KILL_GRACE = float(os.getenv('PROCESS_KILL_GRACE', 10))
+PROCESS_SINK_THREADS = int(os.getenv('PROCESS_SINK_THREADS', 4))
+# 每个进程最多缓存的未交付输出块数，超过后暂停读取管道
+PROCESS_OUTPUT_QUEUE = 256
+READ_CHUNK = 64 * 1024
+
+
+class ProcessTimeout(Exception):
+    """子进程超过时限被终止"""
+
+
+class ProcessHandle:
+    """一个被管理的子进程
+
+    wait() 等待进程结束且输出全部交给接收者，返回返回码；cancel() 终止进程（可在任意线程调用）。
+    """
+
+    def __init__(self, supervisor, name, argv, timeout):
+        self.supervisor = supervisor
+        self.name = name
+        self.argv = argv
+        self.timeout = timeout
+        self.pid = None
+        self.returncode = None
+        self.timed_out = False
+        self.cancelled = False
+        self.error = None
+        self._task = None
+        self._done = threading.Event()
+
+    @property
+    def command(self):
+        return shlex.join(self.argv)
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        self.supervisor.loop.call_soon_threadsafe(self._cancel)
+
+    def _cancel(self):
+        # 在事件循环线程中执行；进程还在排队时直接放弃启动
+        self.cancelled = True
+        if self._task is not None:
+            self._task.cancel()
+
+    def wait(self, timeout=None):
+        """返回返回码（被取消时为负的信号值）；超时被终止时抛出 ProcessTimeout，无法启动时抛出原异常"""
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        if self.timed_out:
+            raise ProcessTimeout(f'{self.name} 运行超过 {self.timeout} 秒，已终止')
+        return self.returncode
+
+
+class ProcessSupervisor:
+    """在一个事件循环线程中运行和监视所有子进程"""
+
+    def __init__(self, max_children=PROCESS_MAX_CHILDREN, sink_threads=PROCESS_SINK_THREADS):
+        self.max_children = max(1, max_children)
+        self.loop = asyncio.new_event_loop()
+        self._sink_pool = ThreadPoolExecutor(max_workers=max(1, sink_threads), thread_name_prefix='process-sink')
+        self._handles = {}
+        self._lock = threading.Lock()
+        ready = threading.Event()
+        thread = threading.Thread(target=self._loop_main, args=(ready,), name='process-supervisor', daemon=True)
+        thread.start()
+        ready.wait()
+
+    def _loop_main(self, ready):
+        asyncio.set_event_loop(self.loop)
+        # 信号量在事件循环线程中创建（旧版本Python在创建时绑定当前线程的事件循环）
+        self._slots = asyncio.Semaphore(self.max_children)
+        ready.set()
+        self.loop.run_forever()
+
+    # ---------- 对外接口 ----------
+    def start(self, argv, sinks, name=None, timeout=None, cwd=None, env=None, on_exit=None):
+        """启动进程并立即返回 ProcessHandle
+
+        sinks 为接收输出的函数列表，每行输出依次调用 sink(行)；
+        on_exit(handle) 在进程结束且输出全部交付后调用（在接收者线程中）。
+        """
+        argv = [str(arg) for arg in argv]
+        handle = ProcessHandle(self, name or os.path.basename(argv[0]), argv, timeout)
+        with self._lock:
+            self._handles.setdefault(handle.name, set()).add(handle)
+        self.loop.call_soon_threadsafe(self._schedule, handle, list(sinks), cwd, env, on_exit)
+        return handle
+
+    def cancel(self, name):
+        """取消所有以 name 启动且还未结束的进程，返回取消的个数"""
+        with self._lock:
+            handles = list(self._handles.get(name, ()))
+        for handle in handles:
+            handle.cancel()
+        return len(handles)
+
+    def running(self):
+        with self._lock:
+            return sum(len(handles) for handles in self._handles.values())
+
+    # ---------- 事件循环线程 ----------
+    def _schedule(self, handle, sinks, cwd, env, on_exit):
+        handle._task = self.loop.create_task(self._supervise(handle, sinks, cwd, env, on_exit))
+
+    async def _supervise(self, handle, sinks, cwd, env, on_exit):
+        queue = asyncio.Queue(PROCESS_OUTPUT_QUEUE)
+        deliver = self.loop.create_task(self._deliver(queue, sinks))
+        try:
+            if handle.cancelled:
+                return
+            async with self._slots:
+                process = await asyncio.create_subprocess_exec(
+                    *handle.argv,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                    cwd=cwd,
+                    env=env,
+                    # 单独的进程组，终止时连同子进程一起结束
+                    start_new_session=True
+                )
+                handle.pid = process.pid
+                try:
+                    handle.returncode = await asyncio.wait_for(self._pump(process, queue), handle.timeout)
+                except asyncio.TimeoutError:
+                    handle.timed_out = True
+                    handle.returncode = await self._terminate(process)
+                except asyncio.CancelledError:
+                    handle.cancelled = True
+                    handle.returncode = await self._terminate(process)
+        except asyncio.CancelledError:
+            # 等待空位时被取消
+            handle.cancelled = True
+        except Exception as e:
+            handle.error = e
+        finally:
+            await queue.put(None)
+            await deliver
+            with self._lock:
+                handles = self._handles.get(handle.name)
+                if handles is not None:
+                    handles.discard(handle)
+                    if not handles:
+                        del self._handles[handle.name]
+            if on_exit is not None:
+                await self.loop.run_in_executor(self._sink_pool, _call_exit, on_exit, handle)
+            handle._done.set()
+
+    async def _pump(self, process, queue):
+        """读取输出直到进程关闭管道，按行放入队列，返回返回码"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        partial = ''
+        while True:
+            chunk = await process.stdout.read(READ_CHUNK)
+            text = partial + decoder.decode(chunk, final=not chunk)
+            if not chunk:
+                if text:
+                    await queue.put([text])
+                break
+            lines = text.splitlines(keepends=True)
+            partial = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+            if len(partial) > READ_CHUNK:
+                # 很长的不换行输出不再等待换行
+                lines.append(partial)
+                partial = ''
+            if lines:
+                # 队列满时在这里等待，管道随之暂停
+                await queue.put(lines)
+        return await process.wait()
+
+    async def _terminate(self, process):
+        """SIGTERM整个进程组，超过宽限时间后SIGKILL，返回返回码"""
+        for sig, grace in ((signal.SIGTERM, PROCESS_KILL_GRACE), (signal.SIGKILL, None)):
+            try:
+                os.killpg(process.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                break
+            try:
+                return await asyncio.wait_for(process.wait(), grace)
+            except asyncio.TimeoutError:
+                continue
+        return await process.wait()
+
+    async def _deliver(self, queue, sinks):
+        """把队列中的输出交给接收者；一次取走所有已排队的块，减少线程切换"""
+        finished = False
+        while not finished:
+            batch = []
+            item = await queue.get()
+            while True:
+                if item is None:
+                    finished = True
+                    break
+                batch.extend(item)
+                if queue.empty():
+                    break
+                item = queue.get_nowait()
+            if batch:
+                await self.loop.run_in_executor(self._sink_pool, _call_sinks, sinks, batch)
+
+
+def _call_sinks(sinks, lines):
+    for line in lines:
+        for sink in sinks:
+            try:
+                sink(line)
+            except Exception as e:
+                print(f"处理进程输出失败: {e}")
+
+
+def _call_exit(on_exit, handle):
+    try:
+        on_exit(handle)
+    except Exception as e:
+        print(f"进程结束回调失败: {e}")
+
+
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+
+def get_supervisor():
+    """返回全局进程管理器（第一次使用时启动事件循环线程）"""
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = ProcessSupervisor()
+        return _supervisor
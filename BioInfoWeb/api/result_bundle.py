@@ -0,0 +1,167 @@
+import os
+import json
+import zipfile
+import threading
+
+# ========== 结果打包 ==========
+# zip: 处理过程中逐个文件追加到压缩包，结束时只需写入目录
+# stream: 不生成压缩包，只记录文件清单，下载时边读边压缩直接发送
+RESULT_BUNDLE_MODE = os.getenv('RESULT_BUNDLE_MODE', 'zip')
+RESULT_ZIP_LEVEL = int(os.getenv('RESULT_ZIP_LEVEL', 6))
+
+# 已经压缩过的格式直接存储，再压缩只会浪费CPU
+STORED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst', '.zip', '.pkl', '.npz', '.png', '.jpg', '.jpeg')
+
+# 默认不打包的中间文件
+SKIP_EXTENSIONS = ('.tmp', '.lock', '.swp', '.part')
+SKIP_DIRS = ('tmp', 'temp', '__pycache__', '.parts')
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def compress_type_for(filename):
+    """按文件类型选择压缩方式：已压缩的格式存储，文本等其他文件deflate"""
+    if filename.lower().endswith(STORED_SUFFIXES):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_result_files(directory, skip_extensions=SKIP_EXTENSIONS, skip_dirs=SKIP_DIRS):
+    """按稳定顺序遍历目录中需要打包的文件"""
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d not in skip_dirs)
+        for file in sorted(files):
+            if file.endswith(tuple(skip_extensions)):
+                continue
+            yield os.path.join(root, file)
+
+
+class ResultBundle:
+    """任务结果压缩包，文件生成后立即追加，而不是最后重新遍历整个输出目录
+
+    arcname 为文件相对 root_dir 的路径；同一文件只会加入一次。
+    stream 模式下只记录清单（zip_path + '.manifest'），由下载接口流式生成压缩包。
+    """
+
+    def __init__(self, zip_path, root_dir, mode=None):
+        self.zip_path = zip_path
+        self.root_dir = root_dir
+        self.mode = mode or RESULT_BUNDLE_MODE
+        self.entries = []
+        self._added = set()
+        self._lock = threading.Lock()
+        self._zip = None
+        if self.mode == 'zip':
+            # 写完之前使用临时文件名，下载接口不会拿到不完整的压缩包
+            self._zip = zipfile.ZipFile(self.zip_path + '.part', 'w', allowZip64=True)
+
+    def _arcname(self, file_path):
+        return os.path.relpath(file_path, self.root_dir).replace(os.sep, '/')
+
+    def add(self, file_path, arcname=None):
+        """把一个已经写完的文件加入压缩包"""
+        arcname = arcname or self._arcname(file_path)
+        with self._lock:
+            if arcname in self._added:
+                return
+            self._added.add(arcname)
+            self.entries.append((os.path.abspath(file_path), arcname))
+            if self._zip is not None:
+                self._zip.write(
+                    file_path,
+                    arcname,
+                    compress_type=compress_type_for(arcname),
+                    compresslevel=RESULT_ZIP_LEVEL
+                )
+
+    def add_tree(self, directory=None, skip_extensions=SKIP_EXTENSIONS, skip_dirs=SKIP_DIRS):
+        """加入目录中尚未加入的文件"""
+        for file_path in iter_result_files(directory or self.root_dir, skip_extensions, skip_dirs):
+            self.add(file_path)
+
+    def close(self):
+        """完成打包，返回记录到任务信息中的 output_path"""
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+                os.replace(self.zip_path + '.part', self.zip_path)
+            elif self.mode == 'stream':
+                with open(self.zip_path + '.manifest', 'w') as f:
+                    json.dump(self.entries, f, ensure_ascii=False)
+        return self.zip_path
+
+    def abort(self):
+        """处理失败时丢弃未完成的压缩包"""
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+                try:
+                    os.remove(self.zip_path + '.part')
+                except FileNotFoundError:
+                    pass
+
+
+def is_streamed(zip_path):
+    """结果是否以清单形式保存（下载时流式压缩）"""
+    return bool(zip_path) and not os.path.exists(zip_path) and os.path.exists(zip_path + '.manifest')
+
+
+class _StreamBuffer:
+    """zipfile 的输出目标：不可seek，写入的数据由生成器取走"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+
+def _set_compress_level(info, level):
+    """ZipFile.open(ZipInfo, 'w') 只使用 ZipInfo 上的压缩级别，不使用 ZipFile 的 compresslevel；
+    3.13 起该属性公开为 compress_level，之前的版本只有 _compresslevel"""
+    if hasattr(info, 'compress_level'):
+        info.compress_level = level
+    else:
+        info._compresslevel = level
+
+
+def stream_zip(entries, chunk_size=STREAM_CHUNK_SIZE):
+    """按 [(文件路径, arcname)] 边读边生成zip数据，内存占用与文件大小无关"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True, compresslevel=RESULT_ZIP_LEVEL) as zipf:
+        for file_path, arcname in entries:
+            if not os.path.exists(file_path):
+                continue
+            info = zipfile.ZipInfo.from_file(file_path, arcname)
+            info.compress_type = compress_type_for(arcname)
+            _set_compress_level(info, RESULT_ZIP_LEVEL)
+            with open(file_path, 'rb') as src, zipf.open(info, 'w', force_zip64=True) as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
+
+
+def stream_result_zip(zip_path):
+    """根据清单流式生成任务结果压缩包"""
+    with open(zip_path + '.manifest') as f:
+        entries = json.load(f)
+    return stream_zip(entries)
@@ -0,0 +1,316 @@
+import os
+import time
+import uuid
+import heapq
+import shutil
+import threading
+from datetime import datetime
+
+# ========== 任务结果保留与过期清理 ==========
+# 清理线程维护自己的索引（每种页面一个按结束时间排序的堆），任务结束时登记，
+# 每轮只处理堆顶已过期的任务，不需要遍历 uploads/ 和 processed/ 目录。
+# 只有启动时扫描一次各页面目录的第一层，接管之前运行留下的任务：有任务记录的按记录登记，
+# 没有记录的（例如内存存储重启后）按修改时间登记。
+# RETENTION_KEEP_FILE 中列出的任务ID（仓库中的示例结果）永远不会被清理。
+#   - 过期：结束超过 PAGE_CONFIGS 中 retention_hours 的任务（0 表示永久保留）；
+#   - 高水位：各页面上传/结果目录所在的磁盘（按设备分别计算）有使用率超过 RETENTION_DISK_HIGH_WATERMARK 的，
+#     从该磁盘上的页面中最早结束的任务开始清理，直到低于 RETENTION_DISK_LOW_WATERMARK。
+# 清理一个任务会删除上传目录、结果目录、压缩包和任务记录。
+# 复用结果的任务（reused_from）没有自己的结果文件，被复用的任务要等复用它的任务都清理后才删除。
+RETENTION_SWEEP_INTERVAL = float(os.getenv('RETENTION_SWEEP_INTERVAL', 600))
+RETENTION_DISK_HIGH_WATERMARK = float(os.getenv('RETENTION_DISK_HIGH_WATERMARK', 0.90))
+RETENTION_DISK_LOW_WATERMARK = float(os.getenv('RETENTION_DISK_LOW_WATERMARK', 0.80))
+# 每轮最多清理的任务数，以及每个任务之间的停顿（秒），避免清理占满磁盘IO
+RETENTION_MAX_EVICTIONS = int(os.getenv('RETENTION_MAX_EVICTIONS', 500))
+RETENTION_PAUSE = float(os.getenv('RETENTION_PAUSE', 0.01))
+RETENTION_KEEP_FILE = os.getenv('RETENTION_KEEP_FILE', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'retention_keep.txt'
+))
+
+FINAL_STATUSES = ('completed', 'error')
+
+# 结果目录旁与任务对应的文件
+RESULT_SUFFIXES = ('.zip', '.zip.part', '.zip.manifest')
+
+
+def _timestamp(value):
+    """任务记录中的ISO时间转为时间戳，无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def load_keep_list(path):
+    """读取永久保留的任务ID（每行一个，# 开头为注释），文件不存在时返回空集合"""
+    keep = set()
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    keep.add(line)
+    except FileNotFoundError:
+        pass
+    return keep
+
+
+def _task_id_of(name):
+    """目录项对应的任务ID（任务目录或压缩包），其他文件返回None"""
+    for suffix in RESULT_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    try:
+        uuid.UUID(name)
+    except ValueError:
+        return None
+    return name
+
+
+def task_paths(config, task_id):
+    """任务在磁盘上的所有文件和目录"""
+    paths = [
+        os.path.join(config['upload_dir'], task_id),
+        os.path.join(config['processed_dir'], task_id)
+    ]
+    paths.extend(os.path.join(config['processed_dir'], task_id + suffix) for suffix in RESULT_SUFFIXES)
+    return paths
+
+
+def _remove(path):
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class RetentionJanitor:
+    """后台清理过期任务
+
+    track(task_id, page_type, finished_at, reused_from) 在任务结束（或开始上传）时调用；
+    清理时任务仍在排队或处理中则跳过，等它结束后重新登记。
+    """
+
+    def __init__(self, tasks, page_configs, content_store=None, interval=RETENTION_SWEEP_INTERVAL,
+                 keep_file=RETENTION_KEEP_FILE):
+        self.tasks = tasks
+        self.page_configs = page_configs
+        self.content_store = content_store
+        self.interval = interval
+        self.keep = load_keep_list(keep_file) if keep_file else set()
+        self._heaps = {page_type: [] for page_type in page_configs}
+        self._finished = {}
+        # 被复用的任务ID -> 复用它的结果的任务ID集合
+        self._reused_by = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # ---------- 索引 ----------
+    def track(self, task_id, page_type, finished_at=None, reused_from=None):
+        if page_type not in self._heaps or task_id in self.keep:
+            return
+        finished_at = finished_at or time.time()
+        with self._lock:
+            if reused_from:
+                self._reused_by.setdefault(reused_from, set()).add(task_id)
+            # 重新登记时旧的堆条目保留在堆中，弹出时与索引比较后丢弃
+            self._finished[task_id] = (page_type, finished_at)
+            heapq.heappush(self._heaps[page_type], (finished_at, task_id))
+
+    def tracked(self):
+        with self._lock:
+            return len(self._finished)
+
+    def adopt_existing(self):
+        """启动时登记已结束的任务记录，以及磁盘上没有记录的任务目录（按修改时间）"""
+        cursor = None
+        while True:
+            items, cursor = self.tasks.list_tasks(statuses=list(FINAL_STATUSES), cursor=cursor, limit=200)
+            for task_id, info in items:
+                finished_at = _timestamp(info.get('end_time')) or _timestamp(info.get('start_time'))
+                self.track(task_id, info.get('page_type'), finished_at, info.get('reused_from'))
+            if cursor is None:
+                break
+
+        for page_type, config in self.page_configs.items():
+            for directory in (config['upload_dir'], config['processed_dir']):
+                try:
+                    entries = list(os.scandir(directory))
+                except FileNotFoundError:
+                    continue
+                for entry in entries:
+                    task_id = _task_id_of(entry.name)
+                    if task_id is None or task_id in self._finished or task_id in self.keep:
+                        continue
+                    info = self.tasks.get(task_id)
+                    if info is not None and info.get('status') not in FINAL_STATUSES:
+                        continue
+                    try:
+                        mtime = entry.stat(follow_symlinks=False).st_mtime
+                    except FileNotFoundError:
+                        continue
+                    self.track(task_id, page_type, mtime)
+
+    def _pop_expired(self, page_type, cutoff):
+        """弹出该页面中结束时间早于 cutoff 的一个任务，返回 (task_id, 结束时间)，没有时返回 (None, None)"""
+        heap = self._heaps[page_type]
+        with self._lock:
+            while heap and heap[0][0] < cutoff:
+                finished_at, task_id = heapq.heappop(heap)
+                if self._finished.get(task_id) == (page_type, finished_at):
+                    del self._finished[task_id]
+                    return task_id, finished_at
+        return None, None
+
+    def _pop_oldest(self, page_types=None):
+        """弹出 page_types（默认所有页面）中最早结束的任务，返回 (task_id, page_type, 结束时间)"""
+        with self._lock:
+            while True:
+                tops = [(heap[0], page_type) for page_type, heap in self._heaps.items()
+                        if heap and (page_types is None or page_type in page_types)]
+                if not tops:
+                    return None, None, None
+                (finished_at, task_id), page_type = min(tops)
+                heapq.heappop(self._heaps[page_type])
+                if self._finished.get(task_id) == (page_type, finished_at):
+                    del self._finished[task_id]
+                    return task_id, page_type, finished_at
+
+    def _referrers(self, task_id):
+        """仍然存在的、复用该任务结果的任务"""
+        with self._lock:
+            referrers = set(self._reused_by.get(task_id, ()))
+        alive = {ref for ref in referrers if self.tasks.get(ref) is not None}
+        with self._lock:
+            if alive:
+                self._reused_by[task_id] = alive
+            else:
+                self._reused_by.pop(task_id, None)
+        return alive
+
+    # ---------- 清理 ----------
+    def evict(self, task_id, page_type, finished_at=None):
+        """删除任务的文件和记录，返回是否已删除
+
+        任务仍在进行中，或者还有任务复用它的结果时不删除；复用结果的任务被删除后，
+        如果它是最后一个复用者，被复用的任务以相同的结束时间重新登记，之后按同样的规则清理。
+        """
+        if task_id in self.keep:
+            return False
+        info = self.tasks.get(task_id)
+        if info is not None and info.get('status') not in FINAL_STATUSES:
+            return False
+        if self._referrers(task_id):
+            return False
+        if info is None:
+            print(f"过期清理: 删除没有任务记录的任务文件 {page_type}/{task_id}")
+        for path in task_paths(self.page_configs[page_type], task_id):
+            _remove(path)
+        if info is not None:
+            digest = info.get('input_digest')
+            if digest and self.content_store is not None and self.content_store.find_result(digest) == task_id:
+                self.content_store.forget_result(digest)
+            self.tasks.delete(task_id)
+            original = info.get('reused_from')
+            if original and self.tasks.get(original) is not None and not self._referrers(original):
+                self.track(original, page_type, finished_at)
+        return True
+
+    def page_devices(self):
+        """每个页面的上传目录和结果目录所在的设备，{page_type: {st_dev, ...}}"""
+        devices = {}
+        for page_type, config in self.page_configs.items():
+            devices[page_type] = set()
+            for directory in (config['upload_dir'], config['processed_dir']):
+                try:
+                    devices[page_type].add(os.stat(directory).st_dev)
+                except FileNotFoundError:
+                    continue
+        return devices
+
+    def disk_usage(self):
+        """各设备的磁盘使用率，{st_dev: 使用率}"""
+        usage = {}
+        for config in self.page_configs.values():
+            for directory in (config['upload_dir'], config['processed_dir']):
+                try:
+                    device = os.stat(directory).st_dev
+                    if device not in usage:
+                        total = shutil.disk_usage(directory)
+                        usage[device] = total.used / total.total if total.total else 0.0
+                except FileNotFoundError:
+                    continue
+        return usage
+
+    def sweep(self, now=None):
+        """清理一轮，返回清理的任务数"""
+        now = now or time.time()
+        evicted = 0
+
+        # 1. 过期的任务
+        for page_type, config in self.page_configs.items():
+            hours = config.get('retention_hours')
+            if not hours:
+                continue
+            cutoff = now - hours * 3600
+            while evicted < RETENTION_MAX_EVICTIONS:
+                task_id, finished_at = self._pop_expired(page_type, cutoff)
+                if task_id is None:
+                    break
+                if self.evict(task_id, page_type, finished_at):
+                    evicted += 1
+                    time.sleep(RETENTION_PAUSE)
+
+        # 2. 磁盘超过高水位：只清理文件在这些磁盘上的页面，从最早结束的任务开始
+        usage = self.disk_usage()
+        full = {device for device, used in usage.items() if used > RETENTION_DISK_HIGH_WATERMARK}
+        if full:
+            devices = self.page_devices()
+            while full and evicted < RETENTION_MAX_EVICTIONS:
+                page_types = {page_type for page_type, page_devices in devices.items() if page_devices & full}
+                task_id, page_type, finished_at = self._pop_oldest(page_types)
+                if task_id is None:
+                    print("磁盘使用率超过高水位，但没有可以清理的任务")
+                    break
+                if self.evict(task_id, page_type, finished_at):
+                    evicted += 1
+                    time.sleep(RETENTION_PAUSE)
+                    usage = self.disk_usage()
+                    full = {device for device in full if usage.get(device, 0.0) > RETENTION_DISK_LOW_WATERMARK}
+
+        # 3. 删除任务后不再被引用的上传内容
+        if evicted and self.content_store is not None:
+            self.content_store.prune_orphans()
+        return evicted
+
+    def _run(self):
+        try:
+            # Linux上只降低本线程的CPU优先级
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        try:
+            self.adopt_existing()
+        except Exception as e:
+            print(f"登记已有任务失败: {e}")
+        while True:
+            try:
+                evicted = self.sweep()
+                if evicted:
+                    print(f"过期清理: 删除 {evicted} 个任务")
+            except Exception as e:
+                print(f"过期清理失败: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='retention-janitor', daemon=True)
+            self._thread.start()
+        return self._thread
@@ -0,0 +1,128 @@
+import heapq
+import itertools
+import threading
+import traceback
+
+
+class _Lane:
+    """一个 page_type 的等待队列和工作线程"""
+
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.heap = []
+        self.running = set()
+        self.workers = []
+        self.cond = threading.Condition()
+
+
+class JobScheduler:
+    """按 page_type 分队列的任务调度器
+
+    每个队列有固定数量的工作线程（并发上限），取代每次上传新建一个线程。
+    队列内按优先级（数值大的先执行）排序，同优先级先进先出。
+    排队位置写入任务记录的 queue_position 字段，供 /status 返回。
+    on_finished(task_id) 在每个任务的处理函数返回后调用。
+    """
+
+    def __init__(self, tasks, concurrency, on_finished=None):
+        self.tasks = tasks
+        self.on_finished = on_finished
+        self._lanes = {name: _Lane(name, limit) for name, limit in concurrency.items()}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _lane(self, page_type):
+        with self._lock:
+            lane = self._lanes.get(page_type)
+            if lane is None:
+                lane = self._lanes[page_type] = _Lane(page_type, 1)
+            # 工作线程在第一次提交任务时才启动
+            while len(lane.workers) < lane.concurrency:
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(lane,),
+                    name=f'{page_type}-worker-{len(lane.workers)}',
+                    daemon=True
+                )
+                lane.workers.append(worker)
+                worker.start()
+            return lane
+
+    def submit(self, page_type, task_id, func, args, priority=0):
+        """提交任务，返回提交时的排队位置（1表示下一个执行）"""
+        lane = self._lane(page_type)
+        with lane.cond:
+            heapq.heappush(lane.heap, (-priority, next(self._counter), task_id, func, args))
+            self._publish_positions(lane)
+            lane.cond.notify()
+            return self._position_locked(lane, task_id)
+
+    def _ordered(self, lane):
+        return [entry[2] for entry in sorted(lane.heap)]
+
+    def _position_locked(self, lane, task_id):
+        try:
+            return self._ordered(lane).index(task_id) + 1
+        except ValueError:
+            return None
+
+    def _publish_positions(self, lane):
+        """更新该队列中所有等待任务的排队位置"""
+        for position, task_id in enumerate(self._ordered(lane), start=1):
+            task_info = self.tasks.get(task_id)
+            if task_info is None or task_info.get('queue_position') == position:
+                continue
+            task_info['queue_position'] = position
+            task_info['message'] = f'排队中，前面还有 {position - 1} 个任务'
+
+    def position(self, task_id, page_type):
+        """查询任务当前的排队位置，不在队列中返回None"""
+        lane = self._lanes.get(page_type)
+        if lane is None:
+            return None
+        with lane.cond:
+            return self._position_locked(lane, task_id)
+
+    def stats(self):
+        """各队列的等待数、运行数和并发上限"""
+        result = {}
+        for name, lane in list(self._lanes.items()):
+            with lane.cond:
+                result[name] = {
+                    'queued': len(lane.heap),
+                    'running': len(lane.running),
+                    'concurrency': lane.concurrency
+                }
+        return result
+
+    def _worker_loop(self, lane):
+        while True:
+            with lane.cond:
+                while not lane.heap:
+                    lane.cond.wait()
+                _, _, task_id, func, args = heapq.heappop(lane.heap)
+                lane.running.add(task_id)
+                self._publish_positions(lane)
+
+            task_info = self.tasks.get(task_id)
+            if task_info is not None:
+                task_info['queue_position'] = None
+
+            try:
+                func(*args)
+            except Exception as e:
+                # 处理函数一般自行记录错误，这里兜底保证工作线程不退出
+                if task_info is not None:
+                    task_info['status'] = 'error'
+                    task_info['message'] = f'处理失败: {str(e)}'
+                    task_info['error_details'] = traceback.format_exc()
+            finally:
+                with lane.cond:
+                    lane.running.discard(task_id)
+
+            if self.on_finished is not None:
+                try:
+                    self.on_finished(task_id)
+                except Exception as e:
+                    print(f"任务结束回调失败: {e}")
@@ -0,0 +1,164 @@
+import os
+import time
+import threading
+
+# ========== 任务事件推送 ==========
+# 任务记录被修改时（TaskRecord -> 存储的 mark_dirty）通知事件总线，只记录任务ID；
+# 分发线程每隔 TASK_EVENT_INTERVAL 秒读取这些任务的最新状态，与上次发送的内容比较，
+# 只推送变化的字段。同一间隔内的多次进度更新合并为一次，订阅者总是收到最新值。
+# 状态（status）变化会立即唤醒分发线程。
+TASK_EVENT_INTERVAL = float(os.getenv('TASK_EVENT_INTERVAL', 0.5))
+# 其他进程（多个worker共享SQLite存储）中运行的任务不会通知本进程，按此间隔重新读取
+TASK_EVENT_REFRESH = float(os.getenv('TASK_EVENT_REFRESH', 5))
+# 每个SSE连接最多订阅的任务数
+MAX_SUBSCRIBED_TASKS = 100
+
+FINAL_STATUSES = ('completed', 'error')
+
+
+class Subscription:
+    """一个订阅者（SSE连接）：每个任务只保留最新一条未取走的事件"""
+
+    def __init__(self, task_ids):
+        self.task_ids = set(task_ids)
+        self._events = {}
+        self._cond = threading.Condition()
+
+    def put(self, task_id, event):
+        with self._cond:
+            pending = self._events.get(task_id)
+            # 未取走的旧事件与新事件合并，订阅者不会丢失中间变化过的字段
+            self._events[task_id] = dict(pending, **event) if pending else event
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """等待并取走所有未发送的事件，超时返回空列表"""
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            events, self._events = list(self._events.values()), {}
+        return events
+
+
+class TaskEventBus:
+    """任务状态事件总线
+
+    - notify(task_id, key)：存储在记录被修改时调用；
+    - subscribe(task_ids)：SSE连接订阅一组任务，返回 Subscription；
+    - add_listener(callback)：callback(task_id, event) 接收所有任务的事件（Socket.IO按房间转发）。
+    事件为 {'id': 任务ID, 变化的字段...}，第一次发送时包含完整记录。
+    """
+
+    def __init__(self, tasks, interval=TASK_EVENT_INTERVAL, refresh=TASK_EVENT_REFRESH):
+        self.tasks = tasks
+        self.interval = interval
+        self.refresh = refresh
+        self._dirty = set()
+        self._sent = {}
+        self._subscriptions = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        dispatcher.start()
+
+    # ---------- 生产者 ----------
+    def notify(self, task_id, key):
+        with self._lock:
+            self._dirty.add(task_id)
+        if key == 'status':
+            self._wakeup.set()
+
+    # ---------- 订阅者 ----------
+    def add_listener(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def subscribe(self, task_ids):
+        """订阅任务，当前状态作为第一条事件立即可取"""
+        subscription = Subscription(list(task_ids)[:MAX_SUBSCRIBED_TASKS])
+        for task_id in subscription.task_ids:
+            snapshot = self.snapshot(task_id)
+            if snapshot is not None:
+                subscription.put(task_id, snapshot)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def snapshot(self, task_id):
+        """任务的完整记录（事件格式），任务不存在时返回None"""
+        record = self.tasks.get(task_id)
+        if record is None:
+            return None
+        return dict(record, id=task_id)
+
+    # ---------- 分发 ----------
+    def _changes(self, task_id):
+        """与上次发送的记录比较，返回变化的字段；没有变化时返回None"""
+        record = self.tasks.get(task_id)
+        if record is None:
+            return None
+        # 复制一份再比较，处理线程可能同时在修改记录
+        current = dict(record)
+        previous = self._sent.get(task_id, {})
+        changes = {key: value for key, value in current.items() if previous.get(key) != value}
+        if not changes:
+            return None
+        self._sent[task_id] = current
+        changes['id'] = task_id
+        changes.setdefault('status', current.get('status'))
+        return changes
+
+    def dispatch(self):
+        """发送一轮合并后的事件"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            subscriptions = list(self._subscriptions)
+            listeners = list(self._listeners)
+        if not listeners:
+            # 没有全局监听者时只处理有订阅者的任务
+            watched = set().union(*(s.task_ids for s in subscriptions)) if subscriptions else set()
+            dirty &= watched
+        for task_id in dirty:
+            event = self._changes(task_id)
+            if event is None:
+                continue
+            for subscription in subscriptions:
+                if task_id in subscription.task_ids:
+                    subscription.put(task_id, event)
+            for listener in listeners:
+                try:
+                    listener(task_id, event)
+                except Exception as e:
+                    print(f"任务事件推送失败: {e}")
+
+    def _refresh_subscribed(self):
+        """重新检查所有被订阅的任务（其他进程中的任务没有修改通知），
+        并丢弃已结束且无人订阅的任务的比较用副本"""
+        with self._lock:
+            watched = set()
+            for subscription in self._subscriptions:
+                watched.update(subscription.task_ids)
+            self._dirty.update(watched)
+        for task_id, sent in list(self._sent.items()):
+            if task_id not in watched and sent.get('status') in FINAL_STATUSES:
+                self._sent.pop(task_id, None)
+
+    def _dispatch_loop(self):
+        last_refresh = time.monotonic()
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if time.monotonic() - last_refresh >= self.refresh:
+                self._refresh_subscribed()
+                last_refresh = time.monotonic()
+            try:
+                self.dispatch()
+            except Exception as e:
+                print(f"任务事件分发失败: {e}")
+            # 状态频繁变化时也限制推送频率
+            time.sleep(min(self.interval, 0.1))
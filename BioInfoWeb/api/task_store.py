@@ -0,0 +1,575 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import atexit
+import bisect
+import threading
+from collections import OrderedDict
+
+# 进程已退出但仍处于这些状态的任务视为被中断
+ACTIVE_STATUSES = ('pending', 'processing')
+
+# 任务列表每页的默认和最大条数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _index_keys(page_type, status):
+    """任务所在的列表索引：(页面类型, 状态)，None 表示不按该字段筛选"""
+    return {(None, None), (page_type, None), (None, status), (page_type, status)}
+
+
+class TaskRecord(dict):
+    """任务记录：对字段的修改会通知所属的存储
+
+    处理函数仍然按普通字典使用 tasks[task_id]['progress'] = ...，
+    存储据此决定何时把记录写入持久化后端。
+    """
+
+    def __init__(self, store, task_id, data):
+        super().__init__(data)
+        self._store = store
+        self._task_id = task_id
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._store.mark_dirty(self._task_id, key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._store.mark_dirty(self._task_id, key)
+
+    def update(self, *args, **kwargs):
+        changes = dict(*args, **kwargs)
+        super().update(changes)
+        for key in changes:
+            self._store.mark_dirty(self._task_id, key)
+
+    def pop(self, key, *default):
+        value = super().pop(key, *default)
+        self._store.mark_dirty(self._task_id, key)
+        return value
+
+
+class MemoryTaskStore:
+    """进程内任务存储（默认），行为与原来的全局 tasks 字典一致
+
+    列表查询使用的索引：
+    - 任务按创建顺序编号（seq），创建时间随编号单调递增，时间范围可以换算成编号范围；
+    - 每个 (页面类型, 状态) 组合（含不筛选的情况）维护一个有序的编号列表，
+      状态变化时在列表之间移动，分页只需二分查找加切片；
+    - 每次修改递增存储的修订号，按最后修改的顺序记录任务，供 since 增量查询。
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._lock = threading.RLock()
+        self._observers = []
+        self._seq_of = {}
+        self._task_at = {}
+        self._created = []
+        self._index = {}
+        self._indexed_as = {}
+        self._revision = 0
+        self._changes = OrderedDict()
+
+    # ---------- 字典接口（供处理函数使用） ----------
+    def __getitem__(self, task_id):
+        record = self.get(task_id)
+        if record is None:
+            raise KeyError(task_id)
+        return record
+
+    def __setitem__(self, task_id, info):
+        self.create(task_id, info)
+
+    def __contains__(self, task_id):
+        return self.get(task_id) is not None
+
+    def get(self, task_id, default=None):
+        return self._tasks.get(task_id, default)
+
+    def items(self):
+        with self._lock:
+            return list(self._tasks.items())
+
+    # ---------- 存储接口 ----------
+    def create(self, task_id, info, job=None):
+        """创建任务记录；job 为重新执行任务所需的参数（仅持久化存储使用）"""
+        record = TaskRecord(self, task_id, info)
+        with self._lock:
+            self._tasks[task_id] = record
+            if task_id not in self._seq_of:
+                seq = len(self._created) + 1
+                # 系统时间回拨时保持单调，时间范围才能换算成编号范围
+                self._created.append(max(time.time(), self._created[-1] if self._created else 0))
+                self._seq_of[task_id] = seq
+                self._task_at[seq] = task_id
+        self.mark_dirty(task_id, 'status')
+        return record
+
+    # ---------- 索引 ----------
+    def _reindex(self, task_id):
+        """页面类型或状态变化后把任务移到对应的列表索引"""
+        record = self._tasks.get(task_id)
+        seq = self._seq_of.get(task_id)
+        if record is None or seq is None:
+            return
+        current = (record.get('page_type'), record.get('status'))
+        previous = self._indexed_as.get(task_id)
+        if previous == current:
+            return
+        old_keys = _index_keys(*previous) if previous else set()
+        new_keys = _index_keys(*current)
+        for key in old_keys - new_keys:
+            seqs = self._index[key]
+            position = bisect.bisect_left(seqs, seq)
+            if position < len(seqs) and seqs[position] == seq:
+                del seqs[position]
+        for key in new_keys - old_keys:
+            bisect.insort(self._index.setdefault(key, []), seq)
+        self._indexed_as[task_id] = current
+
+    def _seq_bound(self, timestamp):
+        """创建时间不早于 timestamp 的第一个任务编号"""
+        return bisect.bisect_left(self._created, timestamp) + 1
+
+    @property
+    def revision(self):
+        return self._revision
+
+    def list_tasks(self, page_type=None, statuses=None, created_after=None, created_before=None,
+                   cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """按创建时间从新到旧分页列出任务
+
+        statuses 为状态列表（None 表示全部），时间为Unix时间戳；
+        cursor 为上一页返回的 next_cursor。返回 ([(task_id, 记录)], next_cursor)，没有更多时 next_cursor 为None。
+        """
+        with self._lock:
+            candidates, remaining = [], 0
+            for status in statuses or [None]:
+                seqs = self._index.get((page_type, status), [])
+                hi = len(seqs) if cursor is None else bisect.bisect_left(seqs, cursor)
+                if created_before is not None:
+                    hi = min(hi, bisect.bisect_left(seqs, self._seq_bound(created_before)))
+                lo = bisect.bisect_left(seqs, self._seq_bound(created_after)) if created_after is not None else 0
+                # 每个索引最多取 limit 条，合并后再截取，代价与页大小成正比
+                candidates.extend(seqs[max(lo, hi - limit):hi])
+                remaining += max(0, hi - lo)
+            page = sorted(candidates, reverse=True)[:limit]
+            items = [(self._task_at[seq], self._tasks[self._task_at[seq]]) for seq in page]
+        next_cursor = page[-1] if remaining > len(page) else None
+        return items, next_cursor
+
+    def changes_since(self, revision, limit=DEFAULT_PAGE_SIZE):
+        """修订号 revision 之后修改过的任务（按修改顺序）
+
+        返回 ([(task_id, 记录)], 新的修订号, 是否还有更多)；客户端下次用新的修订号查询。
+        """
+        with self._lock:
+            changed = []
+            for task_id in reversed(self._changes):
+                task_revision = self._changes[task_id]
+                if task_revision <= revision:
+                    break
+                changed.append((task_revision, task_id))
+            changed.reverse()
+            page = changed[:limit]
+            items = [(task_id, self._tasks[task_id]) for _, task_id in page]
+            has_more = len(changed) > limit
+            next_revision = page[-1][0] if has_more else self._revision
+        return items, next_revision, has_more
+
+    def delete(self, task_id):
+        """删除任务记录及其索引（过期清理使用），返回记录是否存在"""
+        with self._lock:
+            record = self._tasks.pop(task_id, None)
+            seq = self._seq_of.pop(task_id, None)
+            indexed_as = self._indexed_as.pop(task_id, None)
+            if seq is not None:
+                # 创建时间列表按编号定位，只保留一个时间戳，不删除
+                self._task_at.pop(seq, None)
+                for key in _index_keys(*indexed_as) if indexed_as else ():
+                    seqs = self._index.get(key, [])
+                    position = bisect.bisect_left(seqs, seq)
+                    if position < len(seqs) and seqs[position] == seq:
+                        del seqs[position]
+            self._changes.pop(task_id, None)
+        return record is not None
+
+    def get_many(self, task_ids):
+        """批量读取任务，返回 {task_id: 记录}（不存在的任务不包含在内）"""
+        result = {}
+        for task_id in task_ids:
+            record = self.get(task_id)
+            if record is not None:
+                result[task_id] = record
+        return result
+
+    def add_observer(self, callback):
+        """callback(task_id, key) 在记录被修改时调用（任务事件推送使用）"""
+        self._observers.append(callback)
+
+    def _notify(self, task_id, key):
+        for callback in self._observers:
+            callback(task_id, key)
+
+    def mark_dirty(self, task_id, key):
+        """记录被修改时调用：更新修订号和列表索引，并通知观察者"""
+        self._touch(task_id, key)
+        self._notify(task_id, key)
+
+    def _touch(self, task_id, key):
+        with self._lock:
+            if task_id not in self._tasks:
+                return
+            self._revision += 1
+            self._changes[task_id] = self._revision
+            self._changes.move_to_end(task_id)
+            if key in ('status', 'page_type'):
+                self._reindex(task_id)
+
+    def flush(self):
+        """把未写入的修改写入后端，内存存储不需要处理"""
+
+    def recover_interrupted(self):
+        """返回上次运行中断的任务 [(task_id, job)]，内存存储没有持久化数据"""
+        return []
+
+
+class SQLiteTaskStore(MemoryTaskStore):
+    """SQLite（WAL模式）持久化任务存储，可在多个gunicorn worker之间共享
+
+    - 本进程创建的任务保存在内存中，由处理线程直接修改；
+    - 修改先记入脏集合，由后台线程按 flush_interval 批量写入，
+      状态变化（status 字段）会立即唤醒写入线程；
+    - 其他进程创建的任务从数据库读取。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id TEXT PRIMARY KEY,
+        page_type TEXT,
+        status TEXT,
+        owner TEXT,
+        data TEXT NOT NULL,
+        job TEXT,
+        updated_at REAL NOT NULL,
+        created_at REAL,
+        revision INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS tasks_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        revision INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO tasks_meta (id, revision) VALUES (1, 0);
+    """
+
+    # 列表查询的索引（每个索引隐含rowid，即创建顺序，ORDER BY rowid 可以直接按索引顺序读取）
+    INDEX_SCHEMA = """
+    CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+    CREATE INDEX IF NOT EXISTS idx_tasks_page_type ON tasks (page_type, status);
+    CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at);
+    CREATE INDEX IF NOT EXISTS idx_tasks_revision ON tasks (revision);
+    """
+
+    # 旧版本数据库缺少的列
+    MIGRATIONS = (
+        ('created_at', 'ALTER TABLE tasks ADD COLUMN created_at REAL'),
+        ('revision', 'ALTER TABLE tasks ADD COLUMN revision INTEGER NOT NULL DEFAULT 0'),
+    )
+
+    UPSERT_SQL = """
+    INSERT INTO tasks (id, page_type, status, owner, data, job, updated_at, created_at, revision)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        page_type = excluded.page_type,
+        status = excluded.status,
+        owner = excluded.owner,
+        data = excluded.data,
+        job = COALESCE(excluded.job, tasks.job),
+        updated_at = excluded.updated_at,
+        revision = excluded.revision
+    """
+
+    def __init__(self, db_path, flush_interval=1.0):
+        super().__init__()
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._local = threading.local()
+        self._dirty = set()
+        self._jobs = {}
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(tasks)')}
+        for column, sql in self.MIGRATIONS:
+            if column not in columns:
+                conn.execute(sql)
+                if column == 'created_at':
+                    conn.execute('UPDATE tasks SET created_at = updated_at WHERE created_at IS NULL')
+        conn.executescript(self.INDEX_SCHEMA)
+
+        flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        flusher.start()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # ---------- 读取 ----------
+    def _load(self, task_id):
+        row = self._connect().execute('SELECT data FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, task_id, default=None):
+        record = self._tasks.get(task_id)
+        if record is not None:
+            return record
+        data = self._load(task_id)
+        return data if data is not None else default
+
+    def items(self):
+        rows = self._connect().execute('SELECT id, data FROM tasks ORDER BY updated_at').fetchall()
+        merged = {task_id: json.loads(data) for task_id, data in rows}
+        with self._lock:
+            merged.update(self._tasks)
+        return list(merged.items())
+
+    def _fresh(self, rows):
+        """数据库中的记录替换为本进程内存中的最新记录"""
+        items = []
+        for task_id, data in rows:
+            record = self._tasks.get(task_id)
+            items.append((task_id, record if record is not None else json.loads(data)))
+        return items
+
+    @property
+    def revision(self):
+        self.flush()
+        return self._connect().execute('SELECT revision FROM tasks_meta WHERE id = 1').fetchone()[0]
+
+    def list_tasks(self, page_type=None, statuses=None, created_after=None, created_before=None,
+                   cursor=None, limit=DEFAULT_PAGE_SIZE):
+        # 先写入未保存的修改，列表与数据库一致
+        self.flush()
+        conn = self._connect()
+        rows = []
+        # 多个状态分别按索引取一页再合并，避免对所有匹配的记录排序
+        for status in statuses or [None]:
+            where, args = [], []
+            if page_type is not None:
+                where.append('page_type = ?')
+                args.append(page_type)
+            if status is not None:
+                where.append('status = ?')
+                args.append(status)
+            if created_after is not None:
+                where.append('created_at >= ?')
+                args.append(created_after)
+            if created_before is not None:
+                where.append('created_at < ?')
+                args.append(created_before)
+            if cursor is not None:
+                where.append('rowid < ?')
+                args.append(cursor)
+            sql = 'SELECT rowid, id, data FROM tasks'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += ' ORDER BY rowid DESC LIMIT ?'
+            rows.extend(conn.execute(sql, args + [limit + 1]).fetchall())
+        rows.sort(reverse=True)
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return self._fresh((task_id, data) for _, task_id, data in rows[:limit]), next_cursor
+
+    def changes_since(self, revision, limit=DEFAULT_PAGE_SIZE):
+        self.flush()
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT revision, id, data FROM tasks WHERE revision > ? ORDER BY revision LIMIT ?',
+            (revision, limit + 1)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if has_more:
+            next_revision = rows[-1][0]
+        else:
+            next_revision = conn.execute('SELECT revision FROM tasks_meta WHERE id = 1').fetchone()[0]
+        return self._fresh((task_id, data) for _, task_id, data in rows), next_revision, has_more
+
+    def delete(self, task_id):
+        # 与写入互斥，避免写入线程把已删除的记录重新写回
+        with self._flush_lock:
+            existed = super().delete(task_id)
+            with self._lock:
+                self._dirty.discard(task_id)
+                self._jobs.pop(task_id, None)
+            deleted = self._connect().execute('DELETE FROM tasks WHERE id = ?', (task_id,)).rowcount
+        return existed or deleted > 0
+
+    def get_many(self, task_ids):
+        result = {}
+        missing = []
+        with self._lock:
+            for task_id in task_ids:
+                record = self._tasks.get(task_id)
+                if record is not None:
+                    result[task_id] = record
+                else:
+                    missing.append(task_id)
+        if missing:
+            rows = self._connect().execute(
+                f'SELECT id, data FROM tasks WHERE id IN ({", ".join("?" * len(missing))})',
+                missing
+            ).fetchall()
+            result.update((task_id, json.loads(data)) for task_id, data in rows)
+        return result
+
+    # ---------- 写入 ----------
+    def create(self, task_id, info, job=None):
+        if job is not None:
+            self._jobs[task_id] = job
+        return super().create(task_id, info, job)
+
+    def mark_dirty(self, task_id, key):
+        with self._lock:
+            self._dirty.add(task_id)
+        if key == 'status':
+            self._wakeup.set()
+        self._notify(task_id, key)
+
+    def flush(self):
+        # 写入线程和请求线程（列表查询）都会调用，同时只有一个写入，旧数据不会覆盖新数据
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            jobs, self._jobs = self._jobs, {}
+            rows = []
+            now = time.time()
+            # 按创建顺序写入，新记录的rowid与创建顺序一致（列表按rowid分页）
+            for task_id in sorted(dirty, key=lambda t: self._seq_of.get(t, 0)):
+                record = self._tasks.get(task_id)
+                if record is None:
+                    continue
+                seq = self._seq_of.get(task_id)
+                # 先复制一份，处理线程可能同时在修改记录
+                data = dict(record)
+                job = jobs.get(task_id)
+                rows.append((
+                    task_id,
+                    data.get('page_type'),
+                    data.get('status'),
+                    self.owner,
+                    json.dumps(data, ensure_ascii=False, default=str),
+                    json.dumps(job) if job is not None else None,
+                    now,
+                    self._created[seq - 1] if seq else now
+                ))
+            # 没有赶上本次写入的任务参数留到下次
+            self._jobs.update((t, j) for t, j in jobs.items() if t not in dirty)
+
+        if not rows:
+            return
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 每条写入的记录分配新的修订号（写锁保证多个进程之间递增）
+            revision = conn.execute('SELECT revision FROM tasks_meta WHERE id = 1').fetchone()[0]
+            conn.executemany(self.UPSERT_SQL, [
+                row + (revision + offset,) for offset, row in enumerate(rows, start=1)
+            ])
+            conn.execute('UPDATE tasks_meta SET revision = ? WHERE id = 1', (revision + len(rows),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            with self._lock:
+                self._dirty.update(row[0] for row in rows)
+                self._jobs.update((t, j) for t, j in jobs.items() if t in dirty)
+            raise
+
+    def _flush_loop(self):
+        """后台批量写入：按间隔合并多次进度更新，状态变化时提前写入"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"任务状态写入失败: {e}")
+            # 限制写入频率，避免进度更新变成写入风暴
+            time.sleep(min(self.flush_interval, 0.2))
+
+    # ---------- 重启恢复 ----------
+    def _owner_alive(self, owner):
+        if not owner:
+            return False
+        host, _, pid = owner.rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit():
+            # 其他主机上的进程无法判断，保守地认为仍在运行
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def recover_interrupted(self):
+        """接管上次运行中断（所属进程已退出）的任务，返回 [(task_id, job)]
+
+        接管使用 owner 字段做比较交换，多个worker同时启动时每个任务只会被接管一次。
+        """
+        conn = self._connect()
+        placeholders = ', '.join('?' * len(ACTIVE_STATUSES))
+        rows = conn.execute(
+            f'SELECT id, owner, data, job FROM tasks WHERE status IN ({placeholders}) AND job IS NOT NULL',
+            ACTIVE_STATUSES
+        ).fetchall()
+
+        recovered = []
+        for task_id, owner, data, job in rows:
+            if owner == self.owner or self._owner_alive(owner):
+                continue
+            claimed = conn.execute(
+                'UPDATE tasks SET owner = ?, updated_at = ? WHERE id = ? AND owner = ?',
+                (self.owner, time.time(), task_id, owner)
+            ).rowcount
+            if not claimed:
+                continue
+
+            info = json.loads(data)
+            info['status'] = 'pending'
+            info['message'] = '服务重启，任务重新排队...'
+            with self._lock:
+                self._tasks[task_id] = TaskRecord(self, task_id, info)
+            self.mark_dirty(task_id, 'status')
+            recovered.append((task_id, json.loads(job)))
+        return recovered
+
+
+def create_task_store(config):
+    """根据配置创建任务存储：TASK_STORE = memory | sqlite"""
+    backend = config.get('TASK_STORE', 'memory')
+    if backend == 'sqlite':
+        return SQLiteTaskStore(
+            config['TASK_DB_PATH'],
+            flush_interval=config.get('TASK_FLUSH_INTERVAL', 1.0)
+        )
+    return MemoryTaskStore()
@@ -1,11 +1,12 @@
 import os
 import json
-import zipfile
 from datetime import datetime
+from api.result_bundle import ResultBundle
 
 # ========== TEST页面处理函数 ==========
 def process_test_files(task_id, files, output_dir, tasks, zip_path):
     """Test页面的文件处理逻辑"""
+    bundle = None
     try:
         task_info = tasks[task_id]
         task_info['status'] = 'processing'
@@ -16,6 +17,9 @@ def process_test_files(task_id, files, output_dir, tasks, zip_path):
         processed_files_dir = os.path.join(output_dir, 'test_results')
         os.makedirs(processed_files_dir, exist_ok=True)
         
+        # 结果文件写完即加入压缩包
+        bundle = ResultBundle(zip_path, output_dir)
+        
         results = []
         
         # 2. 处理每个文件（示例：文本分析）
@@ -39,6 +43,7 @@ def process_test_files(task_id, files, output_dir, tasks, zip_path):
             stats_file = os.path.join(processed_files_dir, f'{filename}_stats.json')
             with open(stats_file, 'w') as f:
                 json.dump(stats, f, indent=2)
+            bundle.add(stats_file)
             
             results.append(stats)
             
@@ -61,22 +66,18 @@ def process_test_files(task_id, files, output_dir, tasks, zip_path):
                 f.write(f"  大小: {r['size']} bytes\n")
                 f.write(f"  行数: {r['lines']}\n")
                 f.write(f"  单词数: {r['words']}\n")
+        bundle.add(summary_file)
         
         task_info['progress'] = 95
-        task_info['message'] = '正在创建压缩包...'
+        task_info['message'] = '正在完成压缩包...'
         
-        # 4. 创建压缩包
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(output_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, output_dir)
-                    zipf.write(file_path, arcname)
+        # 4. 完成压缩包（文件已在生成时加入）
+        output_path = bundle.close()
         
         task_info['progress'] = 100
         task_info['status'] = 'completed'
         task_info['download_url'] = f'/download/{task_id}?page_type=test'
-        task_info['output_path'] = zip_path
+        task_info['output_path'] = output_path
         task_info['message'] = '处理完成！'
         task_info['summary'] = {
             'total_files': len(files),
@@ -85,6 +86,8 @@ def process_test_files(task_id, files, output_dir, tasks, zip_path):
         }
         
     except Exception as e:
+        if bundle is not None:
+            bundle.abort()
         task_info['status'] = 'error'
         task_info['message'] = f'处理失败: {str(e)}'
         import traceback
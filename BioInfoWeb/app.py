@@ -1,13 +1,26 @@
 # app.py - 修复版本
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response
 from sqlalchemy import create_engine, text
 from config.config import Config
-from flask_socketio import SocketIO
-import subprocess
+from config.catalog_cache import CatalogSnapshot
+from config.catalog_search import CatalogSearchIndex
+from flask_socketio import SocketIO, join_room, leave_room
+import os
 import threading
+import multiprocessing
 from api.test import process_test_files
-from api.RNAfold import process_rnafold_files
+from api.RNAfold import process_rnafold_files, parse_rnafold_params
 from api.alphafold3 import process_alphafold_files
+from api.alphafold_batch import ALPHAFOLD_BATCH_ENABLED, ALPHAFOLD_BATCH_MAX_TASKS
+from api.task_store import create_task_store, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from api.scheduler import JobScheduler
+from api.task_events import TaskEventBus, MAX_SUBSCRIBED_TASKS
+from api.chunked_upload import UploadError, create_upload, load_upload, list_uploads, append_chunk, completed_files
+from api.content_store import ContentStore
+from api.retention import RetentionJanitor
+from api.log_tail import LogTail, LOG_TAIL_KEEP_BYTES
+from api.process_supervisor import get_supervisor
+from api.result_bundle import is_streamed, stream_result_zip, iter_result_files, SKIP_EXTENSIONS, SKIP_DIRS
 
 app = Flask(__name__)
 app.config.from_object(Config())
@@ -18,48 +31,50 @@ engine = create_engine(
     echo=False
 )
 
+## 软件目录快照（数据版本变化时才重建）
+catalog = CatalogSnapshot(engine, check_interval=app.config['CATALOG_CHECK_INTERVAL'])
+
+## 全文检索索引，随快照重建增量同步
+search_index = CatalogSearchIndex()
+catalog.add_listener(lambda state: search_index.sync(state['rows']))
+
 @app.route('/')
 def index():
     """主页面"""
     return render_template('index.html')
 
+def conditional_json_response(variants, etag):
+    """返回带强ETag的预编码JSON响应
+
+    variants 为 {Content-Encoding: 响应体}，按 Accept-Encoding 选择；
+    If-None-Match 命中本次选中编码的ETag时返回304（304中的ETag与客户端缓存的一致）。
+    """
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in variants and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+
+    # 不同编码的表示需要不同的强ETag
+    tags = {e: etag if e == 'identity' else f'{etag}-{e}' for e in variants}
+    if request.if_none_match.contains_weak(tags[encoding]):
+        response = Response(status=304)
+    else:
+        response = Response(variants[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(tags[encoding])
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/get_software_data')
 def get_software_data():
-    """API端点：从数据库获取软件数据并构建树形结构"""
+    """API端点：返回内存快照中预先序列化好的树形结构"""
     try:
-        with engine.connect() as connection:
-            # 查询所有数据
-            query = text("""
-                SELECT category, subcategory, name, features, url, doi
-                FROM bioinfo_software
-                ORDER BY category, subcategory, name
-            """)
-            
-            result = connection.execute(query)
-            rows = result.fetchall()
-            
-            # 转换为树形结构
-            data_tree = {}
-            for row in rows:
-                # 处理行数据的格式
-                if hasattr(row, '_mapping'):
-                    category = row._mapping['category']
-                    subcategory = row._mapping['subcategory'] if row._mapping['subcategory'] else '其他'
-                    name = row._mapping['name']
-                else:
-                    # 如果是元组格式
-                    category = row[0]
-                    subcategory = row[1] if row[1] else '其他'
-                    name = row[2]
-                
-                if category not in data_tree:
-                    data_tree[category] = {}
-                if subcategory not in data_tree[category]:
-                    data_tree[category][subcategory] = []
-                
-                data_tree[category][subcategory].append(name)
-            
-            return jsonify(data_tree)
+        snapshot = catalog.get()
+        return conditional_json_response(snapshot['tree_variants'], snapshot['tree_etag'])
             
     except Exception as e:
         app.logger.error(f"API错误: {e}")
@@ -67,99 +82,119 @@ def get_software_data():
 
 @app.route('/api/get_software_details')
 def get_software_details():
-    """获取软件的详细信息"""
+    """获取软件的详细信息（从目录快照读取）"""
     try:
         name = request.args.get('name', '')
         if not name:
             return jsonify({'error': '需要软件名称参数'}), 400
         
-        with engine.connect() as connection:
-            query = text("""
-                SELECT category, subcategory, name, features, url, doi
-                FROM bioinfo_software
-                WHERE name = :name
-            """)
-            
-            result = connection.execute(query, {'name': name})
-            row = result.fetchone()
-            
-            if not row:
-                return jsonify({'error': '未找到该软件'}), 404
-            
-            # 转换为字典
-            if hasattr(row, '_mapping'):
-                data = dict(row._mapping)
-            else:
-                data = {
-                    'category': row[0],
-                    'subcategory': row[1],
-                    'name': row[2],
-                    'features': row[3],
-                    'url': row[4],
-                    'doi': row[5]
-                }
-            
-            return jsonify(data)
+        details = catalog.get_details(name)
+        if details is None:
+            return jsonify({'error': '未找到该软件'}), 404
+        
+        body, etag = details
+        return conditional_json_response({'identity': body}, etag)
             
     except Exception as e:
         app.logger.error(f"详情查询失败: {e}")
         return jsonify({'error': '查询失败'}), 500
     
+MAX_BATCH_NAMES = 500
+
+@app.route('/api/get_software_details_batch', methods=['GET', 'POST'])
+def get_software_details_batch():
+    """批量获取软件详情
+
+    - GET  ?names=A&names=B：按名称批量查询
+    - GET  ?category=X[&subcategory=Y]：预取整个大类/子类的详情
+    - POST {"names": [...]}：名称较多时使用
+    返回 {"details": {name: 详情}, "missing": [未找到的名称]}
+    """
+    try:
+        category = request.args.get('category')
+        if category:
+            group = catalog.get_group_details(category, request.args.get('subcategory') or None)
+            if group is None:
+                return jsonify({'error': '未找到该分类'}), 404
+            body, etag = group
+            return conditional_json_response({'identity': body}, etag)
+        
+        if request.method == 'POST':
+            payload = request.get_json(silent=True) or {}
+            names = payload.get('names', [])
+            if not isinstance(names, list):
+                return jsonify({'error': 'names 必须是列表'}), 400
+        else:
+            names = request.args.getlist('names')
+        
+        names = list(dict.fromkeys(str(n) for n in names if n))
+        if not names:
+            return jsonify({'error': '需要 names 或 category 参数'}), 400
+        if len(names) > MAX_BATCH_NAMES:
+            return jsonify({'error': f'一次最多查询 {MAX_BATCH_NAMES} 个软件'}), 400
+        
+        records, missing = catalog.get_many_details(names)
+        return jsonify({'details': records, 'missing': missing})
+    
+    except Exception as e:
+        app.logger.error(f"批量详情查询失败: {e}")
+        return jsonify({'error': '查询失败'}), 500
+
+@app.route('/api/search')
+def search_software():
+    """全文检索：名称、分类、功能特点、DOI和链接，支持前缀和子串匹配"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': '需要查询参数 q'}), 400
+    
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'limit 必须是整数'}), 400
+    
+    try:
+        # 确保索引与最新快照一致
+        catalog.get()
+        total, results = search_index.search(query, limit=limit)
+        return jsonify({
+            'query': query,
+            'total': total,
+            'results': results
+        })
+    
+    except Exception as e:
+        app.logger.error(f"检索失败: {e}")
+        return jsonify({'error': '检索失败'}), 500
+    
 ## Terminal
 socketio = SocketIO(app)
 
+# 终端命令的运行时限（秒）
+TERMINAL_COMMAND_TIMEOUT = float(os.getenv('TERMINAL_COMMAND_TIMEOUT', 60))
+
 ALLOWED_COMMANDS = {'pwd': ['pwd'], 'ls': ['ls', '-la'], 'date': ['date'], 'nvidia-smi': ['nvidia-smi'], "AFoutput": ['ls', './processed/alphafold']}
 
 def execute_long_command(command_key, sid):
-    """在后台线程中执行命令，并实时推送输出"""
-    if command_key[:8] == "YXMMGSWS":
-        try:
-            proc = subprocess.Popen(['cat', f'/home/abc/course/bio3514/project/Project/BioInfoWeb/processed/alphafold/{command_key[8:]}/alphafold_docker.log'],
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT,
-                                    text=True,
-                                    bufsize=1,  # 行缓冲
-                                    shell=False)
-
-            # 实时读取输出并推送
-            for line in iter(proc.stdout.readline, ''):
-                if line:
-                    socketio.emit('command_output', {'data': line}, room=sid)
-
-            proc.stdout.close()
-            return_code = proc.wait(timeout=2)
-            if return_code != 0:
-                socketio.emit('command_output', {'data': f"\n命令结束，返回值: {return_code}"}, room=sid)
-
-            return
-
-        except Exception as e:
-            socketio.emit('command_output', {'data': f"执行异常: {str(e)}"}, room=sid)
-
+    """由进程管理器执行命令（不占用线程），并实时推送输出"""
     if command_key not in ALLOWED_COMMANDS:
         socketio.emit('command_output', {'data': f"错误: 命令 '{command_key}' 未被允许。"}, room=sid)
         return
 
-    try:
-        proc = subprocess.Popen(ALLOWED_COMMANDS[command_key],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT,
-                                text=True,
-                                bufsize=1,  # 行缓冲
-                                shell=False)
-
-        # 实时读取输出并推送
-        for line in iter(proc.stdout.readline, ''):
-            if line:
-                socketio.emit('command_output', {'data': line}, room=sid)
-
-        proc.stdout.close()
-        return_code = proc.wait(timeout=2)
-        if return_code != 0:
-            socketio.emit('command_output', {'data': f"\n命令结束，返回值: {return_code}"}, room=sid)
+    def on_line(line):
+        socketio.emit('command_output', {'data': line}, room=sid)
 
-    except Exception as e:
-        socketio.emit('command_output', {'data': f"执行异常: {str(e)}"}, room=sid)
+    def on_exit(handle):
+        if handle.error is not None:
+            socketio.emit('command_output', {'data': f"执行异常: {str(handle.error)}"}, room=sid)
+        elif handle.timed_out:
+            socketio.emit('command_output', {'data': f"\n命令超过 {TERMINAL_COMMAND_TIMEOUT} 秒，已终止"}, room=sid)
+        elif handle.cancelled:
+            socketio.emit('command_output', {'data': "\n命令已中止"}, room=sid)
+        elif handle.returncode != 0:
+            socketio.emit('command_output', {'data': f"\n命令结束，返回值: {handle.returncode}"}, room=sid)
+
+    get_supervisor().start(ALLOWED_COMMANDS[command_key], [on_line], name=f'terminal-{sid}',
+                           timeout=TERMINAL_COMMAND_TIMEOUT, on_exit=on_exit)
 
 @socketio.on('execute_command')
 def handle_command(data):
@@ -167,10 +202,101 @@ def handle_command(data):
     command = data.get('command', '').strip()
     # 关键：通过 request.sid 获取当前客户端会话的唯一ID，用于定向推送消息
     session_id = request.sid
-    # 启动后台线程执行命令，避免阻塞SocketIO主线程
-    thread = threading.Thread(target=execute_long_command, args=(command, session_id))
-    thread.daemon = True
-    thread.start()
+    if command.startswith(LOG_COMMAND_PREFIX):
+        # 兼容旧的查看日志命令：一次性输出整个日志（按帧发送，不再逐行）
+        start_log_tail(session_id, command[len(LOG_COMMAND_PREFIX):], 0, follow=False, legacy=True)
+        return
+    # 进程在后台运行，不阻塞SocketIO主线程
+    execute_long_command(command, session_id)
+
+@socketio.on('cancel_command')
+def handle_cancel_command(data=None):
+    """中止当前客户端正在运行的命令"""
+    get_supervisor().cancel(f'terminal-{request.sid}')
+
+
+# ========== 日志跟踪 ==========
+# 旧的终端命令：YXMMGSWS<任务ID> 输出该AlphaFold任务的docker日志
+LOG_COMMAND_PREFIX = 'YXMMGSWS'
+ALPHAFOLD_LOG_NAME = 'alphafold_docker.log'
+# 每个客户端同时只跟踪一个日志
+log_tails = {}
+log_tails_lock = threading.Lock()
+
+def alphafold_log_path(task_id):
+    """任务日志的路径（由 PAGE_CONFIGS 中的 processed_dir 得到），任务ID不合法时返回None"""
+    try:
+        uuid.UUID(task_id)
+    except (TypeError, ValueError):
+        return None
+    return safe_join(PAGE_CONFIGS['alphafold']['processed_dir'], task_id, ALPHAFOLD_LOG_NAME)
+
+def stop_log_tail(sid):
+    with log_tails_lock:
+        tail = log_tails.pop(sid, None)
+    if tail is not None:
+        tail.stop()
+
+def start_log_tail(sid, task_id, offset, follow=True, legacy=False):
+    """在后台跟踪任务日志并发送给客户端 sid；legacy=True 时以 command_output 事件发送"""
+    task_id = (task_id or '').strip()
+    path = alphafold_log_path(task_id)
+    if path is None:
+        event = 'command_output' if legacy else 'log_error'
+        socketio.emit(event, {'data': f"错误: 任务ID不合法: {task_id}", 'task_id': task_id}, to=sid)
+        return
+    
+    def is_finished():
+        task_info = tasks.get(task_id)
+        # 没有记录的任务（已清理或其他实例的旧任务）日志不会再变化
+        return task_info is None or task_info.get('status') in ('completed', 'error')
+    
+    def send(frame, on_ack):
+        if legacy:
+            if frame.get('missing'):
+                socketio.emit('command_output', {'data': f"日志不存在: {task_id}\n"}, to=sid)
+            elif frame['data']:
+                socketio.emit('command_output', {'data': frame['data']}, to=sid)
+            on_ack()
+            return
+        frame['task_id'] = task_id
+        # 客户端处理完这一帧后确认，未确认的帧过多时暂停读取
+        socketio.emit('log_frame', frame, to=sid, callback=lambda *args: on_ack())
+    
+    tail = LogTail(path, offset, send, is_finished, follow=follow, sleep=socketio.sleep)
+    stop_log_tail(sid)
+    with log_tails_lock:
+        log_tails[sid] = tail
+    
+    def run():
+        try:
+            tail.run()
+        except Exception as e:
+            socketio.emit('log_error', {'data': f"读取日志失败: {str(e)}", 'task_id': task_id}, to=sid)
+        finally:
+            with log_tails_lock:
+                if log_tails.get(sid) is tail:
+                    del log_tails[sid]
+    
+    socketio.start_background_task(run)
+
+@socketio.on('tail_log')
+def handle_tail_log(data):
+    """跟踪任务日志：{task_id, offset（字节偏移，负数表示从末尾往前，默认只看最后一部分）, follow}"""
+    try:
+        offset = int(data.get('offset', -LOG_TAIL_KEEP_BYTES))
+    except (TypeError, ValueError):
+        offset = -LOG_TAIL_KEEP_BYTES
+    start_log_tail(request.sid, data.get('task_id'), offset, follow=bool(data.get('follow', True)))
+
+@socketio.on('stop_tail')
+def handle_stop_tail(data=None):
+    stop_log_tail(request.sid)
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    stop_log_tail(request.sid)
+    get_supervisor().cancel(f'terminal-{request.sid}')
 
 
 @app.route('/api/test_connection')
@@ -199,9 +325,13 @@ def terminal_page():
 import os
 import uuid
 from datetime import datetime
-from flask import Flask, request, render_template, send_file, jsonify
+from flask import Flask, request, render_template, send_file, jsonify, stream_with_context
+import json
 import threading
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from urllib.parse import quote
+import zipfile
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -215,21 +345,28 @@ PAGE_CONFIGS = {
         'upload_dir': os.path.join(UPLOAD_BASE, 'test'),
         'processed_dir': os.path.join(PROCESSED_BASE, 'test'),
         'allowed_extensions': {'txt', 'csv', 'json', 'xlsx', 'pdf', 'fa'},
-        'max_size_mb': 100  # 100MB
+        'max_size_mb': 100,  # 100MB
+        'concurrency': int(os.getenv('TEST_CONCURRENCY', 2)),
+        'retention_hours': float(os.getenv('TEST_RETENTION_HOURS', 24))  # 结束后保留的小时数，0表示永久保留
     },
     'rnafold': {
         'template': 'api_RNAfold.html',
         'upload_dir': os.path.join(UPLOAD_BASE, 'rnafold'),
         'processed_dir': os.path.join(PROCESSED_BASE, 'rnafold'),
         'allowed_extensions': {'fasta', 'fa', 'txt', 'seq'},
-        'max_size_mb': 10  # 10MB
+        'max_size_mb': 10,  # 10MB
+        'concurrency': int(os.getenv('RNAFOLD_CONCURRENCY', 2)),  # 折叠计算在共享进程池中并行
+        'retention_hours': float(os.getenv('RNAFOLD_RETENTION_HOURS', 168))
     },
     'alphafold': {
         'template': 'api_alphafold.html',
         'upload_dir': os.path.join(UPLOAD_BASE, 'alphafold'),
         'processed_dir': os.path.join(PROCESSED_BASE, 'alphafold'),
         'allowed_extensions': {'json'},
-        'max_size_mb': 1024  # 1024MB
+        'max_size_mb': 1024,  # 1024MB
+        # 批量模式下工作线程只负责准备输入和等待，容器仍然同时只运行一个（单GPU）
+        'concurrency': int(os.getenv('ALPHAFOLD_CONCURRENCY', ALPHAFOLD_BATCH_MAX_TASKS if ALPHAFOLD_BATCH_ENABLED else 1)),
+        'retention_hours': float(os.getenv('ALPHAFOLD_RETENTION_HOURS', 720))
     }
 }
 
@@ -251,7 +388,8 @@ API_INFO = {
     },
     'rnafold': {
         'func': process_rnafold_files,
-        'config_key': 'rnafold'
+        'config_key': 'rnafold',
+        'parse_params': parse_rnafold_params
     },
     'alphafold': {
         'func': process_alphafold_files,
@@ -261,24 +399,185 @@ API_INFO = {
 
 API_AVI = ['test', 'rnafold', 'alphafold']
 
+# 普通（multipart）上传的整个请求不超过页面的 max_size_mb（加上表单字段和分隔符的余量），
+# 总大小超过的上传使用分块上传接口
+MULTIPART_OVERHEAD = 1024 * 1024
+
 # mkdir for configuration
 for config in PAGE_CONFIGS.values():
     os.makedirs(config['upload_dir'], exist_ok=True)
     os.makedirs(config['processed_dir'], exist_ok=True)
 
-# 任务状态存储
-tasks = {}
+# 任务状态存储（TASK_STORE=sqlite 时可在多个worker之间共享）
+tasks = create_task_store(app.config)
+
+# 任务状态推送：记录被修改时合并成事件，通过SSE（/events）和Socket.IO房间（task:<id>）发送
+task_events = TaskEventBus(tasks)
+tasks.add_observer(task_events.notify)
+task_events.add_listener(lambda task_id, event: socketio.emit('task_update', event, room=f'task:{task_id}'))
+
+# 上传文件按内容哈希保存（uploads/blobs），相同输入的任务复用已完成的结果
+content_store = ContentStore(os.path.join(UPLOAD_BASE, 'blobs'))
+RESULT_REUSE = os.getenv('RESULT_REUSE', '1') == '1'
+
+# 过期清理：按 retention_hours 和磁盘高水位删除已结束任务的文件和记录
+janitor = RetentionJanitor(tasks, PAGE_CONFIGS, content_store)
+
+def on_task_finished(task_id):
+    """任务完成后登记输入摘要（之后相同输入的任务直接复用结果），并登记到过期清理"""
+    task_info = tasks.get(task_id)
+    if task_info and task_info.get('status') == 'completed' and task_info.get('input_digest'):
+        content_store.record_result(task_info['input_digest'], task_id)
+    if task_info:
+        janitor.track(task_id, task_info.get('page_type'))
+
+# 任务调度：每种页面一个队列，并发数由 PAGE_CONFIGS 中的 concurrency 限制
+scheduler = JobScheduler(tasks, {
+    page_type: page_config['concurrency'] for page_type, page_config in PAGE_CONFIGS.items()
+}, on_finished=on_task_finished)
+
+def start_task(page_type, task_id, saved_files, output_dir, zip_path, priority=0):
+    """把页面对应的处理函数提交到调度队列"""
+    process_func = API_INFO[page_type]['func']
+    return scheduler.submit(
+        page_type,
+        task_id,
+        process_func,
+        (task_id, saved_files, output_dir, tasks, zip_path),
+        priority=priority
+    )
 
 
 # ========== 路由定义 ==========
+def parse_task_options(page_type, form):
+    """解析优先级和页面特有的分析参数，参数不合法时抛出ValueError
+
+    返回 (priority, params, reuse)；reuse=0 时即使有相同输入的已完成任务也重新计算。
+    """
+    # 优先级：数值越大越先执行，同优先级先进先出
+    try:
+        priority = max(-10, min(10, int(form.get('priority', 0))))
+    except (TypeError, ValueError):
+        raise ValueError('priority 必须是整数')
+    
+    # 页面特有的分析参数（例如RNAfold的折叠方式）
+    parse_params = API_INFO.get(page_type, {}).get('parse_params')
+    params = parse_params(form) if parse_params else {}
+    reuse = RESULT_REUSE and str(form.get('reuse', '1')).lower() not in ('0', 'false', 'no')
+    return priority, params, reuse
+
+def find_reusable_task(input_digest):
+    """输入摘要相同、已完成且结果仍然存在的任务"""
+    previous_id = content_store.find_result(input_digest)
+    previous = tasks.get(previous_id) if previous_id else None
+    if not previous or previous.get('status') != 'completed':
+        return None
+    output_path = previous.get('output_path')
+    if not output_path or not (os.path.exists(output_path) or is_streamed(output_path)):
+        content_store.forget_result(input_digest)
+        return None
+    return previous
+
+def create_task(page_type, task_id, saved_files, priority, params, input_hashes, reuse=True):
+    """登记任务并提交到调度队列，返回上传接口的响应内容
+
+    input_hashes 为各输入文件的内容哈希；输入和参数都相同的任务已经完成时，
+    新任务直接指向它的结果，不再重新计算。
+    """
+    config = get_page_config(page_type)
+    zip_path = os.path.join(config['processed_dir'], f'{task_id}.zip')
+    filenames = [os.path.basename(f) for f in saved_files]
+    input_digest = content_store.input_digest(page_type, list(zip(filenames, input_hashes)), params)
+    
+    previous = find_reusable_task(input_digest) if reuse else None
+    if previous is not None:
+        now = datetime.now().isoformat()
+        tasks.create(task_id, {
+            'id': task_id,
+            'page_type': page_type,
+            'status': 'completed',
+            'progress': 100,
+            'message': '相同输入的任务已经完成，直接使用其结果',
+            'start_time': now,
+            'end_time': now,
+            'file_count': len(saved_files),
+            'filenames': filenames,
+            'params': params,
+            'input_digest': input_digest,
+            'reused_from': previous['id'],
+            'output_dir': previous.get('output_dir'),
+            'output_path': previous['output_path'],
+            'download_url': f'/download/{task_id}?page_type={page_type}'
+        })
+        # 新任务使用原任务的结果文件：原任务的保留时间从现在重新计算，
+        # 并且在新任务被清理之前不会删除原任务的文件
+        janitor.track(previous['id'], page_type)
+        janitor.track(task_id, page_type, reused_from=previous['id'])
+        return {
+            'task_id': task_id,
+            'page_type': page_type,
+            'message': '相同输入的任务已经完成，直接使用其结果',
+            'file_count': len(saved_files),
+            'reused_from': previous['id'],
+            'queue_position': None,
+            'status_url': f'/status/{task_id}'
+        }
+    
+    # 创建输出目录
+    output_dir = os.path.join(config['processed_dir'], task_id)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # 初始化任务信息（job 用于服务重启后重新执行）
+    tasks.create(task_id, {
+        'id': task_id,
+        'page_type': page_type,
+        'status': 'pending',
+        'progress': 0,
+        'message': '等待处理...',
+        'start_time': datetime.now().isoformat(),
+        'file_count': len(saved_files),
+        'filenames': filenames,
+        'params': params,
+        'input_digest': input_digest,
+        'output_dir': output_dir
+    }, job={
+        'page_type': page_type,
+        'files': saved_files,
+        'output_dir': output_dir,
+        'zip_path': zip_path
+    })
+    
+    # 提交到调度队列，由工作线程处理
+    queue_position = start_task(page_type, task_id, saved_files, output_dir, zip_path, priority=priority)
+    
+    return {
+        'task_id': task_id,
+        'page_type': page_type,
+        'message': '文件上传成功，开始处理',
+        'file_count': len(saved_files),
+        'queue_position': queue_position,
+        'status_url': f'/status/{task_id}'
+    }
+
 @app.route('/upload/<page_type>', methods=['POST'])
 def upload_files(page_type):
     """通用上传接口，根据page_type选择处理方式"""
-    if page_type not in PAGE_CONFIGS:
+    if page_type not in PAGE_CONFIGS or page_type not in API_AVI:
         return jsonify({'error': f'未知的页面类型: {page_type}'}), 400
     
     config = get_page_config(page_type)
     
+    # 在解析表单之前按请求大小拒绝，避免先把整个请求体接收下来；
+    # 没有 Content-Length 的请求在解析时超过限制即中止（413）
+    max_size = config['max_size_mb'] * 1024 * 1024
+    request_limit = max_size + MULTIPART_OVERHEAD
+    if request.content_length is not None and request.content_length > request_limit:
+        return jsonify({
+            'error': f'上传内容合计超过 {config["max_size_mb"]}MB，请使用分块上传',
+            'max_size_mb': config['max_size_mb']
+        }), 413
+    request.max_content_length = request_limit
+    
     if 'files' not in request.files:
         return jsonify({'error': '没有选择文件'}), 400
     
@@ -287,7 +586,6 @@ def upload_files(page_type):
         return jsonify({'error': '没有选择文件'}), 400
     
     # 检查文件大小
-    max_size = config['max_size_mb'] * 1024 * 1024
     for file in files:
         file.seek(0, 2)  # 移动到文件末尾
         size = file.tell()
@@ -298,6 +596,11 @@ def upload_files(page_type):
                 'max_size_mb': config['max_size_mb']
             }), 400
     
+    try:
+        priority, params, reuse = parse_task_options(page_type, request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     # 生成任务ID
     task_id = str(uuid.uuid4())
     
@@ -305,13 +608,14 @@ def upload_files(page_type):
     task_dir = os.path.join(config['upload_dir'], task_id)
     os.makedirs(task_dir, exist_ok=True)
     
-    # 保存上传的文件
+    # 保存上传的文件（边写边计算内容哈希，重复内容只保存一份）
     saved_files = []
+    input_hashes = []
     for file in files:
         if file and allowed_file(file.filename, page_type):
             filename = secure_filename(file.filename)
             filepath = os.path.join(task_dir, filename)
-            file.save(filepath)
+            input_hashes.append(content_store.save_stream(file.stream, filepath))
             saved_files.append(filepath)
         else:
             return jsonify({
@@ -319,68 +623,263 @@ def upload_files(page_type):
                 'allowed_extensions': list(config['allowed_extensions'])
             }), 400
     
-    # 初始化任务信息
-    tasks[task_id] = {
-        'id': task_id,
-        'page_type': page_type,
-        'status': 'pending',
-        'progress': 0,
-        'message': '等待处理...',
-        'start_time': datetime.now().isoformat(),
-        'file_count': len(saved_files),
-        'filenames': [os.path.basename(f) for f in saved_files]
-    }
-    
-    # 创建输出目录
-    output_dir = os.path.join(config['processed_dir'], task_id)
-    os.makedirs(output_dir, exist_ok=True)
+    return jsonify(create_task(page_type, task_id, saved_files, priority, params, input_hashes, reuse))
+
+# ========== 分块断点续传上传 ==========
+def upload_task_dir(page_type, task_id):
+    """分块上传的任务目录，task_id 必须是UUID"""
+    if page_type not in PAGE_CONFIGS or page_type not in API_AVI:
+        raise UploadError(f'未知的页面类型: {page_type}', 400)
+    try:
+        task_id = str(uuid.UUID(task_id))
+    except ValueError:
+        raise UploadError('任务不存在', 404)
+    return os.path.join(get_page_config(page_type)['upload_dir'], task_id)
+
+def upload_session_url(page_type, task_id, upload_id):
+    return f'/upload/{page_type}/{task_id}/sessions/{upload_id}'
+
+@app.errorhandler(UploadError)
+def handle_upload_error(e):
+    return jsonify({'error': e.message}), e.status
+
+@app.route('/upload/<page_type>/sessions', methods=['POST'])
+def create_upload_session(page_type):
+    """创建一个文件的分块上传
+
+    请求JSON: {filename, size, task_id(可选，同一任务的多个文件使用同一个task_id)}，
+    文件大小也可以用 Upload-Length 请求头给出。超过 max_size_mb 的文件在传输前就被拒绝。
+    """
+    data = request.get_json(silent=True) or {}
+    task_id = data.get('task_id') or str(uuid.uuid4())
+    task_dir = upload_task_dir(page_type, task_id)
+    if task_id in tasks:
+        raise UploadError('任务已经开始处理', 409)
     
-    # 根据页面类型选择处理函数
-    if page_type in API_AVI:
-        process_func = API_INFO[page_type]['func']
-        zip_path = os.path.join(get_page_config(page_type)['processed_dir'], f'{task_id}.zip')
-    else:
-        return jsonify({'error': '不支持的页面类型'}), 400
+    config = get_page_config(page_type)
+    filename = data.get('filename', '')
+    if not filename or not allowed_file(filename, page_type):
+        return jsonify({
+            'error': f'不支持的文件类型: {filename}',
+            'allowed_extensions': list(config['allowed_extensions'])
+        }), 400
     
-    # 在后台线程中处理文件
-    thread = threading.Thread(
-        target=process_func,
-        args=(task_id, saved_files, output_dir, tasks, zip_path)
-    )
-    thread.daemon = True
-    thread.start()
+    try:
+        length = int(data.get('size', request.headers.get('Upload-Length', '')))
+    except (TypeError, ValueError):
+        raise UploadError('缺少文件大小（size 或 Upload-Length）', 400)
+    if length < 0:
+        raise UploadError('文件大小不合法', 400)
+    if length > config['max_size_mb'] * 1024 * 1024:
+        return jsonify({
+            'error': f'文件太大: {filename}',
+            'max_size_mb': config['max_size_mb']
+        }), 413
     
+    meta = create_upload(task_dir, secure_filename(filename), length)
+    # 未完成的上传也会过期清理；任务开始处理后清理时跳过，结束时重新登记
+    janitor.track(task_id, page_type)
+    upload_url = upload_session_url(page_type, task_id, meta['upload_id'])
+    response = jsonify({
+        'task_id': task_id,
+        'upload_id': meta['upload_id'],
+        'filename': meta['filename'],
+        'size': length,
+        'offset': 0,
+        'upload_url': upload_url
+    })
+    response.status_code = 201
+    response.headers['Location'] = upload_url
+    response.headers['Upload-Offset'] = '0'
+    return response
+
+@app.route('/upload/<page_type>/<task_id>/sessions', methods=['GET'])
+def list_upload_sessions(page_type, task_id):
+    """列出任务中各文件的上传进度（页面刷新后用于续传）"""
+    task_dir = upload_task_dir(page_type, task_id)
     return jsonify({
         'task_id': task_id,
-        'page_type': page_type,
-        'message': '文件上传成功，开始处理',
-        'file_count': len(saved_files),
-        'status_url': f'/status/{task_id}'
+        'uploads': [
+            dict(meta, upload_url=upload_session_url(page_type, task_id, meta['upload_id']))
+            for meta in list_uploads(task_dir)
+        ]
     })
 
+@app.route('/upload/<page_type>/<task_id>/sessions/<upload_id>', methods=['HEAD', 'PATCH'])
+def upload_session(page_type, task_id, upload_id):
+    """HEAD 查询已接收的字节数；PATCH 从 Upload-Offset 处追加请求体"""
+    task_dir = upload_task_dir(page_type, task_id)
+    
+    if request.method == 'HEAD':
+        meta = load_upload(task_dir, upload_id)
+        offset = meta['offset']
+    else:
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            raise UploadError('缺少 Upload-Offset 请求头', 400)
+        meta = load_upload(task_dir, upload_id)
+        if request.content_length is not None and offset + request.content_length > meta['length']:
+            raise UploadError('数据超过声明的文件大小', 413)
+        # 直接读取请求体流，不经过表单解析，数据边收边写入磁盘
+        offset = append_chunk(task_dir, upload_id, offset, request.stream)
+    
+    response = Response(status=200 if request.method == 'HEAD' else 204)
+    response.headers['Upload-Offset'] = str(offset)
+    response.headers['Upload-Length'] = str(meta['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/upload/<page_type>/<task_id>/complete', methods=['POST'])
+def complete_upload(page_type, task_id):
+    """所有文件上传完成后创建任务，参数与普通上传相同（priority 及页面参数）"""
+    task_dir = upload_task_dir(page_type, task_id)
+    if task_id in tasks:
+        raise UploadError('任务已经开始处理', 409)
+    
+    saved_files, pending = completed_files(task_dir)
+    if pending:
+        return jsonify({'error': '还有文件没有上传完成', 'pending': pending}), 409
+    if not saved_files:
+        return jsonify({'error': '没有选择文件'}), 400
+    
+    form = request.get_json(silent=True) or request.form
+    try:
+        priority, params, reuse = parse_task_options(page_type, form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 分块上传的文件已经在任务目录中，登记到内容存储（重复内容替换为硬链接）
+    input_hashes = [content_store.ingest(path) for path in saved_files]
+    return jsonify(create_task(page_type, task_id, saved_files, priority, params, input_hashes, reuse))
+
 @app.route('/status/<task_id>', methods=['GET'])
 def get_status(task_id):
     """获取任务状态"""
-    if task_id not in tasks:
+    task_info = tasks.get(task_id)
+    if task_info is None:
         return jsonify({'error': '任务不存在'}), 404
     
-    return jsonify(tasks[task_id])
+    return jsonify(task_info)
 
-@app.route('/download/<task_id>', methods=['GET'])
-def download_result(task_id):
-    """下载处理结果"""
-    if task_id not in tasks:
-        return jsonify({'error': '任务不存在'}), 404
+@app.route('/status', methods=['GET'])
+def get_status_bulk():
+    """批量获取任务状态：/status?ids=<id1>,<id2>"""
+    task_ids = requested_task_ids(request.args.get('ids'))
+    if not task_ids:
+        return jsonify({'error': '请提供任务ID（ids参数）'}), 400
+    if len(task_ids) > MAX_PAGE_SIZE:
+        return jsonify({'error': f'一次最多查询 {MAX_PAGE_SIZE} 个任务'}), 400
     
-    task_info = tasks[task_id]
-    page_type = task_info.get('page_type', 'test')
+    found = tasks.get_many(task_ids)
+    return jsonify({
+        'tasks': found,
+        'missing': [task_id for task_id in task_ids if task_id not in found]
+    })
+
+def requested_task_ids(value):
+    """解析逗号分隔的任务ID列表（去重，保持顺序）"""
+    task_ids = []
+    for task_id in (value or '').split(','):
+        task_id = task_id.strip()
+        if task_id and task_id not in task_ids:
+            task_ids.append(task_id)
+    return task_ids
+
+@app.route('/events', methods=['GET'])
+def task_event_stream():
+    """订阅任务状态（Server-Sent Events）：/events?ids=<id1>,<id2>
+
+    第一条事件为任务的完整状态，之后只发送变化的字段；
+    同一任务在推送间隔内的多次更新合并为一条。连接断开后客户端可以回退到轮询 /status。
+    """
+    task_ids = requested_task_ids(request.args.get('ids'))
+    if not task_ids:
+        return jsonify({'error': '请提供任务ID（ids参数）'}), 400
+    if len(task_ids) > MAX_SUBSCRIBED_TASKS:
+        return jsonify({'error': f'一次最多订阅 {MAX_SUBSCRIBED_TASKS} 个任务'}), 400
+    
+    subscription = task_events.subscribe(task_ids)
+    
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events = subscription.get(timeout=15)
+                if not events:
+                    # 心跳，防止代理关闭空闲连接
+                    yield ': keepalive\n\n'
+                    continue
+                for event in events:
+                    data = json.dumps(event, ensure_ascii=False, default=str)
+                    yield f'event: task\ndata: {data}\n\n'
+        finally:
+            task_events.unsubscribe(subscription)
     
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@socketio.on('subscribe_tasks')
+def subscribe_tasks(data):
+    """Socket.IO订阅：加入各任务的房间，并立即发送当前状态"""
+    for task_id in list(data.get('ids', []))[:MAX_SUBSCRIBED_TASKS]:
+        join_room(f'task:{task_id}')
+        snapshot = task_events.snapshot(task_id)
+        if snapshot is not None:
+            socketio.emit('task_update', snapshot, room=request.sid)
+
+@socketio.on('unsubscribe_tasks')
+def unsubscribe_tasks(data):
+    for task_id in data.get('ids', []):
+        leave_room(f'task:{task_id}')
+
+@app.route('/scheduler', methods=['GET'])
+def scheduler_stats():
+    """各处理队列的排队数、运行数和并发上限"""
+    return jsonify(scheduler.stats())
+
+def file_etag(path):
+    """由修改时间和大小生成的强ETag，文件重新生成后会变化，用于 If-Range 断点续传"""
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+def task_output_dir(task_info):
+    """任务的结果目录（旧任务记录中没有 output_dir，由压缩包路径推出）"""
+    output_dir = task_info.get('output_dir')
+    if not output_dir and task_info.get('output_path'):
+        output_dir = task_info['output_path'][:-len('.zip')]
+    return output_dir
+
+def completed_task_or_error(task_id):
+    """返回 (task_info, None)，任务不存在或未完成时返回 (None, 错误响应)"""
+    task_info = tasks.get(task_id)
+    if task_info is None:
+        return None, (jsonify({'error': '任务不存在'}), 404)
     if task_info['status'] != 'completed':
-        return jsonify({'error': '任务尚未完成'}), 400
+        return None, (jsonify({'error': '任务尚未完成'}), 400)
+    return task_info, None
+
+def result_member_allowed(member):
+    """单文件下载只允许结果文件，不允许中间文件"""
+    parts = member.split('/')
+    return not any(part in SKIP_DIRS for part in parts[:-1]) and not parts[-1].endswith(SKIP_EXTENSIONS)
+
+@app.route('/download/<task_id>', methods=['GET'])
+def download_result(task_id):
+    """下载处理结果
+
+    支持 Range / If-Range 断点续传：ETag 由压缩包的修改时间和大小生成，
+    压缩包重新生成后旧的续传请求会收到完整文件。
+    """
+    task_info, error = completed_task_or_error(task_id)
+    if error:
+        return error
+    page_type = task_info.get('page_type', 'test')
     
     zip_path = task_info.get('output_path')
-    if not zip_path or not os.path.exists(zip_path):
-        return jsonify({'error': '结果文件不存在'}), 404
     
     # 根据页面类型设置下载文件名
     if page_type in API_AVI:
@@ -388,43 +887,193 @@ def download_result(task_id):
     else:
         filename = f'results_{task_id}.zip'
     
+    # 流式模式：结果没有打成压缩包，边读边压缩直接发送（不支持断点续传）
+    if is_streamed(zip_path):
+        return Response(
+            stream_result_zip(zip_path),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+    
+    if not zip_path or not os.path.exists(zip_path):
+        return jsonify({'error': '结果文件不存在'}), 404
+    
+    # 结果路径相对于工作目录保存，send_file 会按应用目录解析相对路径
+    zip_path = os.path.abspath(zip_path)
     return send_file(
         zip_path,
         as_attachment=True,
         download_name=filename,
-        mimetype='application/zip'
+        mimetype='application/zip',
+        conditional=True,
+        etag=file_etag(zip_path)
     )
 
-@app.route('/tasks', methods=['GET'])
-def list_tasks():
-    """列出所有任务（用于调试）"""
+@app.route('/download/<task_id>/files', methods=['GET'])
+def list_result_files(task_id):
+    """列出任务结果中可以单独下载的文件"""
+    task_info, error = completed_task_or_error(task_id)
+    if error:
+        return error
+    
+    output_dir = task_output_dir(task_info)
+    files = []
+    if output_dir and os.path.isdir(output_dir):
+        for file_path in iter_result_files(output_dir):
+            member = os.path.relpath(file_path, output_dir).replace(os.sep, '/')
+            files.append({'path': member, 'size': os.path.getsize(file_path)})
+    elif task_info.get('output_path') and os.path.exists(task_info['output_path']):
+        # 结果目录已被清理时从压缩包读取文件列表
+        with zipfile.ZipFile(task_info['output_path']) as zipf:
+            files = [{'path': info.filename, 'size': info.file_size}
+                     for info in zipf.infolist() if not info.is_dir()]
+    
     return jsonify({
-        'tasks': {
-            task_id: {
-                'status': info['status'],
-                'progress': info['progress'],
-                'start_time': info['start_time']
-            }
-            for task_id, info in tasks.items()
-        }
+        'task_id': task_id,
+        'files': [
+            dict(item, url=f'/download/{task_id}/file/{item["path"]}') for item in files
+        ]
     })
 
-# 清理旧任务文件的函数（可选）
-# def cleanup_old_files():
-#     """定期清理旧文件"""
-#     import time
-#     while True:
-#         time.sleep(3600)  # 每小时清理一次
-#         now = time.time()
-#         max_age = 24 * 3600  # 24小时
+@app.route('/download/<task_id>/file/<path:member>', methods=['GET'])
+def download_result_file(task_id, member):
+    """单独下载结果中的一个文件（例如排名第一的 .cif），不需要下载整个压缩包"""
+    task_info, error = completed_task_or_error(task_id)
+    if error:
+        return error
+    if not result_member_allowed(member):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    output_dir = task_output_dir(task_info)
+    file_path = safe_join(os.path.abspath(output_dir), member) if output_dir else None
+    if file_path and os.path.isfile(file_path):
+        return send_file(
+            file_path,
+            as_attachment=True,
+            download_name=os.path.basename(member),
+            conditional=True,
+            etag=file_etag(file_path)
+        )
+    
+    # 结果目录已被清理时从压缩包中读取该成员
+    zip_path = task_info.get('output_path')
+    if zip_path and os.path.exists(zip_path):
+        zipf = zipfile.ZipFile(zip_path)
+        try:
+            info = zipf.getinfo(member)
+        except KeyError:
+            zipf.close()
+            return jsonify({'error': '文件不存在'}), 404
+        
+        def generate():
+            with zipf, zipf.open(info) as src:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    yield chunk
         
-#         for folder in [UPLOAD_FOLDER, PROCESSED_FOLDER]:
-#             for root, dirs, files in os.walk(folder):
-#                 for file in files:
-#                     filepath = os.path.join(root, file)
-#                     if os.path.getctime(filepath) < now - max_age:
-#                         os.remove(filepath)
+        return Response(
+            generate(),
+            mimetype='application/octet-stream',
+            headers={
+                'Content-Disposition': f"attachment; filename*=UTF-8''{quote(os.path.basename(member))}",
+                'Content-Length': str(info.file_size)
+            }
+        )
+    
+    return jsonify({'error': '文件不存在'}), 404
+
+# 任务列表中返回的字段（完整记录通过 /status 获取）
+TASK_SUMMARY_FIELDS = ('page_type', 'status', 'progress', 'message', 'start_time', 'end_time',
+                       'queue_position', 'file_count', 'download_url')
+
+def task_summary(task_id, info):
+    summary = {field: info.get(field) for field in TASK_SUMMARY_FIELDS}
+    summary['id'] = task_id
+    return summary
+
+def parse_int_param(value, name, default=None):
+    """整数参数，不合法时抛出ValueError"""
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} 必须是整数')
+
+def parse_time_param(value, name):
+    """时间参数：Unix时间戳或ISO 8601格式，不合法时抛出ValueError"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f'{name} 必须是Unix时间戳或ISO 8601时间')
+
+@app.route('/tasks', methods=['GET'])
+def list_tasks():
+    """分页列出任务（从新到旧）
+
+    参数：
+      page_type          页面类型
+      status             状态，可用逗号分隔多个（例如 pending,processing）
+      created_after/created_before  创建时间范围（Unix时间戳或ISO时间）
+      cursor             上一页返回的 next_cursor
+      limit              每页条数（默认50，最多200）
+      since              只返回该修订号之后修改过的任务（按修改顺序），忽略 cursor
+    返回的 revision 可作为下次请求的 since。
+    """
+    page_type = request.args.get('page_type') or None
+    statuses = requested_task_ids(request.args.get('status')) or None
+    try:
+        limit = max(1, min(MAX_PAGE_SIZE, parse_int_param(request.args.get('limit'), 'limit', DEFAULT_PAGE_SIZE)))
+        created_after = parse_time_param(request.args.get('created_after'), 'created_after')
+        created_before = parse_time_param(request.args.get('created_before'), 'created_before')
+        cursor = parse_int_param(request.args.get('cursor'), 'cursor')
+        since = parse_int_param(request.args.get('since'), 'since')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if since is not None:
+        items, revision, has_more = tasks.changes_since(since, limit)
+        # 增量结果按修改顺序返回，筛选条件在当前页内应用
+        items = [
+            (task_id, info) for task_id, info in items
+            if (page_type is None or info.get('page_type') == page_type)
+            and (statuses is None or info.get('status') in statuses)
+        ]
+        return jsonify({
+            'tasks': [task_summary(task_id, info) for task_id, info in items],
+            'revision': revision,
+            'has_more': has_more
+        })
+    
+    revision = tasks.revision
+    items, next_cursor = tasks.list_tasks(
+        page_type=page_type,
+        statuses=statuses,
+        created_after=created_after,
+        created_before=created_before,
+        cursor=cursor,
+        limit=limit
+    )
+    return jsonify({
+        'tasks': [task_summary(task_id, info) for task_id, info in items],
+        'next_cursor': next_cursor,
+        'revision': revision
+    })
 
+# 重新执行上次运行中被中断的任务（仅持久化存储）
+# spawn方式启动的RNAfold工作进程也会导入本模块，只在主进程中恢复
+if multiprocessing.parent_process() is None:
+    for recovered_id, job in tasks.recover_interrupted():
+        start_task(job['page_type'], recovered_id, job['files'], job['output_dir'], job['zip_path'])
+    janitor.start()
 
 ## Api page
 @app.route('/api', methods=['GET'])
@@ -0,0 +1,213 @@
+# config/catalog_cache.py
+import gzip
+import hashlib
+import json
+import threading
+import time
+from sqlalchemy import text
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，没有安装时只提供gzip
+    brotli = None
+
+# 目录版本号表：导入脚本每次写入数据后把版本号加一
+CATALOG_META_DDL = """
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    name VARCHAR(64) NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+CATALOG_VERSION_BUMP_SQL = """
+INSERT INTO catalog_meta (name, version) VALUES ('bioinfo_software', 1)
+ON DUPLICATE KEY UPDATE version = version + 1
+"""
+
+CATALOG_VERSION_QUERY = "SELECT version FROM catalog_meta WHERE name = 'bioinfo_software'"
+CATALOG_FINGERPRINT_QUERY = "SELECT COUNT(*), MAX(updated_at) FROM bioinfo_software"
+CATALOG_COUNT_QUERY = "SELECT COUNT(*) FROM bioinfo_software"
+
+CATALOG_ROWS_QUERY = """
+SELECT category, subcategory, name, features, url, doi
+FROM bioinfo_software
+ORDER BY category, subcategory, name
+"""
+
+
+def build_software_tree(rows):
+    """把数据库行转换为 {大类: {子类: [软件名, ...]}} 的树形结构"""
+    data_tree = {}
+    for row in rows:
+        category = row['category']
+        subcategory = row['subcategory'] if row['subcategory'] else '其他'
+        data_tree.setdefault(category, {}).setdefault(subcategory, []).append(row['name'])
+    return data_tree
+
+
+def content_etag(body):
+    """由内容计算强ETag"""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def encode_variants(body):
+    """预先生成各种Content-Encoding的响应体"""
+    variants = {
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0)
+    }
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    return variants
+
+
+class CatalogSnapshot:
+    """软件目录的进程内快照
+
+    树形结构只在数据版本变化时重建一次，并预先序列化为JSON字节，
+    请求直接返回内存中的字节。版本号由 catalog_meta 表（导入脚本写入）
+    和 COUNT(*)/MAX(updated_at) 指纹共同组成，检查间隔由 check_interval 控制。
+    """
+
+    def __init__(self, engine, check_interval=10):
+        self.engine = engine
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = None
+        self._checked_at = 0.0
+        self._listeners = []
+
+    def _read_version(self, connection):
+        """读取当前数据版本（不存在 catalog_meta 表时只使用指纹）"""
+        try:
+            meta_version = connection.execute(text(CATALOG_VERSION_QUERY)).scalar()
+        except Exception:
+            connection.rollback()
+            meta_version = None
+
+        try:
+            count, updated_at = connection.execute(text(CATALOG_FINGERPRINT_QUERY)).fetchone()
+        except Exception:
+            # 旧的 to_sql(replace) 导入会丢掉 updated_at 列
+            connection.rollback()
+            count = connection.execute(text(CATALOG_COUNT_QUERY)).scalar()
+            updated_at = None
+
+        return (meta_version, count, str(updated_at) if updated_at else None)
+
+    def _build_state(self, connection, version):
+        """加载全部数据，生成树形结构和序列化后的JSON字节"""
+        result = connection.execute(text(CATALOG_ROWS_QUERY))
+        rows = [dict(row._mapping) for row in result]
+        tree = build_software_tree(rows)
+        tree_json = json.dumps(tree, ensure_ascii=False, sort_keys=True).encode('utf-8')
+
+        # 同名软件只保留第一条，与原来 WHERE name = :name 的 fetchone 行为一致
+        by_name = {}
+        by_group = {}
+        for row in rows:
+            by_name.setdefault(row['name'], row)
+            subcategory = row['subcategory'] if row['subcategory'] else '其他'
+            by_group.setdefault(row['category'], {}).setdefault(subcategory, []).append(row)
+
+        return {
+            'version': version,
+            'rows': rows,
+            'tree': tree,
+            'tree_json': tree_json,
+            'tree_etag': content_etag(tree_json),
+            'tree_variants': encode_variants(tree_json),
+            'by_name': by_name,
+            'by_group': by_group,
+            'details': {},  # 按需序列化的详情缓存: name -> (body, etag)
+            'groups': {}    # 按需序列化的分类详情缓存: (category, subcategory) -> (body, etag)
+        }
+
+    def _is_fresh(self):
+        return self._state is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def get(self, force=False):
+        """返回当前快照，必要时检查版本并重建
+
+        快照是一个不再修改的字典，整体替换，读者不需要加锁。
+        """
+        if not force and self._is_fresh():
+            return self._state
+
+        with self._lock:
+            # 其他线程可能已经完成了检查
+            if not force and self._is_fresh():
+                return self._state
+
+            with self.engine.connect() as connection:
+                version = self._read_version(connection)
+                rebuilt = force or self._state is None or version != self._state['version']
+                if rebuilt:
+                    self._state = self._build_state(connection, version)
+            self._checked_at = time.monotonic()
+
+            if rebuilt:
+                for listener in self._listeners:
+                    listener(self._state)
+            return self._state
+
+    def add_listener(self, listener):
+        """注册快照重建回调 listener(state)，例如同步搜索索引"""
+        self._listeners.append(listener)
+
+    def invalidate(self):
+        """让下一次访问强制检查版本"""
+        self._checked_at = 0.0
+
+    def get_details(self, name):
+        """返回单个软件详情的 (JSON字节, ETag)，不存在时返回None"""
+        state = self.get()
+        cached = state['details'].get(name)
+        if cached is None:
+            row = state['by_name'].get(name)
+            if row is None:
+                return None
+            body = json.dumps(row, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            cached = (body, content_etag(body))
+            state['details'][name] = cached
+        return cached
+
+    def get_many_details(self, names):
+        """批量查询软件详情，返回 ({name: 详情}, [未找到的名称])"""
+        by_name = self.get()['by_name']
+        records = {}
+        missing = []
+        for name in names:
+            row = by_name.get(name)
+            if row is None:
+                missing.append(name)
+            else:
+                records[name] = row
+        return records, missing
+
+    def get_group_details(self, category, subcategory=None):
+        """返回整个大类（或其中一个子类）全部软件详情的 (JSON字节, ETag)
+
+        用于前端展开分类时一次性预取，不存在时返回None。
+        """
+        state = self.get()
+        key = (category, subcategory)
+        cached = state['groups'].get(key)
+        if cached is None:
+            subcategories = state['by_group'].get(category)
+            if subcategories is None or (subcategory is not None and subcategory not in subcategories):
+                return None
+
+            records = {}
+            for sub, rows in subcategories.items():
+                if subcategory is not None and sub != subcategory:
+                    continue
+                for row in rows:
+                    records.setdefault(row['name'], row)
+
+            body = json.dumps({'details': records, 'missing': []},
+                              ensure_ascii=False, sort_keys=True).encode('utf-8')
+            cached = (body, content_etag(body))
+            state['groups'][key] = cached
+        return cached
@@ -0,0 +1,243 @@
+# config/catalog_import.py
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from catalog_cache import CATALOG_META_DDL, CATALOG_VERSION_BUMP_SQL
+
+CATALOG_COLUMNS = ['category', 'subcategory', 'name', 'features', 'url', 'doi']
+
+CSV_COLUMN_MAPPING = {
+    '大类': 'category',
+    '子类': 'subcategory',
+    '软件/数据库名称': 'name',
+    '功能特点': 'features',
+    '链接': 'url',
+    '论文DOI': 'doi'
+}
+
+# 与 config/models.py 中的索引保持一致
+CATALOG_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS bioinfo_software (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    category VARCHAR(100) NOT NULL COMMENT '大类',
+    subcategory VARCHAR(100) COMMENT '子类',
+    name VARCHAR(200) NOT NULL COMMENT '软件/数据库名称',
+    features TEXT COMMENT '功能特点',
+    url VARCHAR(500) COMMENT '链接',
+    doi VARCHAR(200) COMMENT '论文DOI',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_category (category),
+    INDEX idx_subcategory (subcategory),
+    INDEX idx_name (name(50)),
+    INDEX idx_category_subcategory (category, subcategory)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='生物信息学软件目录'
+"""
+
+# 带 id 的行按主键更新，id 为 NULL 的行走自增插入
+UPSERT_SQL = """
+INSERT INTO bioinfo_software (id, category, subcategory, name, features, url, doi)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE
+    category = VALUES(category),
+    subcategory = VALUES(subcategory),
+    name = VALUES(name),
+    features = VALUES(features),
+    url = VALUES(url),
+    doi = VALUES(doi)
+"""
+
+EXISTING_ROWS_SQL = "SELECT id, category, subcategory, name, features, url, doi FROM bioinfo_software"
+
+# 服务器端批量加载（需要客户端和服务器都开启 local_infile），空字符串还原为NULL
+LOAD_DATA_SQL = """
+LOAD DATA LOCAL INFILE %s INTO TABLE bioinfo_software
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+LINES TERMINATED BY '\\n'
+(category, @subcategory, name, @features, @url, @doi)
+SET subcategory = NULLIF(@subcategory, ''),
+    features = NULLIF(@features, ''),
+    url = NULLIF(@url, ''),
+    doi = NULLIF(@doi, '')
+"""
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 50000
+
+
+def _normalize_frame(df):
+    """统一为object列，缺失值统一为None，保证CSV和数据库两侧的哈希一致"""
+    df = df[CATALOG_COLUMNS].astype(object)
+    return df.where(df.notna(), None)
+
+
+def iter_catalog_chunks(csv_path, chunksize=CHUNK_SIZE):
+    """按块读取GB2312编码的目录CSV，内存占用只与块大小有关"""
+    reader = pd.read_csv(
+        csv_path,
+        sep=',',
+        encoding='GB2312',
+        dtype=str,
+        na_filter=False,
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        chunk = chunk.rename(columns=CSV_COLUMN_MAPPING).replace({'': None})
+        yield _normalize_frame(chunk)
+
+
+def read_catalog_csv(csv_path):
+    """一次性读取整个目录CSV（小文件使用）"""
+    return pd.concat(list(iter_catalog_chunks(csv_path)), ignore_index=True)
+
+
+def frame_keys(df):
+    """向量化构造业务主键 (category, subcategory, name) 的索引"""
+    return pd.MultiIndex.from_arrays([
+        df['category'].fillna('').to_numpy(dtype=object),
+        df['subcategory'].fillna('').to_numpy(dtype=object),
+        df['name'].fillna('').to_numpy(dtype=object)
+    ])
+
+
+def frame_hashes(df):
+    """向量化计算每行内容的64位哈希"""
+    return pd.util.hash_pandas_object(df[CATALOG_COLUMNS], index=False).to_numpy()
+
+
+def load_existing(cursor, batch_size=CHUNK_SIZE):
+    """读取数据库现有数据，只保留 id、主键和内容哈希
+
+    返回 (主键索引, id数组, 哈希数组, 重复行的id列表)。
+    """
+    cursor.execute(EXISTING_ROWS_SQL)
+    ids, keys, hashes = [], [], []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        frame = pd.DataFrame.from_records(rows, columns=['id'] + CATALOG_COLUMNS)
+        content = _normalize_frame(frame)
+        ids.append(frame['id'].to_numpy(dtype=np.int64))
+        keys.append(frame_keys(content))
+        hashes.append(frame_hashes(content))
+
+    if not ids:
+        empty = pd.MultiIndex.from_arrays([[], [], []])
+        return empty, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64), []
+
+    index = keys[0].append(keys[1:]) if len(keys) > 1 else keys[0]
+    ids = np.concatenate(ids)
+    hashes = np.concatenate(hashes)
+
+    # 数据库中重复的主键只保留第一条，其余删除
+    duplicated = index.duplicated(keep='first')
+    duplicates = ids[duplicated].tolist()
+    return index[~duplicated], ids[~duplicated], hashes[~duplicated], duplicates
+
+
+def _upsert_rows(df, ids):
+    """把一个块转换为 UPSERT_SQL 需要的参数列表（不逐行循环）"""
+    values = df[CATALOG_COLUMNS].copy()
+    values.insert(0, 'id', ids)
+    return values.to_numpy(dtype=object).tolist()
+
+
+def _bulk_load(cursor, df):
+    """通过 LOAD DATA LOCAL INFILE 批量插入新行"""
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            df[CATALOG_COLUMNS].to_csv(f, header=False, index=False, lineterminator='\n')
+        cursor.execute(LOAD_DATA_SQL, (path,))
+    finally:
+        os.remove(path)
+
+
+def incremental_import(conn, csv_path, chunksize=CHUNK_SIZE, bulk_load=False):
+    """流式增量导入目录CSV
+
+    CSV按块读取，每块用向量化的主键匹配和内容哈希分出插入和更新，
+    立即写入数据库；最后删除CSV中已不存在的行。全部操作在一个事务中完成并更新
+    目录版本号，读者在提交前始终看到旧的完整数据。
+    bulk_load=True 时新行使用 LOAD DATA LOCAL INFILE 写入（连接需开启 local_infile）。
+    conn 为DB-API连接（pymysql）。
+    """
+    started = time.perf_counter()
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(CATALOG_TABLE_DDL)
+        cursor.execute(CATALOG_META_DDL)
+
+        existing_index, existing_ids, existing_hashes, duplicates = load_existing(cursor)
+        seen = np.zeros(len(existing_ids), dtype=bool)
+        inserted_keys = set()
+
+        for chunk in iter_catalog_chunks(csv_path, chunksize):
+            stats['rows'] += len(chunk)
+            keys = frame_keys(chunk)
+            hashes = frame_hashes(chunk)
+            positions = existing_index.get_indexer(keys)
+
+            # 已存在的行：CSV中重复出现的只处理第一次
+            matched = positions >= 0
+            first_seen = np.zeros(len(chunk), dtype=bool)
+            matched_positions = positions[matched]
+            _, first = np.unique(matched_positions, return_index=True)
+            fresh = ~seen[matched_positions]
+            keep = np.zeros(len(matched_positions), dtype=bool)
+            keep[first] = True
+            first_seen[np.flatnonzero(matched)[keep & fresh]] = True
+            seen[matched_positions] = True
+
+            changed = first_seen.copy()
+            changed[first_seen] = existing_hashes[positions[first_seen]] != hashes[first_seen]
+            stats['unchanged'] += int(first_seen.sum() - changed.sum())
+
+            # 新行：去掉块内和块间的重复
+            new_mask = ~matched & ~keys.duplicated(keep='first')
+            if inserted_keys:
+                new_mask &= ~keys.isin(inserted_keys)
+            inserted_keys.update(keys[new_mask])
+
+            updates = chunk[changed]
+            inserts = chunk[new_mask]
+
+            rows = _upsert_rows(updates, existing_ids[positions[changed]].astype(object))
+            if bulk_load and len(inserts):
+                _bulk_load(cursor, inserts)
+            else:
+                rows += _upsert_rows(inserts, [None] * len(inserts))
+            for i in range(0, len(rows), BATCH_SIZE):
+                cursor.executemany(UPSERT_SQL, rows[i:i + BATCH_SIZE])
+
+            stats['inserted'] += len(inserts)
+            stats['updated'] += len(updates)
+
+            elapsed = time.perf_counter() - started
+            print(f"已处理 {stats['rows']} 行 ({stats['rows'] / elapsed:.0f} 行/秒)")
+
+        deletes = existing_ids[~seen].tolist() + duplicates
+        for i in range(0, len(deletes), BATCH_SIZE):
+            batch = deletes[i:i + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM bioinfo_software WHERE id IN ({placeholders})", batch)
+        stats['deleted'] = len(deletes)
+
+        if stats['inserted'] or stats['updated'] or stats['deleted']:
+            cursor.execute(CATALOG_VERSION_BUMP_SQL)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_sec'] = round(stats['rows'] / stats['seconds']) if stats['seconds'] else stats['rows']
+    return stats
@@ -0,0 +1,216 @@
+# config/catalog_search.py
+import bisect
+import hashlib
+import re
+import threading
+import unicodedata
+
+# 各字段的权重：名称命中最重要，其次是分类，再其次是描述和DOI
+FIELD_WEIGHTS = {
+    'name': 10.0,
+    'subcategory': 4.0,
+    'category': 3.0,
+    'features': 2.0,
+    'doi': 2.0,
+    'url': 1.0
+}
+
+# 匹配方式的系数：完整词 > 词前缀 > 子串
+EXACT_FACTOR = 3.0
+PREFIX_FACTOR = 2.0
+SUBSTRING_FACTOR = 1.0
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_CJK_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+
+
+def normalize(value):
+    """全角转半角、转小写，作为索引和查询的统一形式"""
+    if not value:
+        return ''
+    return unicodedata.normalize('NFKC', str(value)).lower()
+
+
+def tokenize(text):
+    """分词：英文/数字按单词切分，中文按单字和双字切分"""
+    tokens = _WORD_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def char_grams(text):
+    """子串检索使用的单字符和双字符片段"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def doc_key(row):
+    return (row['category'], row['subcategory'], row['name'])
+
+
+def doc_hash(row):
+    content = '\x1f'.join(str(row.get(field) or '') for field in FIELD_WEIGHTS)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class CatalogSearchIndex:
+    """软件目录的内存倒排索引
+
+    - 词索引：term -> {doc_id: 字段权重之和}，有序词表用于前缀查询
+    - 片段索引：单字/双字 -> {doc_id}，用于任意子串查询（中文描述、DOI）
+    sync() 按 (category, subcategory, name) 比较内容哈希，只重建变化的文档。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._next_id = 0
+        self._docs = {}         # doc_id -> {'row', 'fields', 'terms', 'grams'}
+        self._by_key = {}       # doc_key -> (doc_id, doc_hash)
+        self._postings = {}     # term -> {doc_id: weight}
+        self._grams = {}        # gram -> set(doc_id)
+        self._terms = []        # 有序词表
+        self._terms_dirty = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ---------- 维护 ----------
+    def _add(self, row):
+        doc_id = self._next_id
+        self._next_id += 1
+
+        fields = {field: normalize(row.get(field)) for field in FIELD_WEIGHTS}
+        terms = {}
+        grams = set()
+        for field, text in fields.items():
+            if not text:
+                continue
+            for token in tokenize(text):
+                terms[token] = terms.get(token, 0.0) + FIELD_WEIGHTS[field]
+            grams |= char_grams(text)
+
+        for term, weight in terms.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._terms_dirty = True
+            self._postings[term][doc_id] = weight
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(doc_id)
+
+        self._docs[doc_id] = {'row': row, 'fields': fields, 'terms': terms, 'grams': grams}
+        return doc_id
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id)
+        for term in doc['terms']:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                self._terms_dirty = True
+        for gram in doc['grams']:
+            members = self._grams[gram]
+            members.discard(doc_id)
+            if not members:
+                del self._grams[gram]
+
+    def sync(self, rows):
+        """与最新的目录数据同步，返回 (新增, 更新, 删除) 的文档数"""
+        with self._lock:
+            seen = set()
+            added = updated = 0
+            for row in rows:
+                key = doc_key(row)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                digest = doc_hash(row)
+                existing = self._by_key.get(key)
+                if existing and existing[1] == digest:
+                    continue
+                if existing:
+                    self._remove(existing[0])
+                    updated += 1
+                else:
+                    added += 1
+                self._by_key[key] = (self._add(row), digest)
+
+            removed = 0
+            for key in [k for k in self._by_key if k not in seen]:
+                self._remove(self._by_key.pop(key)[0])
+                removed += 1
+
+            if self._terms_dirty:
+                self._terms = sorted(self._postings)
+                self._terms_dirty = False
+            return added, updated, removed
+
+    # ---------- 查询 ----------
+    def _score_part(self, part):
+        """单个查询词对各文档的得分 {doc_id: score}"""
+        scores = {}
+
+        # 词索引：完整词和词前缀
+        start = bisect.bisect_left(self._terms, part)
+        for term in self._terms[start:]:
+            if not term.startswith(part):
+                break
+            factor = EXACT_FACTOR if term == part else PREFIX_FACTOR
+            for doc_id, weight in self._postings[term].items():
+                score = weight * factor
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+
+        # 片段索引：先用片段求交集得到候选，再确认子串确实出现
+        grams = [part] if len(part) <= 2 else [part[i:i + 2] for i in range(len(part) - 1)]
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self._grams.get(g, ()))):
+            members = self._grams.get(gram)
+            if not members:
+                return scores
+            candidates = set(members) if candidates is None else candidates & members
+            if not candidates:
+                return scores
+
+        for doc_id in candidates:
+            fields = self._docs[doc_id]['fields']
+            score = sum(FIELD_WEIGHTS[f] for f, text in fields.items() if part in text) * SUBSTRING_FACTOR
+            if score > scores.get(doc_id, 0.0):
+                scores[doc_id] = score
+        return scores
+
+    def search(self, query, limit=20):
+        """按空格切分查询词，所有词都需命中；返回 (总命中数, 排序后的结果列表)"""
+        parts = normalize(query).split()
+        if not parts:
+            return 0, []
+
+        with self._lock:
+            total_scores = None
+            for part in parts:
+                scores = self._score_part(part)
+                if total_scores is None:
+                    total_scores = scores
+                else:
+                    total_scores = {d: s + scores[d] for d, s in total_scores.items() if d in scores}
+                if not total_scores:
+                    return 0, []
+
+            # 名称与查询完全一致的排在最前
+            whole = ' '.join(parts)
+            for doc_id in total_scores:
+                if self._docs[doc_id]['fields']['name'] == whole:
+                    total_scores[doc_id] += FIELD_WEIGHTS['name'] * EXACT_FACTOR
+
+            ranked = sorted(total_scores.items(),
+                            key=lambda item: (-item[1], self._docs[item[0]]['fields']['name']))
+            results = []
+            for doc_id, score in ranked[:limit]:
+                result = dict(self._docs[doc_id]['row'])
+                result['score'] = round(score, 2)
+                results.append(result)
+            return len(total_scores), results
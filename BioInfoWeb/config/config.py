@@ -19,6 +19,8 @@ class Config:
     MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', '')
     MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'bioinfo_software')
     MYSQL_CHARSET = 'utf8mb4'
+    # 开启后导入新行时使用 LOAD DATA LOCAL INFILE（服务器也需要 local_infile=ON）
+    MYSQL_LOCAL_INFILE = os.getenv('MYSQL_LOCAL_INFILE', '0') == '1'
     
     # SQLAlchemy配置
     connection_url = URL.create(
@@ -37,4 +39,16 @@ class Config:
         'pool_size': 10,
         'pool_recycle': 3600,
         'pool_pre_ping': True
-    }
\ No newline at end of file
+    }
+
+    # 软件目录快照：两次数据版本检查之间的最小间隔（秒）
+    CATALOG_CHECK_INTERVAL = int(os.getenv('CATALOG_CHECK_INTERVAL', 10))
+
+    # CSV导入：每次读取的行数（决定导入时的内存占用）
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 50000))
+
+    # 任务状态存储：memory（默认，单进程）或 sqlite（多个worker共享，重启后可恢复）
+    TASK_STORE = os.getenv('TASK_STORE', 'memory')
+    TASK_DB_PATH = os.getenv('TASK_DB_PATH', str(BASE_DIR / 'data' / 'tasks.db'))
+    # sqlite存储批量写入的间隔（秒）
+    TASK_FLUSH_INTERVAL = float(os.getenv('TASK_FLUSH_INTERVAL', 1.0))
@@ -1,6 +1,6 @@
 import pymysql
-import pandas as pd
 from config import Config
+from catalog_import import incremental_import
 
 class DatabaseManager:
     def __init__(self):
@@ -18,7 +18,8 @@ class DatabaseManager:
                     password=self.config.MYSQL_PASSWORD,
                     database=self.config.MYSQL_DATABASE,
                     charset=self.config.MYSQL_CHARSET,
-                    cursorclass=pymysql.cursors.DictCursor
+                    cursorclass=pymysql.cursors.DictCursor,
+                    local_infile=self.config.MYSQL_LOCAL_INFILE
                 )
             return self.connection
         except pymysql.Error as e:
@@ -26,80 +27,29 @@ class DatabaseManager:
             return None
     
     def import_from_csv(self, csv_path=None):
-        """从CSV文件导入数据到数据库"""
+        """从CSV文件流式增量导入数据到数据库（只写入有变化的行）"""
         if csv_path is None:
             csv_path = self.config.CSV_FILE_PATH
         
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
         try:
-            # 读取CSV文件
-            df = pd.read_csv(
+            stats = incremental_import(
+                conn,
                 csv_path,
-                sep=',',  # 根据你的CSV分隔符调整
-                encoding='GB2312',  # 处理BOM头
-                dtype=str,  # 所有列都作为字符串读取
-                na_filter=False  # 不将空字符串转换为NaN
+                chunksize=self.config.IMPORT_CHUNK_SIZE,
+                bulk_load=self.config.MYSQL_LOCAL_INFILE
             )
-            
-            # 重命名列以匹配数据库字段
-            df = df.rename(columns={
-                '大类': 'category',
-                '子类': 'subcategory',
-                '软件/数据库名称': 'name',
-                '功能特点': 'features',
-                '链接': 'url',
-                '论文DOI': 'doi'
-            })
-            
-            # 处理空值
-            df = df.where(pd.notnull(df), None)
-            
-            conn = self.get_connection()
-            if not conn:
-                return False
-            
-            cursor = conn.cursor()
-            
-            # 清空现有数据（可选）
-            cursor.execute("TRUNCATE TABLE bioinfo_software")
-            
-            # 批量插入数据
-            batch_size = 100
-            for i in range(0, len(df), batch_size):
-                batch = df.iloc[i:i+batch_size]
-                
-                # 构建插入SQL
-                sql = """
-                INSERT INTO bioinfo_software 
-                (category, subcategory, name, features, url, doi)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """
-                
-                # 准备数据
-                values = []
-                for _, row in batch.iterrows():
-                    values.append((
-                        row['category'],
-                        row['subcategory'] if pd.notnull(row['subcategory']) else None,
-                        row['name'],
-                        row['features'] if pd.notnull(row['features']) else None,
-                        row['url'] if pd.notnull(row['url']) else None,
-                        row['doi'] if pd.notnull(row['doi']) else None
-                    ))
-                
-                # 执行批量插入
-                cursor.executemany(sql, values)
-                conn.commit()
-                print(f"已导入 {min(i+batch_size, len(df))}/{len(df)} 条记录")
-            
-            print(f"✅ 成功导入 {len(df)} 条记录到数据库")
+            print(f"✅ 导入完成: 新增 {stats['inserted']} 条, 更新 {stats['updated']} 条, "
+                  f"删除 {stats['deleted']} 条, 未变化 {stats['unchanged']} 条")
+            print(f"共 {stats['rows']} 行, 用时 {stats['seconds']} 秒, {stats['rows_per_sec']} 行/秒")
             return True
             
         except Exception as e:
             print(f"CSV导入失败: {e}")
             return False
-        finally:
-            if conn:
-                cursor.close()
     
     def get_all_software(self):
         """获取所有软件数据"""
@@ -1,53 +1,37 @@
 # database/import_csv.py
-import pandas as pd
 from sqlalchemy import create_engine, text
 from config import Config
+from catalog_import import incremental_import
 
 def import_csv_to_mysql():
-    """使用pandas和SQLAlchemy导入CSV到MySQL"""
+    """使用SQLAlchemy增量导入CSV到MySQL（保留表结构和索引，只写入变化的行）"""
     config = Config()
     
     try:
-        # 1. 读取CSV文件
-        print("正在读取CSV文件...")
-        df = pd.read_csv(
-            config.CSV_FILE_PATH,
-            sep=',', 
-            encoding='GB2312',
-            dtype=str
+        # 1. 创建数据库连接引擎
+        engine = create_engine(
+            config.SQLALCHEMY_DATABASE_URI,
+            connect_args={'local_infile': config.MYSQL_LOCAL_INFILE}
         )
         
-        # 2. 重命名列
-        column_mapping = {
-            '大类': 'category',
-            '子类': 'subcategory',
-            '软件/数据库名称': 'name',
-            '功能特点': 'features',
-            '链接': 'url',
-            '论文DOI': 'doi'
-        }
-        df = df.rename(columns=column_mapping)
-        
-        # 3. 处理空值
-        df = df.replace({pd.NA: None, '': None})
-        
-        # 4. 创建数据库连接引擎
-        engine = create_engine(config.SQLALCHEMY_DATABASE_URI)
-        
-        # 5. 导入数据到MySQL（使用if_exists参数控制）
-        print("正在导入数据到MySQL...")
-        df.to_sql(
-            name='bioinfo_software',
-            con=engine,
-            if_exists='replace',  # 或 'append' 添加数据
-            index=False,
-            chunksize=1000,
-            method='multi'  # 批量插入
-        )
-        
-        print(f"✅ 成功导入 {len(df)} 条记录")
-        
-        # 6. 验证数据
+        # 2. 分块读取CSV并与现有数据比较，在一个事务中写入差异
+        print("正在增量导入CSV到MySQL...")
+        conn = engine.raw_connection()
+        try:
+            stats = incremental_import(
+                conn,
+                config.CSV_FILE_PATH,
+                chunksize=config.IMPORT_CHUNK_SIZE,
+                bulk_load=config.MYSQL_LOCAL_INFILE
+            )
+        finally:
+            conn.close()
+        
+        print(f"✅ 导入完成: 新增 {stats['inserted']} 条, 更新 {stats['updated']} 条, "
+              f"删除 {stats['deleted']} 条, 未变化 {stats['unchanged']} 条")
+        print(f"共 {stats['rows']} 行, 用时 {stats['seconds']} 秒, {stats['rows_per_sec']} 行/秒")
+        
+        # 3. 验证数据
         with engine.connect() as conn:
             result = conn.execute(text("SELECT COUNT(*) FROM bioinfo_software"))
             count = result.scalar()
@@ -65,4 +49,4 @@ def import_csv_to_mysql():
         return False
 
 if __name__ == '__main__':
-    import_csv_to_mysql()
\ No newline at end of file
+    import_csv_to_mysql()
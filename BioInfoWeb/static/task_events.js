@@ -0,0 +1,104 @@
+// 任务状态订阅：优先使用服务器推送（SSE /events），不可用时回退到轮询 /status
+// 用法：
+//   const taskEvents = new TaskEvents((taskId, taskInfo) => updateTaskUI(taskId, taskInfo), 5000);
+//   taskEvents.watch(taskId);
+// 任务完成或出错后自动停止订阅。
+class TaskEvents {
+    constructor(onUpdate, pollInterval = 5000) {
+        this.onUpdate = onUpdate;
+        this.pollInterval = pollInterval;
+        this.states = new Map();     // 任务ID -> 合并后的完整状态
+        this.source = null;
+        this.failures = 0;
+        this.polling = !window.EventSource;
+        this.pollActive = false;
+        this.reconnectTimer = null;
+    }
+
+    watch(taskId) {
+        if (this.states.has(taskId)) return;
+        this.states.set(taskId, {});
+        this.reconnect();
+    }
+
+    unwatch(taskId) {
+        if (!this.states.delete(taskId)) return;
+        this.reconnect();
+    }
+
+    // 订阅的任务变化后重新建立连接（合并短时间内的多次变化）
+    reconnect() {
+        clearTimeout(this.reconnectTimer);
+        this.reconnectTimer = setTimeout(() => this.connect(), 50);
+    }
+
+    connect() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+        if (this.polling) {
+            this.startPolling();
+            return;
+        }
+        if (this.states.size === 0) return;
+
+        const ids = Array.from(this.states.keys()).map(encodeURIComponent).join(',');
+        const source = new EventSource(`/events?ids=${ids}`);
+        source.addEventListener('open', () => {
+            this.failures = 0;
+        });
+        source.addEventListener('task', (event) => this.apply(JSON.parse(event.data)));
+        source.addEventListener('error', () => {
+            // EventSource会自动重连；连续失败时改为轮询
+            this.failures += 1;
+            if (this.failures >= 3) {
+                console.warn('任务状态推送不可用，改为轮询');
+                source.close();
+                this.source = null;
+                this.polling = true;
+                this.startPolling();
+            }
+        });
+        this.source = source;
+    }
+
+    // 合并事件（只包含变化的字段）后通知页面
+    apply(event) {
+        const taskId = event.id;
+        if (!this.states.has(taskId)) return;
+        const taskInfo = Object.assign(this.states.get(taskId), event);
+        this.onUpdate(taskId, taskInfo);
+        if (taskInfo.status === 'completed' || taskInfo.status === 'error') {
+            this.unwatch(taskId);
+        }
+    }
+
+    // ---------- 轮询回退 ----------
+    startPolling() {
+        if (this.pollActive) return;
+        this.pollActive = true;
+        const poll = () => {
+            if (this.states.size === 0) {
+                this.pollActive = false;
+                return;
+            }
+            this.refresh().finally(() => setTimeout(poll, this.pollInterval));
+        };
+        poll();
+    }
+
+    // 立即查询所有订阅的任务（也用于页面上的手动刷新）
+    async refresh() {
+        await Promise.all(Array.from(this.states.keys()).map(async (taskId) => {
+            try {
+                const response = await fetch(`/status/${taskId}`);
+                if (response.ok) {
+                    this.apply(Object.assign(await response.json(), {id: taskId}));
+                }
+            } catch (error) {
+                console.error(`查询任务 ${taskId} 状态失败:`, error);
+            }
+        }));
+    }
+}
@@ -0,0 +1,94 @@
+"""AlphaFold3 容器的替身，用于在没有GPU和数据库的机器上测试调度、进度和MSA缓存
+
+用法（启动服务前设置）：
+    ALPHAFOLD_COMMAND='python test/alphafold_stub.py --input_dir={input_dir} --output_dir={output_dir} {extra_args}'
+
+行为与 run_alphafold.py 一致的部分：
+  - 处理 --input_dir 中的每个JSON，输出到 <output_dir>/<作业名>/；
+  - 数据管道为缺少MSA/模板的链填入（假的）结果，写出 <作业名>_data.json；
+  - 打印与真实日志相同的阶段标记，最后写出 ranking_scores.csv 和模型文件。
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+STEP_DELAY = float(os.getenv('ALPHAFOLD_STUB_DELAY', 0.1))
+
+
+def log(message):
+    print(f'I{time.strftime("%m%d %H:%M:%S")} {message}', flush=True)
+
+
+def job_name(fold_input, filename):
+    name = fold_input.get('name') or os.path.splitext(filename)[0]
+    return re.sub(r'[^a-z0-9_\-.]', '', name.lower().replace(' ', '_'))
+
+
+def run_data_pipeline(fold_input):
+    """为缺少MSA/模板的链填入结果，返回实际搜索的链数"""
+    searched = 0
+    for entry in fold_input.get('sequences', []):
+        for kind, chain in entry.items():
+            if kind == 'protein' and chain.get('unpairedMsa') is None:
+                sequence = chain['sequence']
+                chain['unpairedMsa'] = f'>query\n{sequence}\n'
+                chain['pairedMsa'] = f'>query\n{sequence}\n'
+                chain['templates'] = []
+                searched += 1
+            elif kind == 'rna' and chain.get('unpairedMsa') is None:
+                chain['unpairedMsa'] = f'>query\n{chain["sequence"]}\n'
+                searched += 1
+    return searched
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_dir', required=True)
+    parser.add_argument('--output_dir', required=True)
+    parser.add_argument('--norun_data_pipeline', action='store_true')
+    parser.add_argument('--seeds', type=int, default=2)
+    args = parser.parse_args()
+
+    for filename in sorted(os.listdir(args.input_dir)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(args.input_dir, filename)) as f:
+            fold_input = json.load(f)
+        name = job_name(fold_input, filename)
+        log(f'Processing fold input {name}')
+
+        if args.norun_data_pipeline:
+            log('Skipping data pipeline...')
+        else:
+            log('Running data pipeline...')
+            searched = run_data_pipeline(fold_input)
+            time.sleep(STEP_DELAY)
+            log(f'Running data pipeline took {STEP_DELAY:.2f} seconds (searched {searched} chains)')
+
+        job_dir = os.path.join(args.output_dir, name)
+        os.makedirs(job_dir, exist_ok=True)
+        with open(os.path.join(job_dir, f'{name}_data.json'), 'w') as f:
+            json.dump(fold_input, f)
+
+        log(f'Featurising data with {args.seeds} seed(s)...')
+        for seed in range(1, args.seeds + 1):
+            log(f'Running model inference with seed {seed}...')
+            time.sleep(STEP_DELAY)
+            log(f'Running model inference with seed {seed} took {STEP_DELAY:.2f} seconds.')
+
+        log(f'Writing outputs for {name}...')
+        with open(os.path.join(job_dir, f'{name}_model.cif'), 'w') as f:
+            f.write(f'data_{name}\n')
+        with open(os.path.join(job_dir, 'ranking_scores.csv'), 'w') as f:
+            f.write('seed,sample,ranking_score\n')
+            for seed in range(1, args.seeds + 1):
+                f.write(f'{seed},0,0.5\n')
+        log(f'Done processing fold input {name}.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 与运行 app.py 时一致：从 BioInfoWeb 目录导入 api.*，config 目录中的模块互相直接导入
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (BASE_DIR, os.path.join(BASE_DIR, 'config')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,133 @@
+import copy
+
+import pytest
+
+from catalog_cache import CATALOG_VERSION_BUMP_SQL
+from catalog_import import EXISTING_ROWS_SQL, UPSERT_SQL, incremental_import
+
+CSV_HEADER = '大类,子类,软件/数据库名称,功能特点,链接,论文DOI'
+
+
+class FakeCursor:
+    """按 incremental_import 使用的几条语句模拟 bioinfo_software 表"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pending = []
+
+    def execute(self, sql, params=None):
+        if sql == EXISTING_ROWS_SQL:
+            self.pending = [(row_id,) + row for row_id, row in sorted(self.conn.rows.items())]
+        elif sql.startswith('DELETE FROM bioinfo_software'):
+            for row_id in params:
+                del self.conn.rows[row_id]
+        elif sql == CATALOG_VERSION_BUMP_SQL:
+            self.conn.version += 1
+        elif not sql.lstrip().startswith('CREATE TABLE'):
+            raise AssertionError(f'未预期的语句: {sql}')
+
+    def fetchmany(self, size):
+        rows, self.pending = self.pending[:size], self.pending[size:]
+        return rows
+
+    def executemany(self, sql, rows):
+        assert sql == UPSERT_SQL
+        for row in rows:
+            row_id = row[0]
+            if row_id is None:
+                self.conn.next_id += 1
+                row_id = self.conn.next_id
+            assert isinstance(row_id, int)
+            self.conn.rows[row_id] = tuple(row[1:])
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows=()):
+        self.rows = {}
+        self.next_id = 0
+        self.version = 0
+        for row in rows:
+            self.next_id += 1
+            self.rows[self.next_id] = tuple(row)
+        self._snapshot = copy.deepcopy(self.rows)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self._snapshot = copy.deepcopy(self.rows)
+
+    def rollback(self):
+        self.rows = copy.deepcopy(self._snapshot)
+
+    def contents(self):
+        return sorted(self.rows.values())
+
+
+def write_csv(tmp_path, rows, name='catalog.csv'):
+    path = tmp_path / name
+    lines = [CSV_HEADER] + [','.join(value or '' for value in row) for row in rows]
+    path.write_bytes(('\n'.join(lines) + '\n').encode('GB2312'))
+    return str(path)
+
+
+BLAST = ('序列比对', '局部比对', 'BLAST', '相似序列搜索', 'https://blast.ncbi.nlm.nih.gov', None)
+MAFFT = ('序列比对', '多序列比对', 'MAFFT', '快速多序列比对', None, '10.1093/molbev/mst010')
+RNAFOLD = ('结构预测', 'RNA', 'RNAfold', '最小自由能结构', None, None)
+
+
+def test_import_into_empty_table(tmp_path):
+    conn = FakeConnection()
+    stats = incremental_import(conn, write_csv(tmp_path, [BLAST, MAFFT]))
+    assert (stats['inserted'], stats['updated'], stats['deleted'], stats['unchanged']) == (2, 0, 0, 0)
+    assert conn.contents() == sorted([BLAST, MAFFT])
+    assert conn.version == 1
+
+
+def test_reimport_is_idempotent(tmp_path):
+    conn = FakeConnection([BLAST, MAFFT])
+    ids = dict(conn.rows)
+    stats = incremental_import(conn, write_csv(tmp_path, [BLAST, MAFFT]))
+    assert (stats['inserted'], stats['updated'], stats['deleted'], stats['unchanged']) == (0, 0, 0, 2)
+    assert conn.rows == ids
+    # 没有变化时不更新版本号，缓存不会失效
+    assert conn.version == 0
+
+
+@pytest.mark.parametrize('chunksize', [1, 2, 1000])
+def test_insert_update_delete(tmp_path, chunksize):
+    conn = FakeConnection([BLAST, MAFFT])
+    blast_id = next(row_id for row_id, row in conn.rows.items() if row[2] == 'BLAST')
+    changed_blast = BLAST[:3] + ('本地和在线相似序列搜索',) + BLAST[4:]
+
+    stats = incremental_import(conn, write_csv(tmp_path, [changed_blast, RNAFOLD]), chunksize=chunksize)
+    assert (stats['inserted'], stats['updated'], stats['deleted'], stats['unchanged']) == (1, 1, 1, 0)
+    assert conn.contents() == sorted([changed_blast, RNAFOLD])
+    # 更新按原主键进行
+    assert conn.rows[blast_id] == changed_blast
+    assert conn.version == 1
+
+
+@pytest.mark.parametrize('chunksize', [1, 1000])
+def test_duplicate_keys(tmp_path, chunksize):
+    # 数据库中重复的行删除多余的一条；CSV中重复的行只取第一次出现的
+    conn = FakeConnection([MAFFT, MAFFT])
+    stats = incremental_import(conn, write_csv(tmp_path, [MAFFT, MAFFT, RNAFOLD, RNAFOLD]), chunksize=chunksize)
+    assert (stats['inserted'], stats['updated'], stats['deleted'], stats['unchanged']) == (1, 0, 1, 1)
+    assert conn.contents() == sorted([MAFFT, RNAFOLD])
+
+
+def test_failure_rolls_back(tmp_path, monkeypatch):
+    conn = FakeConnection([BLAST])
+
+    def broken(self, sql, rows):
+        raise RuntimeError('连接断开')
+
+    monkeypatch.setattr(FakeCursor, 'executemany', broken)
+    with pytest.raises(RuntimeError):
+        incremental_import(conn, write_csv(tmp_path, [MAFFT]))
+    assert conn.contents() == [BLAST]
+    assert conn.version == 0
@@ -0,0 +1,93 @@
+import io
+import os
+
+import pytest
+
+from api.chunked_upload import (
+    UploadError, PART_SUFFIX, create_upload, load_upload, list_uploads, append_chunk, completed_files
+)
+
+
+class BrokenStream:
+    """读出一部分数据后连接中断"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        chunk = self.data.read(size)
+        if not chunk:
+            raise ConnectionError('连接中断')
+        return chunk
+
+
+def test_create_and_resume(tmp_path):
+    task_dir = str(tmp_path)
+    meta = create_upload(task_dir, 'a.fa', 10)
+    assert meta['offset'] == 0
+    assert os.path.exists(os.path.join(task_dir, 'a.fa' + PART_SUFFIX))
+
+    assert append_chunk(task_dir, meta['upload_id'], 0, io.BytesIO(b'01234')) == 5
+    assert load_upload(task_dir, meta['upload_id'])['offset'] == 5
+
+    # 偏移必须等于已接收的字节数
+    with pytest.raises(UploadError) as error:
+        append_chunk(task_dir, meta['upload_id'], 3, io.BytesIO(b'xx'))
+    assert error.value.status == 409
+
+    assert append_chunk(task_dir, meta['upload_id'], 5, io.BytesIO(b'56789')) == 10
+    with open(os.path.join(task_dir, 'a.fa'), 'rb') as f:
+        assert f.read() == b'0123456789'
+    assert not os.path.exists(os.path.join(task_dir, 'a.fa' + PART_SUFFIX))
+    assert load_upload(task_dir, meta['upload_id'])['offset'] == 10
+
+    # 完成后不能再追加
+    with pytest.raises(UploadError) as error:
+        append_chunk(task_dir, meta['upload_id'], 10, io.BytesIO(b'x'))
+    assert error.value.status == 409
+
+
+def test_interrupted_chunk_keeps_received_data(tmp_path):
+    task_dir = str(tmp_path)
+    meta = create_upload(task_dir, 'a.fa', 8)
+    with pytest.raises(ConnectionError):
+        append_chunk(task_dir, meta['upload_id'], 0, BrokenStream(b'abc'))
+    offset = load_upload(task_dir, meta['upload_id'])['offset']
+    assert offset == 3
+    assert append_chunk(task_dir, meta['upload_id'], offset, io.BytesIO(b'defgh')) == 8
+
+
+def test_oversized_chunk_is_discarded(tmp_path):
+    task_dir = str(tmp_path)
+    meta = create_upload(task_dir, 'a.fa', 4)
+    append_chunk(task_dir, meta['upload_id'], 0, io.BytesIO(b'ab'))
+    with pytest.raises(UploadError) as error:
+        append_chunk(task_dir, meta['upload_id'], 2, io.BytesIO(b'cdef'))
+    assert error.value.status == 413
+    # 本次请求写入的数据被丢弃，之前接收的保留
+    assert load_upload(task_dir, meta['upload_id'])['offset'] == 2
+
+
+def test_duplicate_and_unknown_uploads(tmp_path):
+    task_dir = str(tmp_path)
+    create_upload(task_dir, 'a.fa', 4)
+    with pytest.raises(UploadError) as error:
+        create_upload(task_dir, 'a.fa', 4)
+    assert error.value.status == 409
+    for upload_id in ('0' * 32, '../etc'):
+        with pytest.raises(UploadError) as error:
+            load_upload(task_dir, upload_id)
+        assert error.value.status == 404
+
+
+def test_completed_files(tmp_path):
+    task_dir = str(tmp_path)
+    first = create_upload(task_dir, 'a.fa', 3)
+    create_upload(task_dir, 'b.fa', 3)
+    create_upload(task_dir, 'empty.fa', 0)
+    append_chunk(task_dir, first['upload_id'], 0, io.BytesIO(b'abc'))
+
+    files, pending = completed_files(task_dir)
+    assert [os.path.basename(f) for f in files] == ['a.fa', 'empty.fa']
+    assert pending == ['b.fa']
+    assert [meta['filename'] for meta in list_uploads(task_dir)] == ['a.fa', 'b.fa', 'empty.fa']
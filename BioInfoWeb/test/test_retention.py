@@ -0,0 +1,212 @@
+import os
+import uuid
+
+import pytest
+
+from api import retention
+from api.retention import RetentionJanitor
+from api.task_store import MemoryTaskStore
+
+NOW = 1_000_000.0
+HOUR = 3600
+
+
+@pytest.fixture(autouse=True)
+def no_pause(monkeypatch):
+    monkeypatch.setattr(retention, 'RETENTION_PAUSE', 0)
+
+
+@pytest.fixture
+def page_configs(tmp_path):
+    configs = {}
+    for page_type in ('rnafold', 'alphafold'):
+        configs[page_type] = {
+            'upload_dir': str(tmp_path / 'uploads' / page_type),
+            'processed_dir': str(tmp_path / 'processed' / page_type),
+            'retention_hours': 24
+        }
+        os.makedirs(configs[page_type]['upload_dir'])
+        os.makedirs(configs[page_type]['processed_dir'])
+    return configs
+
+
+@pytest.fixture
+def tasks():
+    return MemoryTaskStore()
+
+
+def make_janitor(tasks, page_configs, keep_file=None, usage=None):
+    janitor = RetentionJanitor(tasks, page_configs, keep_file=keep_file)
+    # 默认磁盘空间充足，只按过期时间清理
+    janitor.disk_usage = usage or (lambda: {})
+    return janitor
+
+
+def make_task(tasks, page_configs, page_type='rnafold', status='completed', record=True, **info):
+    """在上传目录和结果目录创建任务文件，返回任务ID"""
+    task_id = str(uuid.uuid4())
+    config = page_configs[page_type]
+    os.makedirs(os.path.join(config['upload_dir'], task_id))
+    os.makedirs(os.path.join(config['processed_dir'], task_id))
+    with open(os.path.join(config['processed_dir'], task_id + '.zip'), 'wb') as f:
+        f.write(b'zip')
+    if record:
+        tasks.create(task_id, dict(info, page_type=page_type, status=status))
+    return task_id
+
+
+def exists(page_configs, task_id, page_type='rnafold'):
+    return any(os.path.exists(path) for path in retention.task_paths(page_configs[page_type], task_id))
+
+
+def test_expired_tasks_are_evicted(tasks, page_configs):
+    janitor = make_janitor(tasks, page_configs)
+    old = make_task(tasks, page_configs)
+    recent = make_task(tasks, page_configs)
+    running = make_task(tasks, page_configs, status='processing')
+    janitor.track(old, 'rnafold', NOW - 25 * HOUR)
+    janitor.track(recent, 'rnafold', NOW - 1 * HOUR)
+    janitor.track(running, 'rnafold', NOW - 25 * HOUR)
+
+    assert janitor.sweep(NOW) == 1
+    assert not exists(page_configs, old) and old not in tasks
+    assert exists(page_configs, recent) and recent in tasks
+    # 仍在处理中的任务不删除
+    assert exists(page_configs, running) and running in tasks
+
+
+def test_reused_task_outlives_its_referrers(tasks, page_configs):
+    janitor = make_janitor(tasks, page_configs)
+    original = make_task(tasks, page_configs)
+    reuse = make_task(tasks, page_configs, reused_from=original)
+    janitor.track(original, 'rnafold', NOW - 30 * HOUR)
+    janitor.track(reuse, 'rnafold', NOW - 10 * HOUR, reused_from=original)
+
+    # 被复用的任务已过期，但复用它的任务还在
+    assert janitor.sweep(NOW) == 0
+    assert exists(page_configs, original) and original in tasks
+
+    # 复用者过期后，两者在同一轮中依次删除
+    assert janitor.sweep(NOW + 20 * HOUR) == 2
+    assert original not in tasks and reuse not in tasks
+    assert not exists(page_configs, original)
+
+
+def test_reused_task_waits_for_all_referrers(tasks, page_configs):
+    janitor = make_janitor(tasks, page_configs)
+    original = make_task(tasks, page_configs)
+    first = make_task(tasks, page_configs, reused_from=original)
+    second = make_task(tasks, page_configs, reused_from=original)
+    janitor.track(original, 'rnafold', NOW - 30 * HOUR)
+    janitor.track(first, 'rnafold', NOW - 28 * HOUR, reused_from=original)
+    janitor.track(second, 'rnafold', NOW - 5 * HOUR, reused_from=original)
+
+    assert janitor.sweep(NOW) == 1
+    assert first not in tasks and original in tasks
+    assert janitor.sweep(NOW + 20 * HOUR) == 2
+    assert original not in tasks and second not in tasks
+
+
+def test_watermark_evicts_referrers_first(tasks, page_configs):
+    page_configs['rnafold']['retention_hours'] = 0
+    usage = {'used': 0.95}
+    janitor = make_janitor(tasks, page_configs, usage=lambda: {1: usage['used']})
+    janitor.page_devices = lambda: {'rnafold': {1}, 'alphafold': {2}}
+
+    original = make_task(tasks, page_configs)
+    reuse = make_task(tasks, page_configs, reused_from=original)
+    newest = make_task(tasks, page_configs)
+    janitor.track(original, 'rnafold', NOW - 3 * HOUR)
+    janitor.track(reuse, 'rnafold', NOW - 2 * HOUR, reused_from=original)
+    janitor.track(newest, 'rnafold', NOW - 1 * HOUR)
+
+    evict = janitor.evict
+
+    def evict_and_free(*args):
+        deleted = evict(*args)
+        if deleted:
+            usage['used'] -= 0.1
+        return deleted
+
+    janitor.evict = evict_and_free
+    # 0.95 -> 0.85 -> 0.75：复用者先删除，之后是被复用的任务，最新的任务保留
+    assert janitor.sweep(NOW) == 2
+    assert reuse not in tasks and original not in tasks
+    assert newest in tasks
+
+
+def test_watermark_only_evicts_pages_on_full_device(tasks, page_configs):
+    for config in page_configs.values():
+        config['retention_hours'] = 0
+    usage = {1: 0.95, 2: 0.95}
+    janitor = make_janitor(tasks, page_configs, usage=lambda: dict(usage))
+    janitor.page_devices = lambda: {'rnafold': {1}, 'alphafold': {1, 2}}
+
+    rna = [make_task(tasks, page_configs) for _ in range(3)]
+    fold = [make_task(tasks, page_configs, 'alphafold') for _ in range(3)]
+    for hours, (rna_id, fold_id) in enumerate(zip(rna, fold)):
+        janitor.track(rna_id, 'rnafold', NOW - 10 * HOUR + hours * HOUR)
+        janitor.track(fold_id, 'alphafold', NOW - 10 * HOUR + hours * HOUR + 1)
+
+    evict = janitor.evict
+
+    def evict_and_free(task_id, page_type, finished_at=None):
+        deleted = evict(task_id, page_type, finished_at)
+        if deleted and page_type == 'alphafold':
+            usage[1] -= 0.1
+            usage[2] -= 0.1
+        elif deleted:
+            usage[1] -= 0.1
+        return deleted
+
+    janitor.evict = evict_and_free
+    assert janitor.sweep(NOW) == 3
+    # rna[0]、fold[0] 之后设备1已低于低水位，设备2上只有 alphafold，
+    # 所以接下来删除 fold[1]，比它更早结束的 rna[1] 保留
+    assert rna[0] not in tasks and fold[0] not in tasks and fold[1] not in tasks
+    assert rna[1] in tasks and rna[2] in tasks and fold[2] in tasks
+    assert usage[2] <= retention.RETENTION_DISK_LOW_WATERMARK
+
+
+def test_keep_list_is_never_evicted(tmp_path, tasks, page_configs):
+    sample = make_task(tasks, page_configs, record=False)
+    keep_file = tmp_path / 'keep.txt'
+    keep_file.write_text(f'# 示例结果\n{sample}  # rnafold 示例\n', encoding='utf-8')
+    janitor = make_janitor(tasks, page_configs, keep_file=str(keep_file))
+    os.utime(os.path.join(page_configs['rnafold']['upload_dir'], sample), (1000, 1000))
+
+    janitor.adopt_existing()
+    janitor.track(sample, 'rnafold', 1000)
+    assert janitor.tracked() == 0
+    assert not janitor.evict(sample, 'rnafold')
+    assert janitor.sweep(NOW) == 0
+    assert exists(page_configs, sample)
+
+
+def test_missing_keep_file(tmp_path, tasks, page_configs):
+    janitor = make_janitor(tasks, page_configs, keep_file=str(tmp_path / 'missing.txt'))
+    assert janitor.keep == set()
+
+
+def test_adopt_existing(tasks, page_configs):
+    janitor = make_janitor(tasks, page_configs)
+    finished = make_task(tasks, page_configs, end_time='1970-01-02T00:00:00')
+    running = make_task(tasks, page_configs, status='processing')
+    # 没有任务记录的目录（例如内存存储重启后）按修改时间登记
+    orphan_old = make_task(tasks, page_configs, record=False)
+    orphan_new = make_task(tasks, page_configs, record=False)
+    for task_id in (running, orphan_old):
+        for directory in ('upload_dir', 'processed_dir'):
+            os.utime(os.path.join(page_configs['rnafold'][directory], task_id), (1000, 1000))
+        os.utime(os.path.join(page_configs['rnafold']['processed_dir'], task_id + '.zip'), (1000, 1000))
+    os.makedirs(os.path.join(page_configs['rnafold']['upload_dir'], 'not-a-task'))
+
+    janitor.adopt_existing()
+    assert janitor.tracked() == 3
+
+    assert janitor.sweep(NOW) == 2
+    assert finished not in tasks and not exists(page_configs, finished)
+    assert not exists(page_configs, orphan_old)
+    assert exists(page_configs, orphan_new)
+    assert exists(page_configs, running)
+    assert os.path.isdir(os.path.join(page_configs['rnafold']['upload_dir'], 'not-a-task'))
@@ -0,0 +1,141 @@
+import os
+import socket
+
+import pytest
+
+from api import task_store
+from api.task_store import MemoryTaskStore, SQLiteTaskStore, create_task_store
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控的时钟：每个任务的创建时间不同，时间范围筛选结果确定"""
+    now = [1000.0]
+    monkeypatch.setattr(task_store.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path, clock):
+    if request.param == 'memory':
+        return MemoryTaskStore()
+    # 写入线程的间隔设长，写入只发生在查询前的 flush()
+    return SQLiteTaskStore(str(tmp_path / 'tasks.db'), flush_interval=3600)
+
+
+def add_tasks(store, clock, specs):
+    """specs: [(task_id, page_type, status)]，依次间隔1秒创建"""
+    for task_id, page_type, status in specs:
+        clock[0] += 1
+        store.create(task_id, {'page_type': page_type, 'status': status, 'progress': 0})
+
+
+def ids(items):
+    return [task_id for task_id, _ in items]
+
+
+def test_list_pagination_newest_first(store, clock):
+    add_tasks(store, clock, [(f't{i}', 'fold', 'completed') for i in range(5)])
+    page, cursor = store.list_tasks(limit=2)
+    assert ids(page) == ['t4', 't3']
+    page, cursor = store.list_tasks(cursor=cursor, limit=2)
+    assert ids(page) == ['t2', 't1']
+    page, cursor = store.list_tasks(cursor=cursor, limit=2)
+    assert ids(page) == ['t0']
+    assert cursor is None
+
+
+def test_list_filters(store, clock):
+    add_tasks(store, clock, [
+        ('a', 'fold', 'completed'),
+        ('b', 'msa', 'failed'),
+        ('c', 'fold', 'processing'),
+        ('d', 'fold', 'failed'),
+    ])
+    assert ids(store.list_tasks(page_type='fold')[0]) == ['d', 'c', 'a']
+    assert ids(store.list_tasks(statuses=['failed', 'completed'])[0]) == ['d', 'b', 'a']
+    assert ids(store.list_tasks(page_type='fold', statuses=['failed'])[0]) == ['d']
+    # 创建时间依次为 1001..1004
+    assert ids(store.list_tasks(created_after=1002, created_before=1004)[0]) == ['c', 'b']
+
+
+def test_status_change_moves_task_between_lists(store, clock):
+    add_tasks(store, clock, [('a', 'fold', 'processing'), ('b', 'fold', 'processing')])
+    store['a']['status'] = 'completed'
+    assert ids(store.list_tasks(statuses=['processing'])[0]) == ['b']
+    assert ids(store.list_tasks(statuses=['completed'])[0]) == ['a']
+    # 多个状态合并分页时不丢失也不重复
+    page, cursor = store.list_tasks(statuses=['processing', 'completed'], limit=1)
+    assert ids(page) == ['b']
+    page, cursor = store.list_tasks(statuses=['processing', 'completed'], cursor=cursor, limit=1)
+    assert ids(page) == ['a']
+    assert cursor is None
+
+
+def test_changes_since(store, clock):
+    add_tasks(store, clock, [('a', 'fold', 'pending'), ('b', 'fold', 'pending')])
+    items, revision, has_more = store.changes_since(0)
+    assert ids(items) == ['a', 'b']
+    assert not has_more
+
+    store['a']['progress'] = 50
+    items, revision, has_more = store.changes_since(revision)
+    assert ids(items) == ['a']
+    assert items[0][1]['progress'] == 50
+    assert store.changes_since(revision)[0] == []
+
+    add_tasks(store, clock, [('c', 'fold', 'pending'), ('d', 'fold', 'pending')])
+    items, next_revision, has_more = store.changes_since(revision, limit=1)
+    assert ids(items) == ['c'] and has_more
+    items, _, has_more = store.changes_since(next_revision, limit=1)
+    assert ids(items) == ['d'] and not has_more
+
+
+def test_delete(store, clock):
+    add_tasks(store, clock, [('a', 'fold', 'completed'), ('b', 'fold', 'completed')])
+    assert store.delete('a')
+    assert not store.delete('a')
+    assert 'a' not in store
+    assert ids(store.list_tasks(page_type='fold', statuses=['completed'])[0]) == ['b']
+    assert set(store.get_many(['a', 'b'])) == {'b'}
+
+
+def test_observer_notified(store, clock):
+    seen = []
+    store.add_observer(lambda task_id, key: seen.append((task_id, key)))
+    add_tasks(store, clock, [('a', 'fold', 'pending')])
+    store['a']['message'] = '运行中'
+    assert ('a', 'message') in seen
+
+
+def test_sqlite_shared_between_stores(tmp_path, clock):
+    db_path = str(tmp_path / 'tasks.db')
+    first = SQLiteTaskStore(db_path, flush_interval=3600)
+    add_tasks(first, clock, [('a', 'fold', 'completed')])
+    first.flush()
+    second = SQLiteTaskStore(db_path, flush_interval=3600)
+    assert second.get('a')['status'] == 'completed'
+    assert ids(second.list_tasks()[0]) == ['a']
+
+
+def test_sqlite_recovers_tasks_of_exited_process(tmp_path, clock):
+    db_path = str(tmp_path / 'tasks.db')
+    crashed = SQLiteTaskStore(db_path, flush_interval=3600)
+    # 模拟一个已经退出的进程（同一主机上不存在的pid）
+    crashed.owner = f'{socket.gethostname()}:{2 ** 22 + 1}'
+    crashed.create('a', {'page_type': 'fold', 'status': 'processing'}, job={'files': ['x.fa']})
+    crashed.create('b', {'page_type': 'fold', 'status': 'completed'}, job={'files': ['y.fa']})
+    crashed.flush()
+
+    restarted = SQLiteTaskStore(db_path, flush_interval=3600)
+    assert restarted.recover_interrupted() == [('a', {'files': ['x.fa']})]
+    assert restarted['a']['status'] == 'pending'
+    # 已经接管的任务不会被再次接管
+    assert SQLiteTaskStore(db_path, flush_interval=3600).recover_interrupted() == []
+
+
+def test_create_task_store(tmp_path):
+    assert isinstance(create_task_store({}), MemoryTaskStore)
+    store = create_task_store({'TASK_STORE': 'sqlite', 'TASK_DB_PATH': str(tmp_path / 'db' / 'tasks.db')})
+    assert isinstance(store, SQLiteTaskStore)
+    assert os.path.exists(tmp_path / 'db' / 'tasks.db')